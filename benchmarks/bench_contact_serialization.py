@@ -0,0 +1,72 @@
+"""
+Compares how FastAPI serializes a list of contacts through response_model=List[ContactResponse]
+(ORM objects validated row by row with orm_mode, then jsonable_encoder and json.dumps)
+against the fast path of src.services.serialization (core rows encoded straight with orjson).
+Both sides include reading the rows from an in-memory SQLite database.
+
+Run from the project root: python -m benchmarks.bench_contact_serialization
+"""
+import asyncio
+import time
+from typing import List
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+
+from src.database.models import Base, Contact, User
+from src.repository.contacts import CONTACT_COLUMNS
+from src.schemas import ContactResponse
+from src.services.serialization import rows_response
+
+SIZES = (1000, 10000, 100000)
+
+
+def fill(session: Session, size: int):
+    session.add(User(id=1, email="deadpool@example.com", password="secret"))
+    session.execute(insert(Contact), [
+        {"user_id": 1, "first_name": "Dmytro", "last_name": "Oseledko", "email": f"contact{number}@example.com",
+         "phone_number": f"050-{number:09}", "birthday": "10-04-2019", "birthday_md": 410,
+         "nick": f"nick{number}", "is_active_contact": True, "description": "description"}
+        for number in range(size)
+    ])
+    session.commit()
+
+
+async def response_model_path(session: Session, field) -> bytes:
+    contacts = session.execute(select(Contact)).scalars().all()
+    content = await serialize_response(field=field, response_content=contacts, is_coroutine=True)
+    return JSONResponse(content).body
+
+
+def fast_path(session: Session) -> bytes:
+    rows = session.execute(select(*CONTACT_COLUMNS)).all()
+    return rows_response(rows).body
+
+
+async def main():
+    field = create_response_field(name="response", type_=List[ContactResponse])
+    for size in SIZES:
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(engine)
+        with Session(engine) as session:
+            fill(session, size)
+
+            start = time.perf_counter()
+            await response_model_path(session, field)
+            model_seconds = time.perf_counter() - start
+            session.expunge_all()
+
+            start = time.perf_counter()
+            fast_path(session)
+            fast_seconds = time.perf_counter() - start
+
+        engine.dispose()
+        print(f"{size:>7} rows: response_model {model_seconds * 1e3:9.1f} ms, "
+              f"orjson rows {fast_seconds * 1e3:8.1f} ms, speedup {model_seconds / fast_seconds:5.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
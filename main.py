@@ -1,6 +1,5 @@
-import time
+import asyncio
 from pathlib import Path
-from typing import Callable
 
 import redis.asyncio as redis
 from fastapi import FastAPI, Depends, HTTPException, Request         #   , RequestEmail
@@ -8,15 +7,20 @@ from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from fastapi_limiter import FastAPILimiter
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
 from starlette.middleware.cors import CORSMiddleware
 
 from src.conf.config import settings
 from src.database.db import get_db
-from src.routes import contacts, auth, users
+from src.routes import contacts, auth, users, metrics
+from src.services.access_log import AccessLog, UserAgentBanMiddleware, compile_user_agent_ban
+from src.services.cache import invalidation_bus
+from src.services.timing import ServerTimingMiddleware
 
 app = FastAPI()
+access_log = AccessLog(settings.access_log_sample_rate, settings.access_log_max_queue)
+banned_user_agents = compile_user_agent_ban(settings.banned_user_agents)
 
 
 @app.on_event("startup")
@@ -28,8 +32,22 @@ async def startup():
 
     :return: A coroutine, so we need to call it like this:
     """
+    access_log.start()
     r = await redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0)
     await FastAPILimiter.init(r)
+    if settings.cache_invalidation_pubsub:
+        app.state.invalidation_listener = asyncio.create_task(invalidation_bus.listen())
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """
+    The shutdown function is called when the application stops.
+    It flushes the access log records that are still queued.
+
+    :return: None
+    """
+    access_log.stop()
 
 
 app.add_middleware(
@@ -41,41 +59,8 @@ app.add_middleware(
 )
 
 
-@app.middleware("http")
-async def user_agent_ban_middleware(request: Request, call_next: Callable):
-    """
-    The user_agent_ban_middleware function is a middleware that checks the user-agent header of an incoming request.
-    If it matches one of the banned user agents, then it returns a 403 Forbidden response. Otherwise, it calls the next
-    middleware in line.
-
-    :param request: Request: Access the request object
-    :param call_next: Callable: Pass the request to the next middleware in line
-    :return: A response
-    """
-    user_agent = request.headers.get("user-agent")
-    print('----------------------------')
-    print(user_agent)
-    print('----------------------------')
-    response = await call_next(request)
-    return response
-
-
-@app.middleware("http")
-async def add_process_time_header(request: Request, call_next):
-    """
-    The add_process_time_header function is a middleware function that adds the time it took to process
-    the request as a header in the response. This can be used to measure performance of an application.
-
-    :param request: Request: Access the request object
-    :param call_next: Call the next function in the pipeline
-    :return: A response object
-    """
-    start_time = time.time()
-    print(request.client)
-    response = await call_next(request)
-    process_time = time.time() - start_time
-    response.headers["performance"] = str(process_time)
-    return response
+app.add_middleware(UserAgentBanMiddleware, pattern=banned_user_agents)
+app.add_middleware(ServerTimingMiddleware, access_log=access_log)
 
 templates = Jinja2Templates(directory='templates')
 BASE_DIR = Path(__file__).parent
@@ -96,17 +81,17 @@ async def root(request: Request):
 
 
 @app.get("/api/healthchecker")
-def healthchecker(db: Session = Depends(get_db)):
+async def healthchecker(db: AsyncSession = Depends(get_db)):
     """
     The healthchecker function is a simple function that checks the health of the database.
     It does this by making a request to the database and checking if it returns any results.
     If there are no results, then we know something is wrong with our connection.
 
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     """
     try:
         # Make request
-        result = db.execute(text("SELECT 1")).fetchone()
+        result = (await db.execute(text("SELECT 1"))).fetchone()
         if result is None:
             raise HTTPException(status_code=500, detail="Database is not configured correctly")
         return {"message": "Welcome to FastAPI!"}
@@ -118,3 +103,4 @@ def healthchecker(db: Session = Depends(get_db)):
 app.include_router(auth.router, prefix='/api')
 app.include_router(contacts.router, prefix="/api")
 app.include_router(users.router, prefix='/api')
+app.include_router(metrics.router, prefix='/api')
@@ -0,0 +1,57 @@
+"""baseline: users and contacts as created by Base.metadata.create_all before migrations
+
+A database that was created by create_all at that point is brought under migrations with
+alembic stamp 0001, then upgraded like any other.
+
+Revision ID: 0001
+Revises:
+Create Date: 2023-06-20 12:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("username", sa.String(length=50)),
+        sa.Column("email", sa.String(length=250), nullable=False),
+        sa.Column("password", sa.String(length=255), nullable=False),
+        sa.Column("avatar", sa.String(length=255), nullable=True),
+        sa.Column("refresh_token", sa.String(length=255), nullable=True),
+        sa.Column("confirmed", sa.Boolean()),
+        sa.UniqueConstraint("email", name="users_email_key"),
+    )
+    op.create_table(
+        "contacts",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("first_name", sa.String()),
+        sa.Column("last_name", sa.String()),
+        sa.Column("email", sa.String()),
+        sa.Column("phone_number", sa.String()),
+        sa.Column("birthday", sa.String()),
+        sa.Column("nick", sa.String()),
+        sa.Column("is_active_contact", sa.Boolean()),
+        sa.Column("description", sa.String()),
+        sa.Column("created_at", sa.DateTime()),
+        sa.Column("updated_at", sa.DateTime()),
+        sa.UniqueConstraint("phone_number", name="contacts_phone_number_key"),
+    )
+    op.create_index("ix_contacts_id", "contacts", ["id"])
+    op.create_index("ix_contacts_first_name", "contacts", ["first_name"])
+    op.create_index("ix_contacts_last_name", "contacts", ["last_name"])
+    op.create_index("ix_contacts_email", "contacts", ["email"], unique=True)
+    op.create_index("ix_contacts_nick", "contacts", ["nick"], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_table("contacts")
+    op.drop_table("users")
@@ -0,0 +1,85 @@
+"""contacts: birthday_md and user_id columns, backfilled without locking the table
+
+Both columns are added as nullable, which is a catalog-only change, then filled in batches that commit one by one,
+so no lock on contacts is held for longer than one batch.
+
+Before contacts had an owner every user saw all of them. They are given to the earliest registered user,
+the only choice that keeps every existing contact reachable by someone; move them with an UPDATE afterwards
+if they belong elsewhere. The migration refuses to run if there are contacts but no users at all.
+
+NOT NULL and the foreign key are added as NOT VALID constraints and validated afterwards: validation scans
+the table under a SHARE UPDATE EXCLUSIVE lock, which does not block reads or writes. Since PostgreSQL 12
+SET NOT NULL uses the validated check constraint instead of scanning the table again.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2023-06-20 12:10:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 5000
+
+# month * 100 + day of a 'dd-mm-YYYY' birthday, the same value as src.database.models.birthday_md.
+# Only birthdays that are real dates get one, like strptime there, 31-02-2000 or 29-02-2001 are left NULL.
+# CASE checks the format and the month before make_date sees them, make_date raises on an invalid month.
+DAY, MONTH, YEAR = "substr(birthday, 1, 2)::int", "substr(birthday, 4, 2)::int", "substr(birthday, 7, 4)::int"
+BIRTHDAY = (
+    f"CASE WHEN birthday IS NULL OR birthday !~ '^[0-9]{{2}}-[0-9]{{2}}-[0-9]{{4}}$' THEN false "
+    f"WHEN {MONTH} NOT BETWEEN 1 AND 12 OR {YEAR} < 1 THEN false "
+    f"ELSE {DAY} BETWEEN 1 AND extract(day FROM make_date({YEAR}, {MONTH}, 1) + interval '1 month - 1 day') END"
+)
+BIRTHDAY_MD = f"{MONTH} * 100 + {DAY}"
+
+
+def _backfill(assignment: str, pending: str) -> None:
+    # Runs in an autocommit block: every batch is its own transaction. The loop ends when no row is left,
+    # which also catches rows written by the previous version of the application while it runs.
+    if op.get_context().as_sql:
+        op.execute(f"UPDATE contacts SET {assignment} WHERE {pending}")
+        return
+    stmt = sa.text(
+        f"UPDATE contacts SET {assignment} WHERE id IN "
+        f"(SELECT id FROM contacts WHERE {pending} ORDER BY id LIMIT :batch_size)"
+    )
+    while op.get_bind().execute(stmt, {"batch_size": BATCH_SIZE}).rowcount:
+        pass
+
+
+def upgrade() -> None:
+    op.add_column("contacts", sa.Column("birthday_md", sa.Integer(), nullable=True))
+    op.add_column("contacts", sa.Column("user_id", sa.Integer(), nullable=True))
+
+    if not op.get_context().as_sql:
+        orphans = op.get_bind().execute(sa.text(
+            "SELECT EXISTS (SELECT 1 FROM contacts) AND NOT EXISTS (SELECT 1 FROM users)"
+        )).scalar()
+        if orphans:
+            raise RuntimeError("contacts exist but there are no users to give them to, create a user first")
+
+    with op.get_context().autocommit_block():
+        _backfill(f"birthday_md = {BIRTHDAY_MD}", f"birthday_md IS NULL AND {BIRTHDAY}")
+        _backfill("user_id = (SELECT min(id) FROM users)", "user_id IS NULL")
+
+        op.execute("ALTER TABLE contacts ADD CONSTRAINT contacts_user_id_not_null "
+                   "CHECK (user_id IS NOT NULL) NOT VALID")
+        op.execute("ALTER TABLE contacts VALIDATE CONSTRAINT contacts_user_id_not_null")
+        op.execute("ALTER TABLE contacts ALTER COLUMN user_id SET NOT NULL")
+        op.execute("ALTER TABLE contacts DROP CONSTRAINT contacts_user_id_not_null")
+
+        op.execute("ALTER TABLE contacts ADD CONSTRAINT contacts_user_id_fkey FOREIGN KEY (user_id) "
+                   "REFERENCES users (id) ON DELETE CASCADE NOT VALID")
+        op.execute("ALTER TABLE contacts VALIDATE CONSTRAINT contacts_user_id_fkey")
+
+
+def downgrade() -> None:
+    op.drop_constraint("contacts_user_id_fkey", "contacts", type_="foreignkey")
+    op.drop_column("contacts", "user_id")
+    op.drop_column("contacts", "birthday_md")
@@ -0,0 +1,98 @@
+"""contacts: replace the single-column indexes with the per-user indexes the queries use, concurrently
+
+Every query of src.repository.contacts filters by user_id, so the single-column indexes of the baseline do not
+support them any more, and ix_contacts_id duplicates the primary key. The new indexes are built with
+CREATE INDEX CONCURRENTLY and the old ones dropped with DROP INDEX CONCURRENTLY, neither of which blocks writes.
+They can't run inside a transaction, hence the autocommit block.
+
+A concurrent build that fails (a duplicate value for a unique index, a cancelled statement) leaves an INVALID
+index behind. It is dropped before the index is built again, so the migration can simply be re-run.
+Dropping the phone_number unique constraint needs a short ACCESS EXCLUSIVE lock, bounded by lock_timeout.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2023-06-20 12:20:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+LOCK_TIMEOUT = "5s"
+
+SEARCH_VECTOR = ("to_tsvector('simple', coalesce(first_name, '') || ' ' || coalesce(last_name, '') || ' ' || "
+                 "coalesce(email, '') || ' ' || coalesce(nick, ''))")
+
+INDEXES = {
+    "ix_contacts_user_id_id": "ON contacts (user_id, id)",
+    "ix_contacts_user_id_first_name": "ON contacts (user_id, first_name)",
+    "ix_contacts_user_id_last_name": "ON contacts (user_id, last_name)",
+    "ix_contacts_user_id_birthday_md": "ON contacts (user_id, birthday_md)",
+    "ix_contacts_search": f"ON contacts USING gin ({SEARCH_VECTOR})",
+}
+UNIQUE_INDEXES = {
+    "ix_contacts_user_id_email": "ON contacts (user_id, email)",
+    "ix_contacts_user_id_phone_number": "ON contacts (user_id, phone_number)",
+    "ix_contacts_user_id_nick": "ON contacts (user_id, nick)",
+}
+
+BASELINE_INDEXES = {
+    "ix_contacts_id": "ON contacts (id)",
+    "ix_contacts_first_name": "ON contacts (first_name)",
+    "ix_contacts_last_name": "ON contacts (last_name)",
+}
+BASELINE_UNIQUE_INDEXES = {
+    "ix_contacts_email": "ON contacts (email)",
+    "ix_contacts_nick": "ON contacts (nick)",
+    "contacts_phone_number_key": "ON contacts (phone_number)",
+}
+# Created by Base.metadata.create_all between the baseline and the migrations, not by a migration
+STRAY_INDEXES = ("ix_contacts_birthday_md",)
+
+
+def _drop_invalid(name: str) -> None:
+    if op.get_context().as_sql:
+        return
+    invalid = op.get_bind().execute(sa.text(
+        "SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"
+    ), {"name": name}).scalar()
+    if invalid:
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+
+def _create(indexes: dict, unique: bool = False) -> None:
+    for name, definition in indexes.items():
+        _drop_invalid(name)
+        op.execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX CONCURRENTLY IF NOT EXISTS {name} {definition}")
+
+
+def _drop(names) -> None:
+    for name in names:
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        # The new unique indexes are in place before the old ones go, so uniqueness is enforced throughout.
+        _create(INDEXES)
+        _create(UNIQUE_INDEXES, unique=True)
+        op.execute(f"SET lock_timeout = '{LOCK_TIMEOUT}'")
+        op.execute("ALTER TABLE contacts DROP CONSTRAINT IF EXISTS contacts_phone_number_key")
+        op.execute("RESET lock_timeout")
+        _drop((*BASELINE_INDEXES, "ix_contacts_email", "ix_contacts_nick", *STRAY_INDEXES))
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        _create(BASELINE_INDEXES)
+        _create(BASELINE_UNIQUE_INDEXES, unique=True)
+        op.execute(f"SET lock_timeout = '{LOCK_TIMEOUT}'")
+        op.execute("ALTER TABLE contacts ADD CONSTRAINT contacts_phone_number_key "
+                   "UNIQUE USING INDEX contacts_phone_number_key")
+        op.execute("RESET lock_timeout")
+        _drop((*INDEXES, *UNIQUE_INDEXES))
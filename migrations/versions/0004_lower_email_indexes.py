@@ -0,0 +1,86 @@
+"""users, contacts: case-insensitive unique emails on lower(email), existing emails lowercased
+
+The unique indexes on lower(email) are built concurrently first, so they already reject Foo@x.com next to
+foo@x.com while the stored emails are lowercased in committed batches. The exact-match unique index and
+constraint they replace are dropped last.
+
+Addresses that differ only in case can't be merged automatically, the migration lists how many there are
+and stops before changing anything.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2023-06-27 12:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 5000
+LOCK_TIMEOUT = "5s"
+
+DUPLICATES = {
+    "users": "SELECT count(*) FROM (SELECT 1 FROM users GROUP BY lower(email) HAVING count(*) > 1) AS duplicates",
+    "contacts": "SELECT count(*) FROM (SELECT 1 FROM contacts GROUP BY user_id, lower(email) "
+                "HAVING count(*) > 1) AS duplicates",
+}
+
+
+def _drop_invalid(name: str) -> None:
+    if op.get_context().as_sql:
+        return
+    invalid = op.get_bind().execute(sa.text(
+        "SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"
+    ), {"name": name}).scalar()
+    if invalid:
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+
+def _create_unique(name: str, definition: str) -> None:
+    _drop_invalid(name)
+    op.execute(f"CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {name} {definition}")
+
+
+def _lowercase(table: str) -> None:
+    pending = "email <> lower(email)"
+    if op.get_context().as_sql:
+        op.execute(f"UPDATE {table} SET email = lower(email) WHERE {pending}")
+        return
+    stmt = sa.text(f"UPDATE {table} SET email = lower(email) WHERE id IN "
+                   f"(SELECT id FROM {table} WHERE {pending} ORDER BY id LIMIT :batch_size)")
+    while op.get_bind().execute(stmt, {"batch_size": BATCH_SIZE}).rowcount:
+        pass
+
+
+def upgrade() -> None:
+    if not op.get_context().as_sql:
+        found = {table: op.get_bind().execute(sa.text(query)).scalar() for table, query in DUPLICATES.items()}
+        found = {table: count for table, count in found.items() if count}
+        if found:
+            raise RuntimeError(f"emails that differ only in case, resolve them first: {found}")
+
+    with op.get_context().autocommit_block():
+        _create_unique("ix_users_lower_email", "ON users (lower(email))")
+        _create_unique("ix_contacts_user_id_lower_email", "ON contacts (user_id, lower(email))")
+        _lowercase("users")
+        _lowercase("contacts")
+        op.execute(f"SET lock_timeout = '{LOCK_TIMEOUT}'")
+        op.execute("ALTER TABLE users DROP CONSTRAINT IF EXISTS users_email_key")
+        op.execute("RESET lock_timeout")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_contacts_user_id_email")
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        _create_unique("users_email_key", "ON users (email)")
+        _create_unique("ix_contacts_user_id_email", "ON contacts (user_id, email)")
+        op.execute(f"SET lock_timeout = '{LOCK_TIMEOUT}'")
+        op.execute("ALTER TABLE users ADD CONSTRAINT users_email_key UNIQUE USING INDEX users_email_key")
+        op.execute("RESET lock_timeout")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_users_lower_email")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_contacts_user_id_lower_email")
@@ -0,0 +1,27 @@
+"""contacts: version column, bumped by every update, for the ETags
+
+updated_at is not enough to tell two versions of a contact apart: two writes within the resolution of the clock
+leave it the same. Since PostgreSQL 11 adding a NOT NULL column with a constant default is a catalog-only change,
+existing rows read the default without the table being rewritten.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2023-07-03 12:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("contacts", sa.Column("version", sa.Integer(), nullable=False, server_default="1"))
+
+
+def downgrade() -> None:
+    op.drop_column("contacts", "version")
@@ -1,21 +1,114 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.exc import DatabaseError
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.exc import DatabaseError, TimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from src.conf.config import settings
+from src.services.timing import add_timing
 
 SQLALCHEMY_DATABASE_URL = settings.sqlalchemy_database_url
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, echo=True, max_overflow=5)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+class PoolMetrics:
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def observe_wait(self, seconds: float):
+        """
+        The observe_wait function records how long one checkout waited for a connection.
+
+        :param self: Represent the instance of the class
+        :param seconds: float: Time spent in the pool before a connection was handed out
+        :return: None
+        """
+        self.checkouts += 1
+        self.wait_seconds_total += seconds
+        self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+    def snapshot(self, pool) -> dict:
+        """
+        The snapshot function returns the counters together with the current state of the pool,
+        so pool exhaustion shows up as checked_out reaching size + max_overflow and as timeouts.
+
+        :param self: Represent the instance of the class
+        :param pool: The connection pool of the engine
+        :return: A dictionary of pool metrics
+        """
+        return {
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_seconds_avg": self.wait_seconds_total / self.checkouts if self.checkouts else 0.0,
+            "wait_seconds_max": self.wait_seconds_max,
+        }
+
+
+pool_metrics = PoolMetrics()
+
+
+class MeteredQueuePool(AsyncAdaptedQueuePool):
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except TimeoutError:
+            pool_metrics.timeouts += 1
+            raise
+        finally:
+            pool_metrics.observe_wait(time.perf_counter() - start)
+
+
+# The start time is kept on the execution context of the statement, which is dropped with it:
+# after_cursor_execute doesn't fire for a statement that raises, handle_error does.
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.query_start = time.perf_counter_ns()
+
+
+def _stop_query_timer(context):
+    start = getattr(context, "query_start", None)
+    if start is not None:
+        del context.query_start
+        add_timing("db", time.perf_counter_ns() - start)
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _query_done(conn, cursor, statement, parameters, context, executemany):
+    _stop_query_timer(context)
+
+
+@event.listens_for(Engine, "handle_error")
+def _query_failed(exception_context):
+    _stop_query_timer(exception_context.execution_context)
+
+
+engine = create_async_engine(
+    SQLALCHEMY_DATABASE_URL,
+    echo=settings.database_echo,
+    poolclass=MeteredQueuePool,
+    pool_size=settings.database_pool_size,
+    max_overflow=settings.database_max_overflow,
+    pool_timeout=settings.database_pool_timeout,
+    pool_recycle=settings.database_pool_recycle,
+    pool_pre_ping=settings.database_pool_pre_ping,
+)
+SessionLocal = async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
 
 # Dependency
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    except DatabaseError:  # noqa
-        db.rollback()
-    finally:
-        db.close()
\ No newline at end of file
+async def get_db():
+    async with SessionLocal() as db:
+        try:
+            yield db
+        except DatabaseError:  # noqa
+            await db.rollback()
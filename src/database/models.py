@@ -1,11 +1,49 @@
 import enum
+from datetime import datetime
 
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, func, Enum
-from sqlalchemy.orm import relationship, declarative_base
+from sqlalchemy import (Boolean, Column, DDL, ForeignKey, Index, Integer, String, DateTime, event, func, Enum,
+                        literal_column, column, table)
+from sqlalchemy.orm import relationship, declarative_base, validates
 
 Base = declarative_base()
 
 
+def birthday_md(birthday: str | None) -> int | None:
+    """
+    The birthday_md function turns a 'dd-mm-YYYY' birthday into month * 100 + day,
+    so birthdays can be compared and indexed regardless of the year of birth.
+
+    :param birthday: str | None: The birthday as it is stored in the contacts table
+    :return: The month and day packed into one integer, or None if the birthday can't be parsed
+    """
+    try:
+        day = datetime.strptime(birthday, '%d-%m-%Y')
+    except (TypeError, ValueError):
+        return None
+    return day.month * 100 + day.day
+
+
+def _default_birthday_md(context) -> int | None:
+    return birthday_md(context.get_current_parameters().get('birthday'))
+
+
+SEARCH_CONFIG = literal_column("'simple'")
+
+
+def search_vector(*fields):
+    """
+    The search_vector function builds the tsvector expression of the given columns, used for full-text search.
+
+    :param fields: The columns to search in
+    :return: A to_tsvector SQL expression
+    """
+    parts = [func.coalesce(field, literal_column("''")) for field in fields]
+    document = parts[0]
+    for part in parts[1:]:
+        document = document + literal_column("' '") + part
+    return func.to_tsvector(SEARCH_CONFIG, document)
+
+
 # class Role(enum.Enum):
 #     admin: str = 'admin'
 #     moderator: str = 'moderator'
@@ -19,20 +57,67 @@ class Contact(Base):
     # created_at = Column(DateTime, default=func.now())
     # updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
 
-    first_name = Column(String, index=True)
-    last_name = Column(String, index=True)
-    email = Column(String, unique=True, index=True)
-    phone_number = Column(String, unique=True)
+    first_name = Column(String)
+    last_name = Column(String)
+    email = Column(String)
+    phone_number = Column(String)
     birthday = Column(String)
+    birthday_md = Column(Integer, default=_default_birthday_md)
 
-    nick = Column(String, unique=True, index=True)
+    nick = Column(String)
     is_active_contact = Column(Boolean, default=True)
     description = Column(String)
 
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    # Bumped by every UPDATE, the ETags are derived from it: updated_at may not change between two quick writes.
+    version = Column(Integer, nullable=False, default=1, server_default="1", onupdate=literal_column("version + 1"))
+
+    # Every query is scoped to one user, so every index starts with user_id
+    # and the contacts of a user are unique per user, not across the table.
+    # Emails are unique and looked up case-insensitively, on lower(email).
+    __table_args__ = (
+        Index("ix_contacts_user_id_id", user_id, id),
+        Index("ix_contacts_user_id_first_name", user_id, first_name),
+        Index("ix_contacts_user_id_last_name", user_id, last_name),
+        Index("ix_contacts_user_id_birthday_md", user_id, birthday_md),
+        Index("ix_contacts_user_id_lower_email", user_id, func.lower(email), unique=True),
+        Index("ix_contacts_user_id_phone_number", user_id, phone_number, unique=True),
+        Index("ix_contacts_user_id_nick", user_id, nick, unique=True),
+        Index("ix_contacts_search", search_vector(first_name, last_name, email, nick),
+              postgresql_using="gin").ddl_if(dialect="postgresql"),
+    )
+
+    @validates('birthday')
+    def validate_birthday(self, key, birthday):
+        self.birthday_md = birthday_md(birthday)
+        return birthday
+
+
+# Full-text search: a GIN index over a tsvector expression on PostgreSQL, an FTS5 table kept in sync by triggers
+# on SQLite. Queries must use exactly the indexed expression for PostgreSQL to pick the index.
+contact_search_vector = search_vector(Contact.first_name, Contact.last_name, Contact.email, Contact.nick)
+
+contacts_fts = table("contacts_fts", column("rowid"), column("rank"))
+_FTS_COLUMNS = "first_name, last_name, email, nick"
+_FTS_NEW = "new.id, new.first_name, new.last_name, new.email, new.nick"
+_FTS_OLD = "'delete', old.id, old.first_name, old.last_name, old.email, old.nick"
+for statement in (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS contacts_fts USING fts5({_FTS_COLUMNS}, content='contacts', "
+    f"content_rowid='id')",
+    f"CREATE TRIGGER contacts_fts_ai AFTER INSERT ON contacts BEGIN "
+    f"INSERT INTO contacts_fts(rowid, {_FTS_COLUMNS}) VALUES ({_FTS_NEW}); END",
+    f"CREATE TRIGGER contacts_fts_ad AFTER DELETE ON contacts BEGIN "
+    f"INSERT INTO contacts_fts(contacts_fts, rowid, {_FTS_COLUMNS}) VALUES ({_FTS_OLD}); END",
+    f"CREATE TRIGGER contacts_fts_au AFTER UPDATE ON contacts BEGIN "
+    f"INSERT INTO contacts_fts(contacts_fts, rowid, {_FTS_COLUMNS}) VALUES ({_FTS_OLD}); "
+    f"INSERT INTO contacts_fts(rowid, {_FTS_COLUMNS}) VALUES ({_FTS_NEW}); END",
+):
+    event.listen(Contact.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+event.listen(Contact.__table__, "after_drop", DDL("DROP TABLE IF EXISTS contacts_fts").execute_if(dialect="sqlite"))
 
 
 # class Cat(Base):
@@ -53,9 +138,13 @@ class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True)
     username = Column(String(50))
-    email = Column(String(250), nullable=False, unique=True)
+    email = Column(String(250), nullable=False)
     password = Column(String(255), nullable=False)
     avatar = Column(String(255), nullable=True)
     refresh_token = Column(String(255), nullable=True)
     # role = Column('role', Enum(Role), default=Role.user)
-    confirmed = Column(Boolean, default=False)
\ No newline at end of file
+    confirmed = Column(Boolean, default=False)
+
+    __table_args__ = (
+        Index("ix_users_lower_email", func.lower(email), unique=True),
+    )
\ No newline at end of file
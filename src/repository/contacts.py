@@ -1,143 +1,402 @@
-from sqlalchemy.orm import Session
+import re
+from datetime import date, timedelta
+from typing import AsyncIterator, Iterable
 
-from src.database.models import Contact
-from src.schemas import ContactModel, ContactActiveModel
+from sqlalchemy import case, delete, func, literal_column, or_, select, update as sql_update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.database.models import Contact, User, birthday_md, contact_search_vector, contacts_fts, SEARCH_CONFIG
+from src.schemas import (ContactModel, ContactActiveModel, ContactResponse, ContactPatchModel, ContactBatchPatch,
+                         ContactBatchActiveModel, normalize_email)
+from src.services.cache import response_cache
 
-async def get_contacts(db: Session):
+CONTACT_COLUMNS = tuple(Contact.__table__.c[name] for name in ContactResponse.__fields__)
+UNIQUE_FIELDS = tuple(column.name for index in Contact.__table__.indexes if index.unique
+                      for column in index.columns if column.name != "user_id")
+# A statement may carry at most 32767 bind parameters with asyncpg and 32766 with SQLite,
+# a multi-row INSERT binds at most one per column and row.
+MAX_BIND_PARAMS = 32766
+INSERT_BATCH_SIZE = MAX_BIND_PARAMS // len(Contact.__table__.c)
+
+
+def contacts_tag(user: User) -> str:
+    return f"contacts:{user.id}"
+
+
+def contact_tag(contact_id: int) -> str:
+    return f"contact:{contact_id}"
+
+
+async def _invalidate(user: User, contact_ids: Iterable[int] = ()):
+    # Every write changes some list of contacts of the user, and the contacts it touched.
+    await response_cache.invalidate(contacts_tag(user), *map(contact_tag, contact_ids))
+
+
+def _select_columns(fields: tuple[str, ...] | None = None):
+    if fields is None:
+        return select(*CONTACT_COLUMNS)
+    return select(*(Contact.__table__.c[name] for name in fields))
+
+
+def _email_is(email: str):
+    # Matches the lower(email) expression of the unique index, so the lookup is a single index probe.
+    return func.lower(Contact.email) == normalize_email(email)
+
+
+def _page(stmt, user: User, limit: int | None, cursor: int | None, filters: dict):
+    filters = {key: value for key, value in filters.items() if value is not None}
+    email = filters.pop("email", None)
+    stmt = stmt.filter_by(user_id=user.id, **filters)
+    if email is not None:
+        stmt = stmt.where(_email_is(email))
+    if cursor is not None:
+        stmt = stmt.where(Contact.id > cursor)
+    stmt = stmt.order_by(Contact.id)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return stmt
+
+
+async def get_contacts(db: AsyncSession, user: User, limit: int | None = None, cursor: int | None = None,
+                       first_name: str | None = None, last_name: str | None = None, email: str | None = None,
+                       is_active_contact: bool | None = None, fields: tuple[str, ...] | None = None):
+    """
+    The get_contacts function returns a page of the contacts of the user ordered by id.
+    Paging is keyset based: the next page starts right after the last id of the previous one,
+    so the cost of a page does not depend on how deep into the table it is.
+    Plain rows of the response columns are returned instead of contacts, or of the given fields only.
+
+    :param db: AsyncSession: Pass the database session object into the function
+    :param user: User: The owner of the contacts
+    :param limit: int | None: Maximum number of contacts to return, all of them if None
+    :param cursor: int | None: Return only contacts with an id greater than the cursor
+    :param first_name: str | None: Keep only contacts with this first name
+    :param last_name: str | None: Keep only contacts with this last name
+    :param email: str | None: Keep only the contact with this email, in any case
+    :param is_active_contact: bool | None: Keep only active or only inactive contacts
+    :param fields: tuple[str, ...] | None: The columns to select, all of them if None
+    :return: A list of rows
     """
-    The get_contacts function returns a list of all contacts in the database.
+    filters = dict(first_name=first_name, last_name=last_name, email=email, is_active_contact=is_active_contact)
+    contacts = await db.execute(_page(_select_columns(fields), user, limit, cursor, filters))
+    return contacts.all()
 
 
-    :param db: Session: Pass the database session object into the function
-    :return: A list of contact objects
+async def get_contacts_fingerprint(db: AsyncSession, user: User, limit: int | None = None, cursor: int | None = None,
+                                   first_name: str | None = None, last_name: str | None = None,
+                                   email: str | None = None, is_active_contact: bool | None = None):
     """
-    contacts = db.query(Contact).all()
-    return contacts
+    The get_contacts_fingerprint function summarizes the page get_contacts would return with the same arguments
+    as the number of contacts, their latest updated_at, the sum of their versions and the sum of their ids.
+    Only the id, updated_at and version of the page are read, so it is much cheaper than the page itself,
+    and any insert, update or delete within the page changes it.
+
+    :param db: AsyncSession: Pass the database session object into the function
+    :param user: User: The owner of the contacts
+    :param limit: int | None: Maximum number of contacts on the page, all of them if None
+    :param cursor: int | None: The page starts after this id
+    :param first_name: str | None: Keep only contacts with this first name
+    :param last_name: str | None: Keep only contacts with this last name
+    :param email: str | None: Keep only the contact with this email, in any case
+    :param is_active_contact: bool | None: Keep only active or only inactive contacts
+    :return: A row of count, max_updated_at, version_sum and id_sum
+    """
+    filters = dict(first_name=first_name, last_name=last_name, email=email, is_active_contact=is_active_contact)
+    page = _page(select(Contact.id, Contact.updated_at, Contact.version), user, limit, cursor, filters).subquery()
+    stmt = select(func.count().label("count"), func.max(page.c.updated_at).label("max_updated_at"),
+                  func.coalesce(func.sum(page.c.version), 0).label("version_sum"),
+                  func.coalesce(func.sum(page.c.id), 0).label("id_sum"))
+    fingerprint = await db.execute(stmt)
+    return fingerprint.one()
 
 
-async def get_contacts_birthday(birthday: str, db: Session):
+async def stream_contacts(db: AsyncSession, user: User, batch_size: int) -> AsyncIterator[list]:
     """
-    The get_contacts_birthday function returns a list of contacts with the specified birthday.
-        Args:
-            birthday (str): The contact's birthday to search for.
-            db (Session): A database session object.
+    The stream_contacts function reads every contact of the user through a server-side cursor,
+    batch_size rows at a time. Rows are plain tuples of the response columns, no ORM objects are built.
 
-    :param birthday: str: Filter the contacts by birthday
-    :param db: Session: Pass in the database session to be used
-    :return: A list of contacts that have the same birthday
+    :param db: AsyncSession: Pass the database session object into the function
+    :param user: User: The owner of the contacts
+    :param batch_size: int: Number of rows fetched from the cursor at a time
+    :return: An async iterator of lists of rows, ordered by id
     """
-    contacts = db.query(Contact).filter_by(birthday=birthday).all()
-    return contacts
+    stmt = (select(*CONTACT_COLUMNS).filter_by(user_id=user.id).order_by(Contact.id)
+            .execution_options(yield_per=batch_size))
+    result = await db.stream(stmt)
+    async for rows in result.partitions():
+        yield rows
 
 
-async def get_contact_by_id(contact_id: int, db: Session):
+async def get_contacts_birthday(days: int, user: User, db: AsyncSession, today: date | None = None):
+    """
+    The get_contacts_birthday function returns the contacts of the user whose birthday falls within the next days
+    after today. The window is matched on the (user_id, birthday_md) index, and wraps from December to January.
+
+    :param days: int: The size of the window in days
+    :param user: User: The owner of the contacts
+    :param db: AsyncSession: Pass in the database session to be used
+    :param today: date | None: The day the window starts after, today by default
+    :return: A list of rows of the response columns ordered by how soon their birthday comes
+    """
+    today = today or date.today()
+    start = today + timedelta(days=1)
+    end = today + timedelta(days=days)
+    start_md = start.month * 100 + start.day
+    end_md = end.month * 100 + end.day
+    if start_md <= end_md:
+        window = Contact.birthday_md.between(start_md, end_md)
+    else:
+        window = or_(Contact.birthday_md >= start_md, Contact.birthday_md <= end_md)
+    stmt = (select(*CONTACT_COLUMNS).where(Contact.user_id == user.id, window)
+            .order_by(case((Contact.birthday_md < start_md, 1), else_=0), Contact.birthday_md))
+    contacts = await db.execute(stmt)
+    return contacts.all()
+
+
+async def search_contacts(q: str, limit: int, offset: int, user: User, db: AsyncSession):
+    """
+    The search_contacts function finds the contacts of the user whose first name, last name, email or nick
+    start with every word of the query, best matches first.
+    It uses the GIN tsvector index on PostgreSQL and the FTS5 table on SQLite.
+
+    :param q: str: The search query, words are matched as prefixes
+    :param limit: int: Maximum number of contacts to return
+    :param offset: int: Number of best matches to skip
+    :param user: User: The owner of the contacts
+    :param db: AsyncSession: Pass the database session to the function
+    :return: A list of rows of the response columns ordered by rank
+    """
+    words = re.findall(r"\w+", q.lower())
+    if not words:
+        return []
+    if db.get_bind().dialect.name == "postgresql":
+        query = func.to_tsquery(SEARCH_CONFIG, " & ".join(f"{word}:*" for word in words))
+        stmt = (select(*CONTACT_COLUMNS).where(Contact.user_id == user.id, contact_search_vector.op("@@")(query))
+                .order_by(func.ts_rank(contact_search_vector, query).desc(), Contact.id))
+    else:
+        query = " ".join(f'"{word}"*' for word in words)
+        stmt = (select(*CONTACT_COLUMNS).join(contacts_fts, contacts_fts.c.rowid == Contact.id)
+                .where(Contact.user_id == user.id, literal_column("contacts_fts").op("MATCH")(query))
+                .order_by(contacts_fts.c.rank, Contact.id))
+    contacts = await db.execute(stmt.limit(limit).offset(offset))
+    return contacts.all()
+
+
+async def get_contact_by_id(contact_id: int, user: User, db: AsyncSession, fields: tuple[str, ...] | None = None):
     """
     The get_contact_by_id function returns a contact object from the database based on its id.
         Args:
             contact_id (int): The id of the desired contact.
-            db (Session): A connection to the database.
+            db (AsyncSession): A connection to the database.
 
     :param contact_id: int: Specify the id of the contact to be retrieved
-    :param db: Session: Pass the database session to the function
-    :return: The contact with the given id
+    :param user: User: The owner of the contact
+    :param db: AsyncSession: Pass the database session to the function
+    :param fields: tuple[str, ...] | None: The columns to select, all of them if None
+    :return: The contact with the given id, or a row of the given fields
     """
-    contact = db.query(Contact).filter_by(id=contact_id).first()
-    return contact
+    stmt = select(Contact) if fields is None else _select_columns(fields)
+    contact = await db.execute(stmt.filter_by(id=contact_id, user_id=user.id))
+    if fields is not None:
+        return contact.one_or_none()
+    return contact.scalar_one_or_none()
+
+
+async def get_contact_version(contact_id: int, user: User, db: AsyncSession):
+    """
+    The get_contact_version function reads only the version and updated_at of a contact,
+    to validate cached copies of it.
+
+    :param contact_id: int: The id of the contact
+    :param user: User: The owner of the contact
+    :param db: AsyncSession: Pass the database session to the function
+    :return: A row with the version and updated_at of the contact, None if there is no such contact
+    """
+    contact = await db.execute(select(Contact.version, Contact.updated_at).filter_by(id=contact_id, user_id=user.id))
+    return contact.one_or_none()
 
 
-async def get_contact_by_email(email: str, db: Session):
+async def get_contact_by_email(email: str, user: User, db: AsyncSession):
     """
     The get_contact_by_email function returns a contact object from the database based on the email address provided.
         Args:
             email (str): The email address of the contact to be retrieved.
-            db (Session): A connection to our database, which is used for querying and updating data.
+            db (AsyncSession): A connection to our database, which is used for querying and updating data.
 
-    :param email: str: Filter the database by email
-    :param db: Session: Pass in a database session
+    :param email: str: Filter the database by email, case-insensitively
+    :param user: User: The owner of the contact
+    :param db: AsyncSession: Pass in a database session
     :return: The contact with the given email address
     """
-    contact = db.query(Contact).filter_by(email=email).first()
-    return contact
+    contact = await db.execute(select(Contact).where(Contact.user_id == user.id, _email_is(email)))
+    return contact.scalars().first()
 
 
-async def get_contacts_by_first_name(first_name: str, db: Session):
+async def get_contacts_by_first_name(first_name: str, user: User, db: AsyncSession):
     """
     The get_contacts_by_first_name function returns a list of contacts with the given first name.
 
     :param first_name: str: Specify the first name of the contact
-    :param db: Session: Pass the database session into the function
-    :return: A list of contact objects
+    :param user: User: The owner of the contacts
+    :param db: AsyncSession: Pass the database session into the function
+    :return: A list of rows of the response columns
     """
-    contacts = db.query(Contact).filter_by(first_name=first_name).all()
-    return contacts
+    contacts = await db.execute(select(*CONTACT_COLUMNS).filter_by(user_id=user.id, first_name=first_name))
+    return contacts.all()
 
 
-async def get_contacts_by_last_name(last_name: str, db: Session):
+async def get_contacts_by_last_name(last_name: str, user: User, db: AsyncSession):
     """
     The get_contacts_by_last_name function returns a list of contacts with the given last name.
 
     :param last_name: str: Specify the last name of the contact you want to retrieve
-    :param db: Session: Pass the database session object to the function
-    :return: A list of contact objects
+    :param user: User: The owner of the contacts
+    :param db: AsyncSession: Pass the database session object to the function
+    :return: A list of rows of the response columns
     """
-    contacts = db.query(Contact).filter_by(last_name=last_name).all()
-    return contacts
+    contacts = await db.execute(select(*CONTACT_COLUMNS).filter_by(user_id=user.id, last_name=last_name))
+    return contacts.all()
 
 
-async def create(body: ContactModel, db: Session):
+def conflicting_field(err: IntegrityError) -> str | None:
     """
-    The create function creates a new contact in the database.
+    The conflicting_field function tells which unique field of a contact an IntegrityError is about.
+    It looks at the name of the violated constraint on PostgreSQL and at the error message on SQLite.
 
+    :param err: IntegrityError: The error raised by an INSERT or UPDATE of contacts
+    :return: The name of the field, or None if the error is not a uniqueness violation of a contact field
+    """
+    orig = err.orig
+    cause = getattr(orig, "__cause__", None)
+    diag = getattr(orig, "diag", None)
+    constraint = getattr(cause, "constraint_name", None) or getattr(diag, "constraint_name", None)
+    text = constraint or str(orig)
+    for field in UNIQUE_FIELDS:
+        if field in text:
+            return field
+    return None
+
+
+async def create(body: ContactModel, user: User, db: AsyncSession, upsert: bool = False):
+    """
+    The create function creates a new contact of the user with one INSERT ... RETURNING statement.
+    With upsert a contact of the user with the same email is updated instead,
+    by INSERT ... ON CONFLICT (user_id, lower(email)) DO UPDATE.
+    A clash with another contact on a unique field rolls the session back and raises IntegrityError,
+    conflicting_field tells which field it was.
 
     :param body: ContactModel: Pass the contact information to the database
-    :param db: Session: Pass in the database session
-    :return: The contact object that was created
+    :param user: User: The owner of the contact
+    :param db: AsyncSession: Pass in the database session
+    :param upsert: bool: Update the contact with the same email if there is one
+    :return: A row of the response columns of the contact
     """
-    contact = Contact(**body.dict())  # Owner(**body.dict())   Contact(email=body.email)
-    db.add(contact)
-    db.commit()
+    stmt = _insert(db).values(**body.dict(), birthday_md=birthday_md(body.birthday), user_id=user.id)
+    if upsert:
+        changed = {name: stmt.excluded[name] for name in (*body.__fields__, "birthday_md") if name != "email"}
+        stmt = stmt.on_conflict_do_update(index_elements=[Contact.user_id, func.lower(Contact.email)],
+                                          set_=dict(changed, updated_at=func.now(),
+                                                    version=Contact.version + 1))
+    try:
+        contact = await db.execute(stmt.returning(*CONTACT_COLUMNS))
+        contact = contact.one()
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise
+    await _invalidate(user, [contact.id])
     return contact
 
 
-async def update(contact_id: int, body: ContactModel, db: Session):
+def _insert(db: AsyncSession):
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(Contact)
+    return sqlite.insert(Contact)
+
+
+async def create_many(bodies: list[ContactModel], user: User, db: AsyncSession) -> list[str]:
+    """
+    The create_many function inserts contacts of the user with multi-row INSERT ... ON CONFLICT DO NOTHING
+    statements of up to INSERT_BATCH_SIZE rows, which keeps them under the bind parameter limit of the driver,
+    and commits them in one transaction. Contacts that clash with an existing email, phone number or nick
+    of the user are skipped.
+
+    :param bodies: list[ContactModel]: The contacts to insert
+    :param user: User: The owner of the contacts
+    :param db: AsyncSession: Pass in the database session
+    :return: The emails of the contacts that were inserted
     """
-    The update function updates a contact in the database.
+    rows = [dict(body.dict(), birthday_md=birthday_md(body.birthday), user_id=user.id) for body in bodies]
+    emails = []
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        stmt = _insert(db).values(rows[start:start + INSERT_BATCH_SIZE]).on_conflict_do_nothing()
+        inserted = await db.execute(stmt.returning(Contact.email))
+        emails.extend(inserted.scalars())
+    await db.commit()
+    if emails:
+        await _invalidate(user)
+    return emails
+
+
+async def update(contact_id: int, body: ContactModel | ContactPatchModel, user: User, db: AsyncSession,
+                 partial: bool = False):
+    """
+    The update function updates a contact in the database with one UPDATE ... RETURNING statement,
+    without reading the contact first.
         Args:
             contact_id (int): The id of the contact to update.
             body (ContactModel): The updated version of the ContactModel object.
 
-    :param contact_id: int: Specify the id of the contact that will be deleted
-    :param body: ContactModel: Pass the contact data to be updated
-    :param db: Session: Access the database
-    :return: The updated contact
+    :param contact_id: int: Specify the id of the contact that will be updated
+    :param body: ContactModel | ContactPatchModel: Pass the contact data to be updated
+    :param user: User: The owner of the contact
+    :param db: AsyncSession: Access the database
+    :param partial: bool: Set only the fields present in the body instead of all of them
+    :return: A row of the response columns of the updated contact, None if there is no such contact
     """
-    contact = await get_contact_by_id(contact_id, db)
-    if contact:
-        contact.email = body.email
-        db.commit()
+    values = body.dict(exclude_unset=partial)
+    if not values:
+        contact = await db.execute(select(*CONTACT_COLUMNS).filter_by(id=contact_id, user_id=user.id))
+        return contact.one_or_none()
+    if "birthday" in values:
+        values["birthday_md"] = birthday_md(values["birthday"])
+    stmt = (sql_update(Contact).where(Contact.id == contact_id, Contact.user_id == user.id).values(**values)
+            .returning(*CONTACT_COLUMNS))
+    try:
+        contact = await db.execute(stmt)
+        contact = contact.one_or_none()
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise
+    if contact is not None:
+        await _invalidate(user, [contact_id])
     return contact
 
 
-async def remove(contact_id: int, db: Session):
+async def remove(contact_id: int, user: User, db: AsyncSession):
     """
     The remove function removes a contact from the database.
         Args:
             contact_id (int): The id of the contact to be removed.
-            db (Session): A connection to the database.
+            db (AsyncSession): A connection to the database.
 
     :param contact_id: int: Specify the id of the contact to be removed
-    :param db: Session: Pass the database session to the function
+    :param user: User: The owner of the contact
+    :param db: AsyncSession: Pass the database session to the function
     :return: The contact that was removed from the database
     """
-    contact = await get_contact_by_id(contact_id, db)
+    contact = await get_contact_by_id(contact_id, user, db)
     if contact:
-        db.delete(contact)
-        db.commit()
+        await db.delete(contact)
+        await db.commit()
+        await _invalidate(user, [contact_id])
     return contact
 
 
-async def set_is_active_contact(contact_id: int, body: ContactActiveModel, db: Session):
+async def set_is_active_contact(contact_id: int, body: ContactActiveModel, user: User, db: AsyncSession):
     """
     The set_is_active_contact function takes in a contact_id and a body containing the is_active_contact value.
     It then gets the contact by id, checks if it exists, sets its is_active value to that of the body's, and commits it to db.
@@ -145,11 +404,119 @@ async def set_is_active_contact(contact_id: int, body: ContactActiveModel, db: S
 
     :param contact_id: int: Find the contact in the database
     :param body: ContactActiveModel: Pass the is_active_contact value to the function
-    :param db: Session: Pass the database session to the function
+    :param user: User: The owner of the contact
+    :param db: AsyncSession: Pass the database session to the function
     :return: The contact that was updated
     """
-    contact = await get_contact_by_id(contact_id, db)
+    contact = await get_contact_by_id(contact_id, user, db)
     if contact:
         contact.is_active_contact = body.is_active_contact
-        db.commit()
+        await db.commit()
+        await _invalidate(user, [contact_id])
     return contact
+
+
+async def get_contacts_by_ids(contact_ids: list[int], user: User, db: AsyncSession):
+    """
+    The get_contacts_by_ids function returns the contacts with the given ids in one query.
+
+    :param contact_ids: list[int]: The ids of the contacts
+    :param user: User: The owner of the contacts
+    :param db: AsyncSession: Pass the database session to the function
+    :return: A list of the contacts of the user that exist, in no particular order
+    """
+    contacts = await db.execute(select(Contact).where(Contact.user_id == user.id, Contact.id.in_(contact_ids)))
+    return contacts.scalars().all()
+
+
+async def update_many(patches: list[ContactBatchPatch], user: User, db: AsyncSession) -> dict[int, str]:
+    """
+    The update_many function applies a list of partial updates in one transaction.
+    One query finds which of the ids exist and belong to the user,
+    then the patches of those are sent as a single bulk UPDATE by id.
+    If a patch clashes with another contact on a unique field, the bulk UPDATE is rolled back and the patches
+    are applied again one by one, each in its own savepoint, so only the clashing ones are left out.
+
+    :param patches: list[ContactBatchPatch]: The id of each contact and the fields to change
+    :param user: User: The owner of the contacts
+    :param db: AsyncSession: Pass the database session to the function
+    :return: The status of each contact that exists, 'ok' or 'conflict', by id
+    """
+    # The rollback below expires the user if it was loaded by this session, its tag is taken before.
+    user_tag = contacts_tag(user)
+    existing = await db.execute(select(Contact.id).where(Contact.user_id == user.id,
+                                                         Contact.id.in_([patch.id for patch in patches])))
+    existing = set(existing.scalars())
+    rows = []
+    for patch in patches:
+        if patch.id not in existing:
+            continue
+        row = patch.dict(exclude_unset=True)
+        if "birthday" in row:
+            row["birthday_md"] = birthday_md(row["birthday"])
+        rows.append(row)
+    try:
+        if rows:
+            await db.execute(sql_update(Contact), rows)
+        await db.commit()
+        statuses = {row["id"]: "ok" for row in rows}
+    except IntegrityError:
+        await db.rollback()
+        statuses = await _update_each(rows, db)
+    updated = [contact_id for contact_id, status in statuses.items() if status == "ok"]
+    if updated:
+        await response_cache.invalidate(user_tag, *map(contact_tag, updated))
+    return statuses
+
+
+async def _update_each(rows: list[dict], db: AsyncSession) -> dict[int, str]:
+    statuses = {}
+    for row in rows:
+        try:
+            async with db.begin_nested():
+                await db.execute(sql_update(Contact), [row])
+        except IntegrityError:
+            statuses[row["id"]] = "conflict"
+        else:
+            statuses[row["id"]] = "ok"
+    await db.commit()
+    return statuses
+
+
+async def remove_many(contact_ids: list[int], user: User, db: AsyncSession) -> list[int]:
+    """
+    The remove_many function deletes the contacts of the user with the given ids
+    with one DELETE ... WHERE id IN statement.
+
+    :param contact_ids: list[int]: The ids of the contacts to remove
+    :param user: User: The owner of the contacts
+    :param db: AsyncSession: Pass the database session to the function
+    :return: The ids of the contacts that were removed
+    """
+    stmt = delete(Contact).where(Contact.user_id == user.id, Contact.id.in_(contact_ids)).returning(Contact.id)
+    removed = await db.execute(stmt)
+    removed = list(removed.scalars())
+    await db.commit()
+    if removed:
+        await _invalidate(user, removed)
+    return removed
+
+
+async def set_is_active_contact_many(body: ContactBatchActiveModel, user: User, db: AsyncSession) -> list[int]:
+    """
+    The set_is_active_contact_many function sets is_active_contact of the contacts of the user with the given ids
+    with one UPDATE ... WHERE id IN statement.
+
+    :param body: ContactBatchActiveModel: The ids of the contacts and the new is_active_contact value
+    :param user: User: The owner of the contacts
+    :param db: AsyncSession: Pass the database session to the function
+    :return: The ids of the contacts that were updated
+    """
+    stmt = (sql_update(Contact).where(Contact.user_id == user.id, Contact.id.in_(body.ids))
+            .values(is_active_contact=body.is_active_contact).returning(Contact.id))
+    updated = await db.execute(stmt)
+    updated = list(updated.scalars())
+    await db.commit()
+    if updated:
+        await _invalidate(user, updated)
+    return updated
@@ -1,30 +1,34 @@
 import logging
 
 from libgravatar import Gravatar
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import User
-from src.schemas import UserModel
+from src.schemas import UserModel, normalize_email
+from src.services.cache import user_cache
 
 
-async def get_user_by_email(email: str, db: Session) -> User | None:
+async def get_user_by_email(email: str, db: AsyncSession) -> User | None:
     """
     The get_user_by_email function takes in an email and a database session,
     and returns the user associated with that email. If no such user exists, it returns None.
+    Emails are compared case-insensitively, on the lower(email) unique index.
 
     :param email: str: Pass the email address of the user to be retrieved
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: A user object if the user exists, or none if they don't
     """
-    return db.query(User).filter(User.email == email).first()
+    user = await db.execute(select(User).where(func.lower(User.email) == normalize_email(email)))
+    return user.scalars().first()
 
 
-async def create_user(body: UserModel, db: Session) -> User:
+async def create_user(body: UserModel, db: AsyncSession) -> User:
     """
     The create_user function creates a new user in the database.
 
     :param body: UserModel: Validate the incoming request body
-    :param db: Session: Connect to the database
+    :param db: AsyncSession: Connect to the database
     :return: A user object
     """
     avatar = None
@@ -36,34 +40,52 @@ async def create_user(body: UserModel, db: Session) -> User:
 
     new_user = User(**body.dict(), avatar=avatar)
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     return new_user
 
 
-async def update_token(user: User, token: str | None, db: Session) -> None:
+async def update_token(user: User, token: str | None, db: AsyncSession) -> None:
     """
     The update_token function updates the refresh token for a user.
+    The refresh token is not part of the cached user, so logins and refreshes leave the user cache alone.
 
     :param user: User: Pass in the user object
     :param token: str | None: Pass in the token that is returned from the google api
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: None
     """
     user.refresh_token = token
-    db.commit()
+    await db.commit()
 
 
-async def confirmed_email(email: str, db: Session) -> None:
+async def confirmed_email(email: str, db: AsyncSession) -> None:
     """
     The confirmed_email function takes in an email and a database session,
     and sets the confirmed field of the user with that email to True.
 
 
     :param email: str: Pass in the email address of the user that is being confirmed
-    :param db: Session: Pass in the database session to the function
+    :param db: AsyncSession: Pass in the database session to the function
     :return: None
     """
     user = await get_user_by_email(email, db)
     user.confirmed = True
-    db.commit()
\ No newline at end of file
+    await db.commit()
+    await user_cache.invalidate(email)
+
+
+async def update_avatar(email: str, url: str, db: AsyncSession) -> User:
+    """
+    The update_avatar function sets the avatar url of the user with the given email.
+
+    :param email: str: Find the user in the database
+    :param url: str: The url of the new avatar
+    :param db: AsyncSession: Pass in the database session to the function
+    :return: The updated user
+    """
+    user = await get_user_by_email(email, db)
+    user.avatar = url
+    await db.commit()
+    await user_cache.invalidate(email)
+    return user
\ No newline at end of file
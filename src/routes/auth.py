@@ -1,52 +1,53 @@
 from typing import List
 
-from fastapi import APIRouter, HTTPException, Depends, status, Security, BackgroundTasks, Request
+from fastapi import APIRouter, HTTPException, Depends, status, Security, Request
 from fastapi.security import OAuth2PasswordRequestForm, HTTPAuthorizationCredentials, HTTPBearer
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.db import get_db
+from src.database.models import User
 from src.schemas import UserModel, UserResponse, TokenModel, RequestEmail
 from src.repository import users as repository_users
 from src.services.auth import auth_service
+from src.services.timing import TimedRoute
 from src.services.email import send_email
 
-router = APIRouter(prefix='/auth', tags=["auth"])
+router = APIRouter(prefix='/auth', tags=["auth"], route_class=TimedRoute)
 security = HTTPBearer()
 
 
 @router.post("/signup", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-async def signup(body: UserModel, background_tasks: BackgroundTasks, request: Request, db: Session = Depends(get_db)):
+async def signup(body: UserModel, request: Request, db: AsyncSession = Depends(get_db)):
     """
     The signup function creates a new user in the database.
         It takes a UserModel object as input, which is validated by pydantic.
-        The password is hashed using Argon2 and stored in the database.
-        A confirmation email is sent to the user's email address.
+        The password is hashed with bcrypt in the password hashing pool and stored in the database.
+        A confirmation email is queued for the user's email address and sent by the email worker.
 
     :param body: UserModel: Get the user's email and password
-    :param background_tasks: BackgroundTasks: Add a task to the background tasks queue
     :param request: Request: Get the base url of the server
-    :param db: Session: Pass the database session to the repository
+    :param db: AsyncSession: Pass the database session to the repository
     :return: A new user, but it also sends an email to that user
     """
     exist_user = await repository_users.get_user_by_email(body.email, db)
     if exist_user:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Account already exists")
-    body.password = auth_service.get_password_hash(body.password)
+    body.password = await auth_service.get_password_hash(body.password)
     new_user = await repository_users.create_user(body, db)
-    background_tasks.add_task(send_email, new_user.email, new_user.username, str(request.base_url))
+    await send_email(new_user.email, new_user.username, str(request.base_url), dedupe=True)
     return new_user
 #  {status="Ok", code=1400, message="", data={ "user": new_user }}
 
 
 @router.post("/login", response_model=TokenModel)
-async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(body: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
     """
     The login function is used to authenticate a user.
         It takes the username and password from the request body,
         verifies them against the database, and returns an access token if successful.
 
     :param body: OAuth2PasswordRequestForm: Validate the request body
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :return: A dict with the access_token and refresh_token
     """
     user = await repository_users.get_user_by_email(body.username, db)
@@ -54,7 +55,7 @@ async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depen
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid email")
     if not user.confirmed:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Email not confirmed")
-    if not auth_service.verify_password(body.password, user.password):
+    if not await auth_service.verify_password(body.password, user.password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password")
     # Generate JWT
     access_token = await auth_service.create_access_token(data={"sub": user.email})
@@ -63,15 +64,33 @@ async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depen
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 
+@router.post("/logout")
+async def logout(token: str = Depends(auth_service.oauth2_scheme),
+                 current_user: User = Depends(auth_service.get_current_user), db: AsyncSession = Depends(get_db)):
+    """
+    The logout function revokes the access token the request was made with and drops the user's refresh token,
+    so neither of them can be used again.
+
+    :param token: str: The access token from the authorization header
+    :param current_user: User: Get the current user
+    :param db: AsyncSession: Get the database session
+    :return: A message to the user
+    """
+    await auth_service.revoke_token(token)
+    user = await repository_users.get_user_by_email(current_user.email, db)
+    await repository_users.update_token(user, None, db)
+    return {"message": "Logged out"}
+
+
 @router.get('/refresh_token', response_model=TokenModel)
-async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(security), db: Session = Depends(get_db)):
+async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(security), db: AsyncSession = Depends(get_db)):
     """
     The refresh_token function is used to refresh the access token.
         The function takes in a refresh token and returns an access_token, a new refresh_token, and the type of token.
         If the user's current refresh_token does not match what was passed into this function then it will return an error.
 
     :param credentials: HTTPAuthorizationCredentials: Get the token from the request header
-    :param db: Session: Get a database session
+    :param db: AsyncSession: Get a database session
     :return: A dictionary with the access token, refresh token and a bearer type
     """
     token = credentials.credentials
@@ -88,7 +107,7 @@ async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(sec
 
 
 @router.get('/confirmed_email/{token}')
-async def confirmed_email(token: str, db: Session = Depends(get_db)):
+async def confirmed_email(token: str, db: AsyncSession = Depends(get_db)):
     """
     The confirmed_email function is used to confirm a user's email address.
         It takes the token from the URL and uses it to get the user's email address.
@@ -98,7 +117,7 @@ async def confirmed_email(token: str, db: Session = Depends(get_db)):
             confirmed_email function which sets the 'confirmed' field of that particular User object
 
     :param token: str: Get the token from the url
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :return: A message that the email is already confirmed or a message that the email has been confirmed
     """
     email = await auth_service.get_email_from_token(token)
@@ -112,25 +131,23 @@ async def confirmed_email(token: str, db: Session = Depends(get_db)):
 
 
 @router.post('/request_email')
-async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, request: Request,
-                        db: Session = Depends(get_db)):
+async def request_email(body: RequestEmail, request: Request, db: AsyncSession = Depends(get_db)):
     """
     The request_email function is used to send an email to the user with a link that will allow them
     to confirm their account. The function takes in a RequestEmail object, which contains the email of
     the user who wants to confirm their account. It then checks if there is already a confirmed user with
     that email address, and if so returns an error message saying that they are already confirmed. If not, it sends
-    an email containing a confirmation link.
+    an email containing a confirmation link. Repeated requests within EMAIL_DEDUPE_TTL seconds queue it only once.
 
     :param body: RequestEmail: Get the email from the request body
-    :param background_tasks: BackgroundTasks: Add a task to the background tasks queue
     :param request: Request: Get the base_url of the application
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :return: A message to the user
     """
     user = await repository_users.get_user_by_email(body.email, db)
 
-    if user.confirmed:
+    if user and user.confirmed:
         return {"message": "Your email is already confirmed"}
     if user:
-        background_tasks.add_task(send_email, user.email, user.username, str(request.base_url))
+        await send_email(user.email, user.username, str(request.base_url), dedupe=True)
     return {"message": "Check your email for confirmation."}
@@ -1,18 +1,26 @@
-from typing import List
-from datetime import datetime, timedelta
+from datetime import date, datetime, time, timedelta
+from typing import Iterable, List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Path, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Body, Depends, File, HTTPException, Path, Query, Request, Response, UploadFile, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.db import get_db
 from src.database.models import Contact, User  # , Role
-from src.schemas import ContactResponse, ContactModel, ContactActiveModel
+from src.schemas import (ContactResponse, ContactModel, ContactActiveModel, ContactPatchModel, ContactFieldsPage,
+                         ContactFieldsResponse, ContactImportReport, ContactBatchPatch, ContactBatchActiveModel,
+                         ContactBatchResult)
 from src.repository import contacts as repository_contacts
+from src.services import contact_export, contact_import, etag
 from src.services.auth import auth_service
+from src.services.cache import CachedResponse, response_cache
+from src.services.serialization import json_response, row_dicts, rows_response
+from src.services.timing import TimedRoute
 
 # from src.services.roles import RolesAccess
 
-router = APIRouter(prefix="/contacts", tags=["contacts"])
+router = APIRouter(prefix="/contacts", tags=["contacts"], route_class=TimedRoute)
 
 
 # access_get = RolesAccess([Role.admin, Role.moderator, Role.user])
@@ -21,171 +29,427 @@ router = APIRouter(prefix="/contacts", tags=["contacts"])
 # access_delete = RolesAccess([Role.admin])
 
 
-@router.get("/", response_model=List[ContactResponse])  # , dependencies=[Depends(access_get)])
-async def get_contacts(db: Session = Depends(get_db), _: User = Depends(auth_service.get_current_user)):
+def contact_fields(fields: Optional[str] = Query(None, description="Comma separated contact fields to return, "
+                                                                  "for example id,first_name,phone_number")):
     """
-    The get_contacts function returns a list of contacts.
+    The contact_fields function parses the fields query parameter into the columns to select.
+    The id is always returned, it is needed for paging and to refer to the contact later.
 
-    :param db: Session: Pass in a database session to the function
-    :param _: User: Tell the function that we expect a user to be passed in, but we don't care what it is
+    :param fields: Optional[str]: Comma separated field names, all fields if None
+    :return: The field names in response order, or None for all fields
+    """
+    if fields is None:
+        return None
+    names = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = names - ContactResponse.__fields__.keys()
+    if unknown:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return tuple(name for name in ContactResponse.__fields__ if name in names or name == "id")
+
+
+def _cached_response(request: Request, cached: CachedResponse) -> Response:
+    if "ETag" in cached.headers and etag.is_not_modified(request, cached.headers):
+        return etag.not_modified(cached.headers)
+    return Response(cached.body, media_type="application/json", headers=cached.headers)
+
+
+async def _cache(key: str, response: Response, tags: Iterable[str], headers: dict | None = None,
+                 ttl: int | None = None) -> Response:
+    await response_cache.set(key, response.body, tags, headers=headers, ttl=ttl)
+    return response
+
+
+def _conflict(err: IntegrityError) -> HTTPException:
+    field = repository_contacts.conflicting_field(err)
+    if field is None:
+        raise err
+    return HTTPException(status_code=status.HTTP_409_CONFLICT,
+                         detail=f"Contact with this {field.replace('_', ' ')} already exists")
+
+
+def _seconds_left(day: date) -> int:
+    return int((datetime.combine(day + timedelta(days=1), time.min) - datetime.now()).total_seconds()) + 1
+
+
+@router.get("/", response_model=ContactFieldsPage)  # , dependencies=[Depends(access_get)])
+async def get_contacts(request: Request, limit: int = Query(50, ge=1, le=500),
+                       cursor: Optional[int] = Query(None, ge=0), first_name: Optional[str] = None,
+                       last_name: Optional[str] = None, email: Optional[str] = None,
+                       is_active_contact: Optional[bool] = None,
+                       fields: Optional[tuple[str, ...]] = Depends(contact_fields),
+                       db: AsyncSession = Depends(get_db), current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The get_contacts function returns one page of contacts.
+    Pass the next_cursor of a page as the cursor of the next request to get the following page,
+    next_cursor is None on the last page.
+    With fields only the listed fields are read from the database and returned.
+    Rows are encoded straight to JSON, see src.services.serialization.
+    The ETag of the page is derived from a cheap fingerprint of it, a request with a matching If-None-Match
+    gets 304 Not Modified without the page being read.
+
+    :param request: Request: The request, for its conditional headers
+    :param limit: int: Maximum number of contacts on the page
+    :param cursor: Optional[int]: The next_cursor returned with the previous page
+    :param first_name: Optional[str]: Keep only contacts with this first name
+    :param last_name: Optional[str]: Keep only contacts with this last name
+    :param email: Optional[str]: Keep only the contact with this email
+    :param is_active_contact: Optional[bool]: Keep only active or only inactive contacts
+    :param fields: Optional[tuple[str, ...]]: The fields to return, all of them if None
+    :param db: AsyncSession: Pass in a database session to the function
+    :param current_user: User: Tell the function that we expect a user to be passed in, but we don't care what it is
+    :return: A page of contacts and the cursor of the next page
+    """
+    filters = dict(first_name=first_name, last_name=last_name, email=email, is_active_contact=is_active_contact)
+    fingerprint = await repository_contacts.get_contacts_fingerprint(db, current_user, limit + 1, cursor, **filters)
+    headers = etag.validators(etag.make_etag("contacts", request.url.query, *fingerprint), fingerprint.max_updated_at)
+    if etag.is_not_modified(request, headers):
+        return etag.not_modified(headers)
+
+    contacts = await repository_contacts.get_contacts(db, current_user, limit + 1, cursor, fields=fields,
+                                                      **filters)
+    next_cursor = None
+    if len(contacts) > limit:
+        contacts = contacts[:limit]
+        next_cursor = contacts[-1].id
+    return json_response({"items": row_dicts(contacts), "next_cursor": next_cursor}, headers=headers)
+
+
+@router.get("/birthday", response_model=List[ContactResponse])
+async def get_contacts_birthday(request: Request, days: int = Query(7, ge=1, le=365),
+                                db: AsyncSession = Depends(get_db),
+                                current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The get_contacts_birthday function returns a list of contacts whose birthday is within the next days.
+    The response is cached for the rest of the day, or until a contact changes.
+
+    :param request: Request: The request, for the cache key
+    :param days: int: The size of the window in days, 7 by default
+    :param db: AsyncSession: Get the database session
+    :param current_user: User: Get the current user
+    :return: Contacts whose birthday is within the next days, the soonest first
+    """
+    today = date.today()
+    key = response_cache.key(request.url.path, request.query_params, current_user.id, today)
+    cached = await response_cache.get(key)
+    if cached is not None:
+        return _cached_response(request, cached)
+    contacts = await repository_contacts.get_contacts_birthday(days, current_user, db, today=today)
+    if not contacts:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found!")
+    return await _cache(key, rows_response(contacts), [repository_contacts.contacts_tag(current_user)],
+                        ttl=_seconds_left(today))
+
+
+@router.get("/search", response_model=List[ContactResponse])
+async def search_contacts(q: str = Query(min_length=1, max_length=100), limit: int = Query(20, ge=1, le=100),
+                          offset: int = Query(0, ge=0, le=1000), db: AsyncSession = Depends(get_db),
+                          current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The search_contacts function finds contacts by the beginning of their first name, last name, email or nick,
+    for example 'dmy os' finds Dmytro Oseledko. The best matches come first.
+
+    :param q: str: The search query
+    :param limit: int: Maximum number of contacts to return
+    :param offset: int: Number of best matches to skip
+    :param db: AsyncSession: Get the database session
+    :param current_user: User: Get the current user from the auth_service
     :return: A list of contacts
     """
-    contacts = await repository_contacts.get_contacts(db)
-    return contacts
+    contacts = await repository_contacts.search_contacts(q, limit, offset, current_user, db)
+    return rows_response(contacts)
+
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_contacts(file_format: str = Query("ndjson", alias="format", regex="^(csv|ndjson)$"),
+                          db: AsyncSession = Depends(get_db),
+                          current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The export_contacts function streams every contact as NDJSON or CSV.
+    Rows are read from a server-side cursor and written out batch by batch,
+    so memory use does not grow with the number of contacts.
+
+    :param file_format: str: 'ndjson' (default) or 'csv'
+    :param db: AsyncSession: Get the database session
+    :param current_user: User: Get the current user from the auth_service
+    :return: A streaming response with the contacts
+    """
+    return StreamingResponse(contact_export.EXPORTERS[file_format](db, current_user),
+                             media_type=contact_export.MEDIA_TYPES[file_format],
+                             headers={"Content-Disposition": f'attachment; filename="contacts.{file_format}"'})
+
+
+def _batch_results(contact_ids: list[int], done: list[int]) -> list[dict]:
+    done = set(done)
+    return [{"id": contact_id, "status": "ok" if contact_id in done else "not_found"} for contact_id in contact_ids]
+
+
+@router.get("/batch", response_model=List[ContactBatchResult])
+async def get_contacts_batch(ids: List[int] = Query(min_items=1, max_items=1000), db: AsyncSession = Depends(get_db),
+                             current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The get_contacts_batch function returns the contacts with the given ids, read in one query.
+
+    :param ids: List[int]: The ids of the contacts
+    :param db: AsyncSession: Get the database session
+    :param current_user: User: Get the current user from the auth_service
+    :return: For each id, its status ('ok' or 'not_found') and the contact
+    """
+    contacts = await repository_contacts.get_contacts_by_ids(ids, current_user, db)
+    contacts = {contact.id: contact for contact in contacts}
+    return [{"id": contact_id, "status": "ok", "contact": contacts[contact_id]} if contact_id in contacts
+            else {"id": contact_id, "status": "not_found"} for contact_id in ids]
+
+
+@router.patch("/batch", response_model=List[ContactBatchResult])
+async def update_contacts_batch(body: List[ContactBatchPatch] = Body(min_items=1, max_items=1000),
+                                db: AsyncSession = Depends(get_db),
+                                current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The update_contacts_batch function applies partial updates to many contacts in one transaction.
+    Only the fields present in a patch are changed. A patch that would give a contact the email,
+    phone number or nick of another contact is left out and reported as a conflict.
+
+    :param body: List[ContactBatchPatch]: The id of each contact and the fields to change
+    :param db: AsyncSession: Get the database session
+    :param current_user: User: Get the current user from the auth_service
+    :return: For each patch, the id and its status ('ok', 'conflict' or 'not_found')
+    """
+    statuses = await repository_contacts.update_many(body, current_user, db)
+    return [{"id": patch.id, "status": statuses.get(patch.id, "not_found")} for patch in body]
 
 
-@router.get("/{contact_id}", response_model=ContactResponse)
-async def get_contact(contact_id: int = Path(ge=1), db: Session = Depends(get_db),
-                      _: User = Depends(auth_service.get_current_user)):
+@router.patch("/batch/is_active_contact", response_model=List[ContactBatchResult])
+async def set_is_active_contact_batch(body: ContactBatchActiveModel, db: AsyncSession = Depends(get_db),
+                                      current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The set_is_active_contact_batch function sets the active status of many contacts with one statement.
+
+    :param body: ContactBatchActiveModel: The ids of the contacts and the new active status
+    :param db: AsyncSession: Get the database session
+    :param current_user: User: Get the current user from the auth_service
+    :return: For each id, its status ('ok' or 'not_found')
+    """
+    updated = await repository_contacts.set_is_active_contact_many(body, current_user, db)
+    return _batch_results(body.ids, updated)
+
+
+@router.delete("/batch", response_model=List[ContactBatchResult])
+async def delete_contacts_batch(ids: List[int] = Query(min_items=1, max_items=1000),
+                                db: AsyncSession = Depends(get_db),
+                                current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The delete_contacts_batch function deletes many contacts with one statement.
+
+    :param ids: List[int]: The ids of the contacts
+    :param db: AsyncSession: Get the database session
+    :param current_user: User: Get the current user from the auth_service
+    :return: For each id, its status ('ok' or 'not_found')
+    """
+    removed = await repository_contacts.remove_many(ids, current_user, db)
+    return _batch_results(ids, removed)
+
+
+@router.get("/{contact_id}", response_model=ContactFieldsResponse)
+async def get_contact(request: Request, contact_id: int = Path(ge=1),
+                      fields: Optional[tuple[str, ...]] = Depends(contact_fields),
+                      db: AsyncSession = Depends(get_db), current_user: User = Depends(auth_service.get_current_user)):
     """
     The get_contact function returns a contact by its ID.
+    With fields only the listed fields are read from the database and returned.
+    The ETag is derived from the version of the contact, which every write bumps, and Last-Modified from updated_at.
+    A request with a matching If-None-Match or If-Modified-Since gets 304 Not Modified after reading only those.
+    The response is cached until the contact changes.
 
+    :param request: Request: The request, for its conditional headers and the cache key
     :param contact_id: int: Get the contact id from the url
-    :param db: Session: Pass the database session to the repository layer
-    :param _: User: Get the current user from the auth_service
+    :param fields: Optional[tuple[str, ...]]: The fields to return, all of them if None
+    :param db: AsyncSession: Pass the database session to the repository layer
+    :param current_user: User: Get the current user from the auth_service
     :return: A contact object, which is defined in the models
     """
-    contact = await repository_contacts.get_contact_by_id(contact_id, db)
+    key = response_cache.key(request.url.path, request.query_params, current_user.id)
+    cached = await response_cache.get(key)
+    if cached is not None:
+        return _cached_response(request, cached)
+
+    version = await repository_contacts.get_contact_version(contact_id, current_user, db)
+    if version is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found!")
+    headers = etag.validators(etag.make_etag("contact", contact_id, version.version, fields), version.updated_at)
+    if etag.is_not_modified(request, headers):
+        return etag.not_modified(headers)
+
+    contact = await repository_contacts.get_contact_by_id(contact_id, current_user, db,
+                                                          fields=fields or tuple(ContactResponse.__fields__))
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found!")
-    return contact
+    return await _cache(key, json_response(contact._asdict(), headers=headers),
+                        [repository_contacts.contact_tag(contact_id)], headers=headers)
 
 
 @router.post("/", response_model=ContactResponse,
              status_code=status.HTTP_201_CREATED)  # ,  dependencies=[Depends(access_create)])
-async def create_contact(body: ContactModel, db: Session = Depends(get_db),
-                         _: User = Depends(auth_service.get_current_user)):
+async def create_contact(body: ContactModel, upsert: bool = False, db: AsyncSession = Depends(get_db),
+                         current_user: User = Depends(auth_service.get_current_user)):
     """
-    The create_contact function creates a new contact in the database.
+    The create_contact function creates a new contact in the database with a single statement.
+    With upsert the contact with the same email is replaced instead of being a conflict.
 
     :param body: ContactModel: Get the data from the request body
-    :param db: Session: Get the database session
-    :param _: User: Get the current user from the auth_service
+    :param upsert: bool: Update the contact with the same email if there is one
+    :param db: AsyncSession: Get the database session
+    :param current_user: User: Get the current user from the auth_service
     :return: A contactmodel object
     """
-    contact = await repository_contacts.get_contact_by_email(body.email, db)
-    if contact:
-        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Email is exists!")
-    contact = await repository_contacts.create(body, db)
-    return contact
+    try:
+        return await repository_contacts.create(body, current_user, db, upsert=upsert)
+    except IntegrityError as err:
+        raise _conflict(err)
+
+
+@router.post("/import", response_model=ContactImportReport)
+async def import_contacts(file: UploadFile = File(),
+                          file_format: Optional[str] = Query(None, alias="format", regex="^(csv|ndjson)$"),
+                          db: AsyncSession = Depends(get_db),
+                          current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The import_contacts function creates contacts from an uploaded CSV (with a header line) or NDJSON file.
+    The file is parsed as it is read and the contacts are inserted in batches,
+    rows that are invalid or clash with existing contacts are reported by line number.
+
+    :param file: UploadFile: The CSV or NDJSON file
+    :param file_format: Optional[str]: 'csv' or 'ndjson', guessed from the file name and type if not given
+    :param db: AsyncSession: Get the database session
+    :param current_user: User: Get the current user from the auth_service
+    :return: The number of inserted and skipped contacts and the errors by line
+    """
+    if file_format is None:
+        is_csv = file.content_type == "text/csv" or (file.filename or "").lower().endswith(".csv")
+        file_format = "csv" if is_csv else "ndjson"
+    return await contact_import.import_contacts(file, file_format, current_user, db)
 
 
 @router.put("/{contact_id}", response_model=ContactResponse)  # , dependencies=[Depends(access_update)])
-async def update_contact(body: ContactModel, contact_id: int = Path(ge=1), db: Session = Depends(get_db),
-                         _: User = Depends(auth_service.get_current_user)):
+async def update_contact(body: ContactModel, contact_id: int = Path(ge=1), db: AsyncSession = Depends(get_db),
+                         current_user: User = Depends(auth_service.get_current_user)):
     """
-    The update_contact function updates a contact in the database.
+    The update_contact function replaces all fields of a contact in the database.
 
     :param body: ContactModel: Get the data from the request body
     :param contact_id: int: Get the contact id from the url
-    :param db: Session: Pass the database session to the repository layer
-    :param _: User: Make sure that the user is logged in
+    :param db: AsyncSession: Pass the database session to the repository layer
+    :param current_user: User: Make sure that the user is logged in
     :return: The updated contact
     """
-    contact = await repository_contacts.update(contact_id, body, db)
+    try:
+        contact = await repository_contacts.update(contact_id, body, current_user, db)
+    except IntegrityError as err:
+        raise _conflict(err)
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found!")
     return contact
 
 
-@router.delete("/{contact_id}", response_model=ContactResponse)  # , dependencies=[Depends(access_delete)])
-async def delete_contact(contact_id: int = Path(ge=1), db: Session = Depends(get_db),
-                         _: User = Depends(auth_service.get_current_user)):
+@router.patch("/{contact_id}", response_model=ContactResponse)
+async def patch_contact(body: ContactPatchModel, contact_id: int = Path(ge=1), db: AsyncSession = Depends(get_db),
+                        current_user: User = Depends(auth_service.get_current_user)):
     """
-    The delete_contact function deletes a contact from the database.
+    The patch_contact function changes only the fields present in the request body, with one UPDATE statement.
 
-    :param contact_id: int: Specify the contact id
-    :param db: Session: Get a database session
-    :param _: User: Check if the user is logged in
-    :return: The contact that has been deleted
+    :param body: ContactPatchModel: The fields to change
+    :param contact_id: int: Get the contact id from the url
+    :param db: AsyncSession: Pass the database session to the repository layer
+    :param current_user: User: Make sure that the user is logged in
+    :return: The updated contact
     """
-    contact = await repository_contacts.remove(contact_id, db)
+    try:
+        contact = await repository_contacts.update(contact_id, body, current_user, db, partial=True)
+    except IntegrityError as err:
+        raise _conflict(err)
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found!")
     return contact
 
 
-# ----------begin------------------------------------------------------------------------------------
-@router.get("/birthday", response_model=List[ContactResponse])
-async def get_contacts_birthday(db: Session = Depends(get_db), _: User = Depends(auth_service.get_current_user)):
-    #  async def get_users_birthday(difference_days: int = 7, db: Session = Depends(get_db)):
+@router.delete("/{contact_id}", response_model=ContactResponse)  # , dependencies=[Depends(access_delete)])
+async def delete_contact(contact_id: int = Path(ge=1), db: AsyncSession = Depends(get_db),
+                         current_user: User = Depends(auth_service.get_current_user)):
     """
-    The get_contacts_birthday function returns a list of contacts whose birthday is within the next 7 days.
-        The function takes no arguments and returns a list of Contact objects.
+    The delete_contact function deletes a contact from the database.
 
-    :param db: Session: Get the database session
-    :param _: User: Get the current user
-    :return: Contacts whose birthday is within the next 7 days
+    :param contact_id: int: Specify the contact id
+    :param db: AsyncSession: Get a database session
+    :param current_user: User: Check if the user is logged in
+    :return: The contact that has been deleted
     """
-    difference_days = 7 + 1
-    present_day = datetime.now()
-
-    contacts = []
-    all_contacts = await repository_contacts.get_contacts(db)
-
-    for contact in all_contacts:
-        if contact.birthday is None:
-            continue
-        birthday_contact = datetime.strptime(contact.birthday, '%d-%m-%Y')
-        birthday_contact_current_year = birthday_contact.replace(year=present_day.year)
-        delta_birthday = (birthday_contact_current_year - present_day).days
-        if 0 < delta_birthday < difference_days:
-            contacts.append(contact)
-
-    if not bool(contacts):
+    contact = await repository_contacts.remove(contact_id, current_user, db)
+    if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found!")
-    return contacts
+    return contact
 
 
 @router.get("/first_name/{first_name}", response_model=List[ContactResponse])
-async def get_contacts_by_first_name(first_name: str, db: Session = Depends(get_db),
-                                     _: User = Depends(auth_service.get_current_user)):
+async def get_contacts_by_first_name(request: Request, first_name: str, db: AsyncSession = Depends(get_db),
+                                     current_user: User = Depends(auth_service.get_current_user)):
     """
     The get_contacts_by_first_name function returns a list of contacts with the given first name.
         If no contact is found, it will return an HTTP 404 error.
+        The response is cached until a contact changes.
 
+    :param request: Request: The request, for the cache key
     :param first_name: str: Specify the first name of a contact
-    :param db: Session: Pass the database session to the function
-    :param _: User: Get the current user from the auth_service
+    :param db: AsyncSession: Pass the database session to the function
+    :param current_user: User: Get the current user from the auth_service
     :return: A list of contacts
     """
-    contacts = await repository_contacts.get_contacts_by_first_name(first_name, db)
+    key = response_cache.key(request.url.path, None, current_user.id)
+    cached = await response_cache.get(key)
+    if cached is not None:
+        return _cached_response(request, cached)
+    contacts = await repository_contacts.get_contacts_by_first_name(first_name, current_user, db)
     if contacts is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found!")
-    return contacts
+    return await _cache(key, rows_response(contacts), [repository_contacts.contacts_tag(current_user)])
 
 
 @router.get("/last_name/{last_name}", response_model=List[ContactResponse])
-async def get_contacts_by_last_name(last_name: str, db: Session = Depends(get_db),
-                                    _: User = Depends(auth_service.get_current_user)):
+async def get_contacts_by_last_name(request: Request, last_name: str, db: AsyncSession = Depends(get_db),
+                                    current_user: User = Depends(auth_service.get_current_user)):
     """
     The get_contacts_by_last_name function returns a list of contacts with the given last name.
+    The response is cached until a contact changes.
 
+    :param request: Request: The request, for the cache key
     :param last_name: str: Specify the last name of the contact to be retrieved
-    :param db: Session: Pass a database session to the function
-    :param _: User: Make sure that the user is logged in
+    :param db: AsyncSession: Pass a database session to the function
+    :param current_user: User: Make sure that the user is logged in
     :return: A list of contacts with the given last name
     """
-    contacts = await repository_contacts.get_contacts_by_last_name(last_name, db)
-    if contact is None:
+    key = response_cache.key(request.url.path, None, current_user.id)
+    cached = await response_cache.get(key)
+    if cached is not None:
+        return _cached_response(request, cached)
+    contacts = await repository_contacts.get_contacts_by_last_name(last_name, current_user, db)
+    if contacts is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found!")
-    return contacts
+    return await _cache(key, rows_response(contacts), [repository_contacts.contacts_tag(current_user)])
 
 
 @router.get("/email/{email}", response_model=ContactResponse)
-async def get_contact_by_email(body: ContactModel, db: Session = Depends(get_db),
-                               _: User = Depends(auth_service.get_current_user)):
+async def get_contact_by_email(body: ContactModel, db: AsyncSession = Depends(get_db),
+                               current_user: User = Depends(auth_service.get_current_user)):
     """
     The get_contact_by_email function is used to retrieve a contact by email.
         The function takes in the body of the request, which contains an email address, and uses that to query for a contact.
         If no contact is found with that email address, then it returns an HTTP 404 error.
 
     :param body: ContactModel: Get the contact's email from the request body
-    :param db: Session: Pass the database session to the function
-    :param _: User: Check if the user is authenticated
+    :param db: AsyncSession: Pass the database session to the function
+    :param current_user: User: Check if the user is authenticated
     :return: The contact object with the given email
     """
-    contact = await repository_contacts.get_contact_by_email(body.email, db)
+    contact = await repository_contacts.get_contact_by_email(body.email, current_user, db)
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found!")
     return contact
@@ -193,7 +457,8 @@ async def get_contact_by_email(body: ContactModel, db: Session = Depends(get_db)
 
 @router.patch("/{contact_id}/is_active_contact", response_model=ContactResponse)
 async def set_is_active_contact(body: ContactActiveModel, contact_id: int = Path(ge=1),
-                                db: Session = Depends(get_db), _: User = Depends(auth_service.get_current_user)):
+                                db: AsyncSession = Depends(get_db),
+                                current_user: User = Depends(auth_service.get_current_user)):
     """
     The set_is_active_contact function is used to set the active status of a contact.
         The function takes in an id and a body, which contains the new active status.
@@ -201,11 +466,11 @@ async def set_is_active_contact(body: ContactActiveModel, contact_id: int = Path
 
     :param body: ContactActiveModel: Get the data from the request body
     :param contact_id: int: Get the contact id from the url
-    :param db: Session: Pass the database session to the function
-    :param _: User: Check if the user is logged in
+    :param db: AsyncSession: Pass the database session to the function
+    :param current_user: User: Check if the user is logged in
     :return: A contactactivemodel object
     """
-    contact = await repository_contacts.set_is_active_contact(contact_id, body, db)
+    contact = await repository_contacts.set_is_active_contact(contact_id, body, current_user, db)
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found!")
     return contact
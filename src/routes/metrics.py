@@ -0,0 +1,43 @@
+from fastapi import APIRouter, Depends
+
+from src.database.db import engine, pool_metrics
+from src.services.auth import auth_service
+from src.services.cache import response_cache
+from src.services.hashing import password_hasher
+from src.services.timing import TimedRoute
+
+# The metrics tell how loaded the service is, they are only shown to signed in users.
+router = APIRouter(prefix="/metrics", tags=["metrics"], route_class=TimedRoute,
+                   dependencies=[Depends(auth_service.get_current_user)])
+
+
+@router.get("/pool")
+async def get_pool_metrics():
+    """
+    The get_pool_metrics function returns the state of the database connection pool
+    and how long requests waited to check a connection out of it.
+
+    :return: A dictionary of pool metrics
+    """
+    return pool_metrics.snapshot(engine.pool)
+
+
+@router.get("/hashing")
+async def get_hashing_metrics():
+    """
+    The get_hashing_metrics function returns how busy the password hashing pool is
+    and how many requests are queued for it.
+
+    :return: A dictionary of password hashing metrics
+    """
+    return password_hasher.snapshot()
+
+
+@router.get("/cache")
+async def get_cache_metrics():
+    """
+    The get_cache_metrics function returns the hits and misses of the response cache in this worker.
+
+    :return: A dictionary of response cache metrics
+    """
+    return response_cache.snapshot()
@@ -1,16 +1,17 @@
 from fastapi import APIRouter, Depends, status, UploadFile, File, Request, Form
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.db import get_db
 from src.database.models import User
 from src.repository import users as repository_users
 from src.services.auth import auth_service
+from src.services.timing import TimedRoute
 from src.services.upload_avatar import UploadService
 from src.schemas import UserResponse
 
-router = APIRouter(prefix="/users", tags=["users"])
+router = APIRouter(prefix="/users", tags=["users"], route_class=TimedRoute)
 templates = Jinja2Templates(directory='templates')
 
 
@@ -57,13 +58,13 @@ async def root(request: Request, email=Form(), text=Form()):
 
 @router.patch('/avatar', response_model=UserResponse)
 async def update_avatar_user(avatar: UploadFile = File(), current_user: User = Depends(auth_service.get_current_user),
-                             db: Session = Depends(get_db)):
+                             db: AsyncSession = Depends(get_db)):
     """
     The update_avatar_user function updates the avatar of a user.
 
     :param avatar: UploadFile: Get the file from the request
     :param current_user: User: Get the current user
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :return: A user object
     """
     public_id = UploadService.create_name_avatar(current_user.email, 'web10')
@@ -1,10 +1,21 @@
-from typing import Optional
+from typing import List, Optional
 
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, EmailStr, Field, root_validator, validator
 
 # from src.database.models import Role
 
 
+def normalize_email(email: str) -> str:
+    """
+    The normalize_email function brings an email address to the form it is stored and looked up in.
+    Addresses are compared case-insensitively, so Foo@x.com and foo@x.com are the same user or contact.
+
+    :param email: str: The email address
+    :return: The address in lower case
+    """
+    return email.lower()
+
+
 class ContactModel(BaseModel):
 
     first_name: str = Field('Dmytro', min_length=3, max_length=25)
@@ -16,11 +27,47 @@ class ContactModel(BaseModel):
     is_active_contact: Optional[bool] = True
     description: str = Field('description')
 
+    _normalize_email = validator("email", allow_reuse=True)(normalize_email)
+
 
 class ContactActiveModel(BaseModel):
     is_active_contact: bool = True
 
 
+class ContactPatchModel(BaseModel):
+    first_name: Optional[str] = Field(None, min_length=3, max_length=25)
+    last_name: Optional[str] = Field(None, min_length=3, max_length=25)
+    email: Optional[EmailStr] = None
+    phone_number: Optional[str] = None
+    birthday: Optional[str] = None
+    nick: Optional[str] = None
+    is_active_contact: Optional[bool] = None
+    description: Optional[str] = None
+
+    @validator("*", pre=True)
+    def not_null(cls, value):
+        if value is None:
+            raise ValueError("may be left out but not null")
+        return value
+
+    _normalize_email = validator("email", allow_reuse=True)(normalize_email)
+
+
+class ContactBatchPatch(ContactPatchModel):
+    id: int = Field(ge=1)
+
+    @root_validator(skip_on_failure=True)
+    def not_empty(cls, values):
+        # Fields can't be set to null, so a field that is None was left out.
+        if all(value is None for name, value in values.items() if name != "id"):
+            raise ValueError("a patch must change at least one field besides id")
+        return values
+
+
+class ContactBatchActiveModel(ContactActiveModel):
+    ids: List[int] = Field(min_items=1, max_items=1000)
+
+
 # class CatModel(BaseModel):
 #     nick: str = Field('Barsik', min_length=3, max_length=16)
 #     age: int = Field(1, ge=1, le=30)
@@ -45,6 +92,43 @@ class ContactResponse(BaseModel):
         orm_mode = True
 
 
+class ContactFieldsResponse(BaseModel):
+    id: Optional[int] = None
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    email: Optional[EmailStr] = None
+    phone_number: Optional[str] = None
+    birthday: Optional[str] = None
+    nick: Optional[str] = None
+    is_active_contact: Optional[bool] = None
+    description: Optional[str] = None
+
+    class Config:
+        orm_mode = True
+
+
+class ContactFieldsPage(BaseModel):
+    items: List[ContactFieldsResponse]
+    next_cursor: Optional[int] = None
+
+
+class ContactBatchResult(BaseModel):
+    id: int
+    status: str
+    contact: Optional[ContactResponse] = None
+
+
+class ContactImportError(BaseModel):
+    line: int
+    detail: str
+
+
+class ContactImportReport(BaseModel):
+    inserted: int = 0
+    skipped: int = 0
+    errors: List[ContactImportError] = []
+
+
 # class CatResponse(BaseModel):
 #     id: int = 1
 #     nick: str = 'Barsik'
@@ -62,6 +146,8 @@ class UserModel(BaseModel):
     email: EmailStr
     password: str = Field(min_length=6, max_length=8)
 
+    _normalize_email = validator("email", allow_reuse=True)(normalize_email)
+
 
 class UserResponse(BaseModel):
     id: int
@@ -0,0 +1,108 @@
+import json
+import logging
+import queue
+import random
+import re
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+from fastapi import status
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps({"time": self.formatTime(record), "level": record.levelname, **record.access})
+
+
+class DroppingQueueHandler(QueueHandler):
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class AccessLog:
+    def __init__(self, sample_rate: float, max_queue: int, handler: logging.Handler | None = None):
+        """
+        The AccessLog writes one JSON line per sampled request.
+        Requests only put the record on a bounded queue, a background thread does the writing,
+        and records are dropped rather than blocking the request when the queue is full.
+
+        :param self: Represent the instance of the class
+        :param sample_rate: float: Share of successful requests that are logged, errors are always logged
+        :param max_queue: int: Number of records allowed to wait for the writer
+        :param handler: logging.Handler | None: Where the records are written, stdout by default
+        """
+        self.sample_rate = sample_rate
+        self.handler = DroppingQueueHandler(queue.Queue(max_queue))
+        self.logger = logging.getLogger("access")
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        self.logger.addHandler(self.handler)
+        if handler is None:
+            handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(JsonFormatter())
+        self.listener = QueueListener(self.handler.queue, handler)
+
+    def start(self):
+        self.listener.start()
+
+    def stop(self):
+        self.listener.stop()
+
+    def log(self, status_code: int, **fields):
+        """
+        The log function queues an access record if the request is sampled.
+
+        :param self: Represent the instance of the class
+        :param status_code: int: The status code of the response
+        :param fields: The other fields of the record
+        :return: None
+        """
+        if status_code < 500 and random.random() >= self.sample_rate:
+            return
+        self.logger.info("access", extra={"access": {"status": status_code, **fields}})
+
+
+def compile_user_agent_ban(patterns: list[str]) -> re.Pattern | None:
+    """
+    The compile_user_agent_ban function joins the banned user-agent patterns into one case-insensitive regex,
+    so a request is checked with a single search.
+
+    :param patterns: list[str]: Regular expressions of banned user agents
+    :return: The compiled pattern, or None if nothing is banned
+    """
+    if not patterns:
+        return None
+    return re.compile("|".join(f"(?:{pattern})" for pattern in patterns), re.IGNORECASE)
+
+
+class UserAgentBanMiddleware:
+    def __init__(self, app: ASGIApp, pattern: re.Pattern | None):
+        """
+        The UserAgentBanMiddleware is a pure ASGI middleware that checks the user-agent header of an incoming request.
+        If it matches the ban pattern, it returns a 403 Forbidden response, otherwise it passes the request on.
+
+        :param self: Represent the instance of the class
+        :param app: ASGIApp: The wrapped application
+        :param pattern: re.Pattern | None: The pattern from compile_user_agent_ban
+        """
+        self.app = app
+        self.pattern = pattern
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http" and self.pattern is not None:
+            user_agent = Headers(scope=scope).get("user-agent", "")
+            if self.pattern.search(user_agent):
+                response = JSONResponse(status_code=status.HTTP_403_FORBIDDEN, content={"detail": "You are banned"})
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
@@ -1,50 +1,58 @@
-import pickle
+import hashlib
+import logging
+import time
 from typing import Optional
 
-import redis
 from jose import JWTError, jwt
+from redis.exceptions import RedisError
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
-from passlib.context import CryptContext
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.db import get_db
 from src.repository import users as repository_users
+from src.services.cache import TTLCache, invalidation_bus, redis_client, user_cache
+from src.services.hashing import password_hasher
+from src.services.timing import measure
 from src.conf.config import settings
 from src.conf import messages
 
 
 class Auth:
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
     SECRET_KEY = settings.jwt_secret_key
     ALGORITHM = settings.jwt_algorithm
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
-    r = redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0)
+    r = redis_client
+    verified_tokens = TTLCache(settings.jwt_cache_maxsize, settings.jwt_cache_ttl)
+    revoked_tokens = TTLCache(settings.jwt_cache_maxsize, settings.jwt_cache_ttl)
 
-    def verify_password(self, plain_password, hashed_password):
+    def __init__(self):
+        invalidation_bus.register("token", self._forget_token)
+
+    async def verify_password(self, plain_password, hashed_password):
         """
         The verify_password function takes a plain-text password and hashed
-        password as arguments. It then uses the pwd_context object to verify that the
-        plain-text password matches the hashed one.
+        password as arguments. It then checks in the password hashing pool that the
+        plain-text password matches the hashed one, without blocking the event loop.
 
         :param self: Make the method a bound method, which means that the first parameter will be
         :param plain_password: Pass in the password that is entered by the user
         :param hashed_password: Store the hashed password in the database
         :return: A boolean value
         """
-        return self.pwd_context.verify(plain_password, hashed_password)
+        return await password_hasher.verify(plain_password, hashed_password)
 
-    def get_password_hash(self, password: str):
+    async def get_password_hash(self, password: str):
         """
         The get_password_hash function takes a password as input and returns the hash of that password.
-        The hash is generated using the pwd_context object, which is an instance of Flask-Bcrypt's Bcrypt class.
+        The bcrypt hash is computed in the password hashing pool, without blocking the event loop.
 
         :param self: Represent the instance of the class
         :param password: str: Pass in the password that is being hashed
         :return: A hash of the password
         """
-        return self.pwd_context.hash(password)
+        return await password_hasher.hash(password)
 
     # define a function to generate a new access token
     async def create_access_token(self, data: dict, expires_delta: Optional[float] = None):
@@ -110,7 +118,66 @@ class Auth:
         except JWTError:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate credentials')
 
-    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    @staticmethod
+    def token_digest(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def _forget_token(self, message: str):
+        digest, _, expire = message.partition(":")
+        self.verified_tokens.pop(digest)
+        self.revoked_tokens.set(digest, True, ttl=max(float(expire) - time.time(), 0))
+
+    async def verify_access_token(self, token: str) -> dict:
+        """
+        The verify_access_token function returns the claims of a token.
+        Verified claims are kept in process, keyed by a digest of the token, for at most jwt_cache_ttl seconds,
+        so a repeated token skips signature verification and parsing. A token is checked against the revocation list
+        in Redis before it is cached, and rejected if Redis can't be reached, since it might have been revoked.
+        A token revoked by another worker is dropped from the cache through the bus, or when its entry expires.
+
+        :param self: Represent the instance of the class
+        :param token: str: The encoded token
+        :return: The claims of the token
+        """
+        digest = self.token_digest(token)
+        if self.revoked_tokens.get(digest):
+            raise JWTError("Token has been revoked")
+        payload = self.verified_tokens.get(digest)
+        if payload is None:
+            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+            try:
+                revoked = await self.r.exists(f"revoked:{digest}")
+            except RedisError as err:
+                logging.warning(err)
+                raise JWTError("Token revocation could not be checked")
+            ttl = payload["exp"] - time.time()
+            if revoked:
+                self.revoked_tokens.set(digest, True, ttl=ttl)
+                raise JWTError("Token has been revoked")
+            self.verified_tokens.set(digest, payload, ttl=min(ttl, self.verified_tokens.ttl))
+        return payload
+
+    async def revoke_token(self, token: str):
+        """
+        The revoke_token function makes a token invalid before it expires.
+        The token is added to the revocation list in Redis until it expires
+        and dropped from the verified token cache here and, through the bus, in the other workers.
+
+        :param self: Represent the instance of the class
+        :param token: str: The encoded token
+        :return: None
+        """
+        payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+        digest = self.token_digest(token)
+        message = f"{digest}:{payload['exp']}"
+        self._forget_token(message)
+        try:
+            await self.r.set(f"revoked:{digest}", 1, exat=payload["exp"])
+        except RedisError as err:
+            logging.warning(err)
+        await invalidation_bus.publish("token", message)
+
+    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
         """
         The get_current_user function is a dependency that will be used in the
             protected endpoints. It takes a token as an argument and returns the user
@@ -118,37 +185,35 @@ class Auth:
 
         :param self: Access the class attributes
         :param token: str: Get the token from the authorization header
-        :param db: Session: Get the database connection from the dependency
+        :param db: AsyncSession: Get the database connection from the dependency
         :return: The user object if the token is valid
         """
-        credentials_exception = HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-
-        try:
-            # Decode JWT
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
-            if payload['scope'] == 'access_token':
-                email = payload["sub"]
-                if email is None:
+        with measure("auth"):
+            credentials_exception = HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Could not validate credentials",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+
+            try:
+                # Decode JWT
+                payload = await self.verify_access_token(token)
+                if payload['scope'] == 'access_token':
+                    email = payload["sub"]
+                    if email is None:
+                        raise credentials_exception
+                else:
                     raise credentials_exception
-            else:
+            except JWTError as e:
                 raise credentials_exception
-        except JWTError as e:
-            raise credentials_exception
 
-        user = self.r.get(f"user:{email}")
-        if user is None:
-            user = await repository_users.get_user_by_email(email, db)
+            user = await user_cache.get(email)
             if user is None:
-                raise credentials_exception
-            self.r.set(f"user:{email}", pickle.dumps(user))
-            self.r.expire(f"user:{email}", 900)
-        else:
-            user = pickle.loads(user)
-        return user
+                user = await repository_users.get_user_by_email(email, db)
+                if user is None:
+                    raise credentials_exception
+                await user_cache.set(user)
+            return user
 
     def create_email_token(self, data: dict):
         """
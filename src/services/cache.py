@@ -0,0 +1,433 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Iterable, Mapping, NamedTuple
+from urllib.parse import urlencode
+
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+
+from src.conf.config import settings
+from src.database.models import User
+from src.services.timing import measure
+
+
+class TimedRedis(redis.Redis):
+    async def execute_command(self, *args, **options):
+        with measure("redis"):
+            return await super().execute_command(*args, **options)
+
+
+redis_client = TimedRedis(host=settings.redis_host, port=settings.redis_port, db=0)
+
+
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float):
+        """
+        The TTLCache is a small in-process LRU cache whose entries expire after ttl seconds.
+        It is not shared between workers, so it only fronts data that may be slightly stale.
+
+        :param self: Represent the instance of the class
+        :param maxsize: int: Number of entries kept before the least recently used ones are evicted
+        :param ttl: float: Default lifetime of an entry in seconds
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        """
+        The get function returns the cached value for the key, or default if it is missing or expired.
+
+        :param self: Represent the instance of the class
+        :param key: The cache key
+        :param default: Returned when there is no live entry
+        :return: The cached value
+        """
+        item = self._data.get(key)
+        if item is None:
+            return default
+        value, expires_at = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl: float | None = None):
+        """
+        The set function stores the value under the key and evicts the least recently used entries
+        when the cache grows over maxsize.
+
+        :param self: Represent the instance of the class
+        :param key: The cache key
+        :param value: The value to cache
+        :param ttl: float | None: Lifetime of this entry in seconds, the cache default if None
+        :return: None
+        """
+        self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key):
+        """
+        The pop function removes the key from the cache if it is there.
+
+        :param self: Represent the instance of the class
+        :param key: The cache key
+        :return: None
+        """
+        self._data.pop(key, None)
+
+    def evict(self, predicate):
+        """
+        The evict function removes every entry whose value matches the predicate, expired or not.
+
+        :param self: Represent the instance of the class
+        :param predicate: Called with each cached value, entries it returns True for are removed
+        :return: None
+        """
+        for key in [key for key, (value, _) in self._data.items() if predicate(value)]:
+            del self._data[key]
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class InvalidationBus:
+    def __init__(self, client: redis.Redis, channel: str, enabled: bool):
+        """
+        The InvalidationBus broadcasts cache evictions over Redis pub/sub,
+        so in-process caches of the other workers drop entries that were changed here.
+
+        :param self: Represent the instance of the class
+        :param client: redis.Redis: The async Redis client
+        :param channel: str: The pub/sub channel evictions are sent on
+        :param enabled: bool: Whether evictions are published at all
+        """
+        self.r = client
+        self.channel = channel
+        self.enabled = enabled
+        self._handlers = {}
+
+    def register(self, kind: str, handler):
+        """
+        The register function sets the callback that evicts one key of the given kind from the local cache.
+
+        :param self: Represent the instance of the class
+        :param kind: str: The kind of key, for example 'user'
+        :param handler: Called with the key when an eviction of this kind is received
+        :return: None
+        """
+        self._handlers[kind] = handler
+
+    async def publish(self, kind: str, key: str):
+        """
+        The publish function tells every worker to evict the key. A Redis failure is logged and ignored.
+
+        :param self: Represent the instance of the class
+        :param kind: str: The kind of key
+        :param key: str: The key to evict
+        :return: None
+        """
+        if not self.enabled:
+            return
+        try:
+            await self.r.publish(self.channel, f"{kind}:{key}")
+        except RedisError as err:
+            logging.warning(err)
+
+    def dispatch(self, message: str):
+        kind, _, key = message.partition(":")
+        handler = self._handlers.get(kind)
+        if handler is not None:
+            handler(key)
+
+    async def listen(self):
+        """
+        The listen function subscribes to the channel and evicts keys until it is cancelled.
+        It resubscribes after a Redis failure.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        while True:
+            try:
+                async with self.r.pubsub(ignore_subscribe_messages=True) as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    async for message in pubsub.listen():
+                        self.dispatch(message["data"].decode())
+            except RedisError as err:
+                logging.warning(err)
+                await asyncio.sleep(1)
+
+
+invalidation_bus = InvalidationBus(redis_client, settings.cache_invalidation_channel,
+                                   settings.cache_invalidation_pubsub)
+
+
+class UserCache:
+    FIELDS = ("id", "username", "email", "avatar", "confirmed")
+    # Left in place of an invalidated snapshot for a few seconds, so a snapshot read before the change
+    # can't be cached again after it, see set.
+    TOMBSTONE = b"-"
+    TOMBSTONE_TTL = 5
+
+    def __init__(self, client: redis.Redis, ttl: int, local_maxsize: int, local_ttl: float,
+                 bus: InvalidationBus | None = None):
+        """
+        The UserCache keeps a snapshot of the columns of a user that authenticated requests need,
+        in an in-process TTLCache in front of Redis.
+
+        :param self: Represent the instance of the class
+        :param client: redis.Redis: The async Redis client
+        :param ttl: int: Lifetime of a snapshot in Redis in seconds
+        :param local_maxsize: int: Number of snapshots kept in process
+        :param local_ttl: float: Lifetime of a snapshot in process in seconds
+        :param bus: InvalidationBus | None: Broadcasts invalidations to the other workers
+        """
+        self.r = client
+        self.ttl = ttl
+        self.local = TTLCache(local_maxsize, local_ttl)
+        self.bus = bus
+        if bus is not None:
+            bus.register("user", self.local.pop)
+
+    @staticmethod
+    def key(email: str) -> str:
+        return f"user:{email}"
+
+    async def get(self, email: str) -> User | None:
+        """
+        The get function returns a user built from the cached snapshot, looking in process first and in Redis next.
+        A Redis failure is logged and treated as a miss.
+
+        :param self: Represent the instance of the class
+        :param email: str: The email of the user
+        :return: A user object that is not bound to any session, or None on a miss
+        """
+        snapshot = self.local.get(email)
+        if snapshot is None:
+            try:
+                data = await self.r.get(self.key(email))
+            except RedisError as err:
+                logging.warning(err)
+                return None
+            if data is None or data == self.TOMBSTONE:
+                return None
+            snapshot = json.loads(data)
+            self.local.set(email, snapshot)
+        return User(**snapshot)
+
+    async def set(self, user: User) -> None:
+        """
+        The set function caches a snapshot of the user in process and in Redis with a single SET ... EX NX.
+        NX keeps a snapshot read before a concurrent change from replacing the tombstone invalidate left,
+        in that case it is not cached in process either. If Redis can't be reached it is only cached in process.
+
+        :param self: Represent the instance of the class
+        :param user: User: The user to cache
+        :return: None
+        """
+        snapshot = {field: getattr(user, field) for field in self.FIELDS}
+        try:
+            stored = await self.r.set(self.key(user.email), json.dumps(snapshot), ex=self.ttl, nx=True)
+        except RedisError as err:
+            logging.warning(err)
+            stored = True
+        if stored:
+            self.local.set(user.email, snapshot)
+
+    async def invalidate(self, email: str) -> None:
+        """
+        The invalidate function drops the cached snapshot of the user after the user row has changed,
+        here, in Redis and, through the bus, in the other workers.
+        In Redis the snapshot is replaced by a tombstone that lives TOMBSTONE_TTL seconds, long enough for
+        requests that read the user before the change to finish without caching what they read.
+
+        :param self: Represent the instance of the class
+        :param email: str: The email of the changed user
+        :return: None
+        """
+        self.local.pop(email)
+        try:
+            await self.r.set(self.key(email), self.TOMBSTONE, ex=self.TOMBSTONE_TTL)
+        except RedisError as err:
+            logging.warning(err)
+        if self.bus is not None:
+            await self.bus.publish("user", email)
+
+
+user_cache = UserCache(redis_client, settings.user_cache_ttl, settings.user_cache_local_maxsize,
+                       settings.user_cache_local_ttl, invalidation_bus)
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    headers: dict
+    tags: tuple
+
+
+# Tags never contain spaces, the tags of one invalidation travel over the bus as one space separated message.
+TAG_SEPARATOR = " "
+
+
+class ResponseCache:
+    def __init__(self, client: redis.Redis, ttl: int, local_maxsize: int, local_ttl: float,
+                 bus: InvalidationBus | None = None):
+        """
+        The ResponseCache keeps encoded JSON responses of read endpoints in Redis, with an in-process TTLCache
+        in front of it (local_maxsize=0 turns that tier off).
+        Every entry is stored under tags, such as 'contacts' or 'contact:1', and a write drops all entries of
+        the tags it touched. In Redis each tag is a set of the keys stored under it.
+
+        :param self: Represent the instance of the class
+        :param client: redis.Redis: The async Redis client
+        :param ttl: int: Default lifetime of an entry in Redis in seconds
+        :param local_maxsize: int: Number of entries kept in process
+        :param local_ttl: float: Lifetime of an entry in process in seconds
+        :param bus: InvalidationBus | None: Broadcasts invalidations to the other workers
+        """
+        self.r = client
+        self.ttl = ttl
+        self.local = TTLCache(local_maxsize, local_ttl)
+        self.bus = bus
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        if bus is not None:
+            bus.register("response", lambda message: self._evict_local(message.split(TAG_SEPARATOR)))
+
+    @staticmethod
+    def key(path: str, params: Mapping | None = None, *extra) -> str:
+        """
+        The key function builds the cache key of a response from the route path, the query parameters
+        in a stable order and any extra values the response depends on.
+
+        :param path: str: The path of the request
+        :param params: Mapping | None: The query parameters of the request
+        :param extra: Extra values, such as the current day
+        :return: The cache key
+        """
+        items = params.multi_items() if hasattr(params, "multi_items") else (params or {}).items()
+        return ":".join(["response", f"{path}?{urlencode(sorted(items))}", *map(str, extra)])
+
+    @staticmethod
+    def tag_key(tag: str) -> str:
+        return f"response-tag:{tag}"
+
+    def _evict_local(self, tags: Iterable[str]):
+        tags = frozenset(tags)
+        self.local.evict(lambda cached: not tags.isdisjoint(cached.tags))
+
+    async def get(self, key: str) -> CachedResponse | None:
+        """
+        The get function returns the cached response, looking in process first and in Redis next.
+        A Redis failure is logged and treated as a miss.
+
+        :param self: Represent the instance of the class
+        :param key: str: The cache key
+        :return: The cached response, or None on a miss
+        """
+        cached = self.local.get(key)
+        if cached is not None:
+            self.local_hits += 1
+            return cached
+        try:
+            data = await self.r.get(key)
+        except RedisError as err:
+            logging.warning(err)
+            data = None
+        if data is None:
+            self.misses += 1
+            return None
+        meta, _, body = data.partition(b"\n")
+        meta = json.loads(meta)
+        cached = CachedResponse(body, meta["headers"], tuple(meta["tags"]))
+        self.local.set(key, cached)
+        self.redis_hits += 1
+        return cached
+
+    async def set(self, key: str, body: bytes, tags: Iterable[str], headers: dict | None = None,
+                  ttl: int | None = None) -> None:
+        """
+        The set function caches a response under its tags, in process and in Redis with one pipeline.
+        A response read before a concurrent write may be cached after that write was invalidated,
+        it is served until it expires, so the ttl bounds how stale a response can get.
+
+        :param self: Represent the instance of the class
+        :param key: str: The cache key
+        :param body: bytes: The encoded body of the response
+        :param tags: Iterable[str]: The tags whose invalidation drops this entry
+        :param headers: dict | None: Headers to send with the cached body, such as the ETag
+        :param ttl: int | None: Lifetime of the entry in seconds, at most the cache default
+        :return: None
+        """
+        # Tag sets always live for the default ttl, so they outlive every key they hold.
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        cached = CachedResponse(body, headers or {}, tuple(tags))
+        self.local.set(key, cached, ttl=min(self.local.ttl, ttl))
+        meta = json.dumps({"headers": cached.headers, "tags": cached.tags}).encode()
+        try:
+            async with self.r.pipeline(transaction=False) as pipe:
+                pipe.set(key, meta + b"\n" + body, ex=ttl)
+                for tag in cached.tags:
+                    pipe.sadd(self.tag_key(tag), key)
+                    pipe.expire(self.tag_key(tag), self.ttl)
+                await pipe.execute()
+        except RedisError as err:
+            logging.warning(err)
+
+    async def invalidate(self, *tags: str) -> None:
+        """
+        The invalidate function drops every cached response stored under any of the tags,
+        here, in Redis and, through the bus, in the other workers.
+        However many tags a batch write touches, the local cache is scanned once, Redis is called twice
+        and one message is published.
+
+        :param self: Represent the instance of the class
+        :param tags: str: The tags touched by a write
+        :return: None
+        """
+        self.invalidations += 1
+        self._evict_local(tags)
+        try:
+            tag_keys = [self.tag_key(tag) for tag in tags]
+            async with self.r.pipeline(transaction=False) as pipe:
+                for tag_key in tag_keys:
+                    pipe.smembers(tag_key)
+                members = await pipe.execute()
+            keys = set().union(*members)
+            await self.r.delete(*keys, *tag_keys)
+        except RedisError as err:
+            logging.warning(err)
+        if self.bus is not None:
+            await self.bus.publish("response", TAG_SEPARATOR.join(tags))
+
+    def snapshot(self) -> dict:
+        """
+        The snapshot function returns the hit and miss counters of this worker.
+
+        :param self: Represent the instance of the class
+        :return: A dictionary of cache metrics
+        """
+        lookups = self.local_hits + self.redis_hits + self.misses
+        return {
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.local_hits + self.redis_hits) / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "local_entries": len(self.local),
+        }
+
+
+response_cache = ResponseCache(redis_client, settings.response_cache_ttl, settings.response_cache_local_maxsize,
+                               settings.response_cache_local_ttl, invalidation_bus)
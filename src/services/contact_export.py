@@ -0,0 +1,46 @@
+import csv
+import io
+import json
+from typing import AsyncIterator
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.conf.config import settings
+from src.database.models import User
+from src.repository import contacts as repository_contacts
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+async def export_ndjson(db: AsyncSession, user: User) -> AsyncIterator[str]:
+    """
+    The export_ndjson function yields the contacts of the user as JSON lines, one chunk per batch of rows.
+
+    :param db: AsyncSession: Pass the database session to the repository
+    :param user: User: The owner of the contacts
+    :return: An async iterator of NDJSON chunks
+    """
+    async for rows in repository_contacts.stream_contacts(db, user, settings.contact_export_batch_size):
+        yield "".join(json.dumps(dict(row._mapping), ensure_ascii=False) + "\n" for row in rows)
+
+
+async def export_csv(db: AsyncSession, user: User) -> AsyncIterator[str]:
+    """
+    The export_csv function yields the contacts of the user as CSV with a header line, one chunk per batch of rows.
+
+    :param db: AsyncSession: Pass the database session to the repository
+    :param user: User: The owner of the contacts
+    :return: An async iterator of CSV chunks
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(column.name for column in repository_contacts.CONTACT_COLUMNS)
+    yield buffer.getvalue()
+    async for rows in repository_contacts.stream_contacts(db, user, settings.contact_export_batch_size):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue()
+
+
+EXPORTERS = {"ndjson": export_ndjson, "csv": export_csv}
@@ -0,0 +1,132 @@
+import codecs
+import csv
+import json
+from typing import AsyncIterator
+
+from fastapi import UploadFile
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.conf.config import settings
+from src.database.models import User
+from src.repository import contacts as repository_contacts
+from src.schemas import ContactModel
+
+CHUNK_SIZE = 64 * 1024
+
+
+async def read_lines(file: UploadFile) -> AsyncIterator[str]:
+    """
+    The read_lines function reads the upload chunk by chunk and yields it line by line,
+    so only one chunk of the file is in memory at a time.
+
+    :param file: UploadFile: The uploaded file, utf-8 encoded
+    :return: An async iterator of lines without line endings
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    tail = ""
+    while chunk := await file.read(CHUNK_SIZE):
+        tail += decoder.decode(chunk)
+        *lines, tail = tail.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    tail += decoder.decode(b"", final=True)
+    if tail:
+        yield tail.rstrip("\r")
+
+
+async def parse_ndjson(lines: AsyncIterator[str]) -> AsyncIterator[tuple[int, dict | str]]:
+    """
+    The parse_ndjson function yields one JSON object per non-empty line, or an error message for a broken line.
+
+    :param lines: AsyncIterator[str]: Lines of the file
+    :return: An async iterator of (line number, row or error message)
+    """
+    number = 0
+    async for line in lines:
+        number += 1
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as err:
+            yield number, f"Invalid JSON: {err}"
+            continue
+        yield number, row if isinstance(row, dict) else "Expected a JSON object"
+
+
+async def parse_csv(lines: AsyncIterator[str]) -> AsyncIterator[tuple[int, dict | str]]:
+    """
+    The parse_csv function yields one row per CSV record, keyed by the header of the file.
+    A quoted field may span several lines, a record is complete once its quotes are balanced.
+    Empty fields are left out, so the defaults of ContactModel apply to them.
+
+    :param lines: AsyncIterator[str]: Lines of the file
+    :return: An async iterator of (line number of the record start, row or error message)
+    """
+    header = None
+    record, start, number = [], 0, 0
+    async for line in lines:
+        number += 1
+        if not record:
+            start = number
+        record.append(line)
+        text = "\n".join(record)
+        if text.count('"') % 2:
+            continue
+        record = []
+        if not text.strip():
+            continue
+        values = next(csv.reader([text]))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if len(values) != len(header):
+            yield start, f"Expected {len(header)} fields, got {len(values)}"
+            continue
+        yield start, {name: value for name, value in zip(header, values) if value != ""}
+    if record:
+        yield start, "Unterminated quoted field"
+
+
+async def import_contacts(file: UploadFile, file_format: str, user: User, db: AsyncSession) -> dict:
+    """
+    The import_contacts function validates the rows of an uploaded CSV or NDJSON file with ContactModel
+    and inserts them for the user in batches of multi-row INSERT statements,
+    skipping rows that conflict with existing contacts of the user.
+
+    :param file: UploadFile: The uploaded file
+    :param file_format: str: 'csv' or 'ndjson'
+    :param user: User: The owner of the imported contacts
+    :param db: AsyncSession: Pass the database session to the repository
+    :return: The number of inserted and skipped rows, and the errors by line number
+    """
+    parse = parse_csv if file_format == "csv" else parse_ndjson
+    report = {"inserted": 0, "skipped": 0, "errors": []}
+    batch = []
+
+    async def flush():
+        inserted = set(await repository_contacts.create_many([body for _, body in batch], user, db))
+        for line, body in batch:
+            if body.email in inserted:
+                inserted.discard(body.email)
+                report["inserted"] += 1
+            else:
+                report["skipped"] += 1
+                report["errors"].append({"line": line, "detail": "Contact already exists"})
+        batch.clear()
+
+    async for line, row in parse(read_lines(file)):
+        if isinstance(row, str):
+            report["errors"].append({"line": line, "detail": row})
+            continue
+        try:
+            batch.append((line, ContactModel(**row)))
+        except ValidationError as err:
+            report["errors"].append({"line": line, "detail": str(err)})
+            continue
+        if len(batch) >= settings.contact_import_batch_size:
+            await flush()
+    if batch:
+        await flush()
+    return report
@@ -1,51 +1,341 @@
-from pathlib import Path
+import asyncio
+import json
 import logging
+import uuid
+from contextlib import asynccontextmanager
+from email.message import EmailMessage
+from email.utils import formataddr
+from typing import NamedTuple
 
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from fastapi_mail.errors import ConnectionErrors
-from pydantic import EmailStr
+import aiosmtplib
+import redis.asyncio as redis
+from aiosmtplib import SMTPServerDisconnected
+from redis.exceptions import RedisError
 
-from src.services.auth import auth_service
 from src.conf.config import settings
+from src.services.auth import auth_service
+from src.services.cache import redis_client
+from src.services.mail_templates import MailTemplates, confirmation_context, mail_templates
+
+
+class EmailJob(NamedTuple):
+    id: str
+    template: str
+    recipient: str
+    subject: str
+    context: dict
+    attempts: int = 0
+
+    def payload(self) -> str:
+        # The payload is also the value LREM/ZREM look for, so it must come out the same for the same job.
+        return json.dumps(self._asdict(), sort_keys=True, separators=(",", ":"))
+
+    @classmethod
+    def from_payload(cls, payload: str | bytes) -> "EmailJob":
+        return cls(**json.loads(payload))
+
+
+# Moves the jobs whose retry time has come from the delayed set back to the queue, atomically,
+# so a job is neither lost nor queued twice when several workers promote at the same time.
+_PROMOTE_DUE = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, job in ipairs(due) do
+    redis.call('ZREM', KEYS[1], job)
+    redis.call('LPUSH', KEYS[2], job)
+end
+return #due
+"""
+
+
+class EmailQueue:
+    def __init__(self, client: redis.Redis, name: str, dedupe_ttl: int):
+        """
+        The EmailQueue keeps outbound mail in Redis until a worker has sent it.
+        Jobs are pushed to a list, and a worker moves each job it takes to its own processing list with BLMOVE,
+        so a job taken by a worker that dies is put back when the worker starts again instead of being lost.
+        Failed jobs wait in a sorted set scored by the time of their next attempt,
+        jobs that can't be delivered end in a dead letter list.
+
+        :param self: Represent the instance of the class
+        :param client: redis.Redis: The Redis client
+        :param name: str: The prefix of the keys of the queue
+        :param dedupe_ttl: int: For how many seconds a repeated job with the same dedupe key is dropped
+        """
+        self.client = client
+        self.name = name
+        self.dedupe_ttl = dedupe_ttl
+        self.queue_key = f"{name}:queue"
+        self.delayed_key = f"{name}:delayed"
+        self.dead_key = f"{name}:dead"
+        self._promote_due = client.register_script(_PROMOTE_DUE)
+
+    def processing_key(self, worker: str) -> str:
+        return f"{self.name}:processing:{worker}"
+
+    def dedupe_key(self, key: str) -> str:
+        return f"{self.name}:dedupe:{key}"
+
+    async def enqueue(self, template: str, recipient: str, subject: str, context: dict,
+                      dedupe: str | None = None) -> bool:
+        """
+        The enqueue function adds an email to the queue. It returns as soon as the job is stored in Redis,
+        sending is left to the worker.
+
+        :param self: Represent the instance of the class
+        :param template: str: The file name of the template of the body
+        :param recipient: str: The address the email is sent to
+        :param subject: str: The subject of the email
+        :param context: dict: The variables of the template, must be JSON serializable
+        :param dedupe: str | None: Drop the email if one with the same key was queued within dedupe_ttl
+        :return: True if the email was queued, False if it was a duplicate
+        """
+        if dedupe is not None and not await self.client.set(self.dedupe_key(dedupe), 1, nx=True, ex=self.dedupe_ttl):
+            return False
+        job = EmailJob(uuid.uuid4().hex, template, recipient, subject, context)
+        await self.client.lpush(self.queue_key, job.payload())
+        return True
+
+    async def reserve(self, worker: str, timeout: float) -> EmailJob | None:
+        """
+        The reserve function takes the oldest job off the queue and keeps it in the processing list of the worker
+        until it is acked, retried or buried.
+
+        :param self: Represent the instance of the class
+        :param worker: str: The name of the worker
+        :param timeout: float: How many seconds to wait for a job
+        :return: The job, None if the queue stayed empty or the job taken could not be read
+        """
+        payload = await self.client.blmove(self.queue_key, self.processing_key(worker), timeout, "RIGHT", "LEFT")
+        if payload is None:
+            return None
+        try:
+            return EmailJob.from_payload(payload)
+        except (ValueError, TypeError) as err:
+            # A payload that isn't a job would fail again on every restart, it goes to the dead letter list as it is.
+            logging.error("unreadable email job buried: %s", err)
+            async with self.client.pipeline(transaction=True) as pipe:
+                pipe.lrem(self.processing_key(worker), 1, payload)
+                pipe.lpush(self.dead_key, payload)
+                await pipe.execute()
+            return None
+
+    async def ack(self, worker: str, job: EmailJob) -> None:
+        """
+        The ack function removes a sent job from the processing list of the worker.
+
+        :param self: Represent the instance of the class
+        :param worker: str: The name of the worker
+        :param job: EmailJob: The job that was sent
+        :return: None
+        """
+        await self.client.lrem(self.processing_key(worker), 1, job.payload())
+
+    async def retry(self, worker: str, job: EmailJob, due: float) -> None:
+        """
+        The retry function schedules another attempt of a failed job.
+
+        :param self: Represent the instance of the class
+        :param worker: str: The name of the worker
+        :param job: EmailJob: The job that failed
+        :param due: float: The unix time of the next attempt
+        :return: None
+        """
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.lrem(self.processing_key(worker), 1, job.payload())
+            pipe.zadd(self.delayed_key, {job._replace(attempts=job.attempts + 1).payload(): due})
+            await pipe.execute()
+
+    async def bury(self, worker: str, job: EmailJob) -> None:
+        """
+        The bury function moves a job that can't be delivered to the dead letter list, where it can be inspected.
+
+        :param self: Represent the instance of the class
+        :param worker: str: The name of the worker
+        :param job: EmailJob: The job that failed
+        :return: None
+        """
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.lrem(self.processing_key(worker), 1, job.payload())
+            pipe.lpush(self.dead_key, job._replace(attempts=job.attempts + 1).payload())
+            await pipe.execute()
+
+    async def promote_due(self, now: float, limit: int = 100) -> int:
+        """
+        The promote_due function puts the delayed jobs whose next attempt is due back on the queue.
+
+        :param self: Represent the instance of the class
+        :param now: float: The current unix time
+        :param limit: int: Maximum number of jobs moved at once
+        :return: The number of jobs moved
+        """
+        return await self._promote_due(keys=[self.delayed_key, self.queue_key], args=[now, limit])
+
+    async def requeue_stalled(self, worker: str) -> int:
+        """
+        The requeue_stalled function puts the jobs a worker had taken but not finished back at the head of the queue.
+        It is called when the worker starts, before it takes new jobs.
 
-conf = ConnectionConfig(
-    MAIL_USERNAME=settings.mail_username,
-    MAIL_PASSWORD=settings.mail_password,
-    MAIL_FROM=EmailStr(settings.mail_from),
-    MAIL_PORT=settings.mail_port,
-    MAIL_SERVER=settings.mail_server,
-    MAIL_FROM_NAME="Cat System Corporation",
-    MAIL_STARTTLS=False,
-    MAIL_SSL_TLS=True,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True,
-    TEMPLATE_FOLDER=Path(__file__).parent / 'templates',
-)
-
-
-async def send_email(email: EmailStr, username: str, host: str):
+        :param self: Represent the instance of the class
+        :param worker: str: The name of the worker
+        :return: The number of jobs put back
+        """
+        moved = 0
+        while await self.client.lmove(self.processing_key(worker), self.queue_key, "RIGHT", "RIGHT") is not None:
+            moved += 1
+        return moved
+
+
+class SMTPPool:
+    def __init__(self, hostname: str, port: int, username: str | None, password: str | None, use_tls: bool,
+                 start_tls: bool, validate_certs: bool, size: int):
+        """
+        The SMTPPool keeps up to size logged in SMTP connections open and hands them out one message at a time,
+        so messages are sent over an existing connection instead of a new TLS handshake and login each.
+
+        :param self: Represent the instance of the class
+        :param hostname: str: The SMTP server
+        :param port: int: The port of the SMTP server
+        :param username: str | None: The login, None to send without one
+        :param password: str | None: The password
+        :param use_tls: bool: Connect over TLS
+        :param start_tls: bool: Upgrade a plain connection with STARTTLS
+        :param validate_certs: bool: Check the certificate of the server
+        :param size: int: Maximum number of connections
+        """
+        self.options = dict(hostname=hostname, port=port, username=username, password=password, use_tls=use_tls,
+                            start_tls=start_tls, validate_certs=validate_certs)
+        self.size = size
+        self._idle: list[aiosmtplib.SMTP] = []
+        self._slots = asyncio.Semaphore(size)
+        self.opened = 0
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        smtp = aiosmtplib.SMTP(**self.options)
+        await smtp.connect()
+        self.opened += 1
+        return smtp
+
+    @asynccontextmanager
+    async def connection(self):
+        """
+        The connection function lends a connection for sending, opening one if there is no idle one.
+        A connection that fails while it is lent is closed instead of returned to the pool.
+
+        :param self: Represent the instance of the class
+        :return: An async context manager of an aiosmtplib.SMTP
+        """
+        async with self._slots:
+            smtp = self._idle.pop() if self._idle else None
+            if smtp is None or not smtp.is_connected:
+                smtp = await self._connect()
+            try:
+                yield smtp
+            except BaseException:
+                smtp.close()
+                raise
+            self._idle.append(smtp)
+
+    async def close(self) -> None:
+        """
+        The close function ends the idle connections with QUIT.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        idle, self._idle = self._idle, []
+        for smtp in idle:
+            try:
+                await smtp.quit()
+            except aiosmtplib.SMTPException:
+                smtp.close()
+
+
+class EmailSender:
+    def __init__(self, pool: SMTPPool, from_address: str, from_name: str, templates: MailTemplates):
+        """
+        The EmailSender renders queued emails and sends them over the connections of the pool.
+        Each template is compiled once by the template service and reused for every email.
+
+        :param self: Represent the instance of the class
+        :param pool: SMTPPool: The SMTP connections
+        :param from_address: str: The sender address
+        :param from_name: str: The display name of the sender
+        :param templates: MailTemplates: The compiled email templates
+        """
+        self.pool = pool
+        self.sender = formataddr((from_name, from_address))
+        self.templates = templates
+
+    def build(self, job: EmailJob) -> EmailMessage:
+        """
+        The build function renders the template of a job into an HTML email.
+
+        :param self: Represent the instance of the class
+        :param job: EmailJob: The job
+        :return: The email
+        """
+        message = EmailMessage()
+        message["From"] = self.sender
+        message["To"] = job.recipient
+        message["Subject"] = job.subject
+        message.set_content(self.templates.render(job.template, job.context), subtype="html")
+        return message
+
+    async def send(self, job: EmailJob) -> None:
+        """
+        The send function sends the email of a job. A pooled connection the server has closed in the meantime
+        is replaced by a new one once, other errors are left to the caller.
+
+        :param self: Represent the instance of the class
+        :param job: EmailJob: The job
+        :return: None
+        """
+        message = self.build(job)
+        for attempt in range(2):
+            try:
+                async with self.pool.connection() as smtp:
+                    await smtp.send_message(message)
+                return
+            except SMTPServerDisconnected:
+                if attempt:
+                    raise
+
+
+email_queue = EmailQueue(redis_client, settings.email_queue_name, settings.email_dedupe_ttl)
+
+
+def create_email_sender() -> EmailSender:
     """
-    The send_email function sends an email to the user with a link to confirm their email address.
-        The function takes in three parameters:
-            -email: the user's email address, which is used as a recipient for the message and also as part of
-                the token verification payload. This parameter must be of type EmailStr (a custom class that validates
-                whether or not an input string is a valid email). If it isn't, then this function will raise an exception.
+    The create_email_sender function builds the sender of the worker from the settings.
 
-    :param email: EmailStr: Specify the email address of the recipient
+    :return: An EmailSender with its own SMTPPool
+    """
+    pool = SMTPPool(settings.mail_server, settings.mail_port, settings.mail_username or None,
+                    settings.mail_password or None, settings.mail_ssl_tls, settings.mail_starttls,
+                    settings.mail_validate_certs, settings.smtp_pool_size)
+    return EmailSender(pool, settings.mail_from, settings.mail_from_name, mail_templates)
+
+
+async def send_email(email: str, username: str, host: str, dedupe: bool = False) -> bool:
+    """
+    The send_email function queues an email to the user with a link to confirm their email address.
+    The email is sent by the worker (python -m src.services.email_worker), the request doesn't wait for SMTP.
+    With dedupe, the email is dropped if one was already queued for the address within EMAIL_DEDUPE_TTL seconds.
+    If Redis can't be reached the email is not sent, the user can ask for it again.
+
+    :param email: str: Specify the email address of the recipient
     :param username: str: Pass the username to the email template
     :param host: str: Pass the host url to the template
-    :return: A coroutine object
+    :param dedupe: bool: Drop the email if the same one was queued recently
+    :return: True if the email was queued
     """
+    token_verification = auth_service.create_email_token({"sub": email})
     try:
-        token_verification = auth_service.create_email_token({"sub": email})
-        message = MessageSchema(
-            subject="Confirm your email!",
-            recipients=[email],
-            template_body={"host": host, "username": username, "token": token_verification},
-            subtype=MessageType.html
+        return await email_queue.enqueue(
+            "email_template.html", email, "Confirm your email!",
+            confirmation_context(username, host, token_verification),
+            dedupe=f"confirm:{email}" if dedupe else None,
         )
-
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="email_template.html")
-    except ConnectionErrors as err:
+    except RedisError as err:
         logging.error(err)
+        return False
@@ -0,0 +1,175 @@
+"""
+The worker that sends the emails queued by src.services.email.
+
+Run it next to the application, as many as needed, each with its own EMAIL_WORKER_NAME:
+
+    python -m src.services.email_worker
+
+The name defaults to the host name and the process id, which is unique but changes with every start,
+so the jobs a stopped worker had taken are only picked up again by a worker started under a fixed EMAIL_WORKER_NAME.
+"""
+import asyncio
+import logging
+import os
+import signal
+import socket
+import time
+
+import redis.asyncio as redis
+from aiosmtplib import SMTPException, SMTPResponseException
+from redis.exceptions import RedisError
+
+from src.conf.config import settings
+from src.services.email import EmailJob, EmailQueue, EmailSender, create_email_sender
+from src.services.mail_templates import mail_templates
+
+
+class EmailWorker:
+    def __init__(self, queue: EmailQueue, sender: EmailSender, name: str, concurrency: int, max_attempts: int,
+                 backoff: float, backoff_max: float, poll_timeout: float = 1):
+        """
+        The EmailWorker takes jobs off the queue and sends them, concurrency jobs at a time.
+        A job that fails with a temporary error is tried again after backoff seconds, doubled with every attempt
+        up to backoff_max, and buried after max_attempts. A permanent SMTP error (5xx) buries it right away,
+        and so does any other error, e.g. a template that can't be rendered, which would only fail again.
+
+        :param self: Represent the instance of the class
+        :param queue: EmailQueue: The queue
+        :param sender: EmailSender: Sends the emails
+        :param name: str: The name of the worker, its processing list is recovered under it after a restart
+        :param concurrency: int: Number of emails sent at the same time
+        :param max_attempts: int: Number of attempts before a job is buried
+        :param backoff: float: Seconds before the first retry
+        :param backoff_max: float: Maximum number of seconds between retries
+        :param poll_timeout: float: How long a consumer waits for a job before checking whether it should stop
+        """
+        self.queue = queue
+        self.sender = sender
+        self.name = name
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.poll_timeout = poll_timeout
+        self._stopping = asyncio.Event()
+
+    def delay(self, attempts: int) -> float:
+        """
+        The delay function returns how long to wait before the next attempt of a job.
+
+        :param self: Represent the instance of the class
+        :param attempts: int: The number of attempts made so far, including the one that just failed
+        :return: Seconds until the next attempt
+        """
+        return min(self.backoff * 2 ** (attempts - 1), self.backoff_max)
+
+    async def handle(self, job: EmailJob) -> None:
+        """
+        The handle function sends one job and records the outcome in the queue.
+
+        :param self: Represent the instance of the class
+        :param job: EmailJob: The job
+        :return: None
+        """
+        try:
+            await self.sender.send(job)
+        except (SMTPException, OSError, asyncio.TimeoutError) as err:
+            permanent = isinstance(err, SMTPResponseException) and err.code >= 500
+            if permanent or job.attempts + 1 >= self.max_attempts:
+                logging.error("email %s to %s buried: %s", job.id, job.recipient, err)
+                await self.queue.bury(self.name, job)
+            else:
+                await self._retry(job, err)
+        except RedisError:
+            raise
+        except Exception:
+            logging.exception("email %s to %s buried", job.id, job.recipient)
+            await self.queue.bury(self.name, job)
+        else:
+            await self.queue.ack(self.name, job)
+
+    async def _retry(self, job: EmailJob, err: Exception):
+        delay = self.delay(job.attempts + 1)
+        logging.warning("email %s to %s failed, retry in %ss: %s", job.id, job.recipient, delay, err)
+        await self.queue.retry(self.name, job, time.time() + delay)
+
+    async def consume(self) -> None:
+        """
+        The consume function handles jobs one after another until the worker is stopped.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        while not self._stopping.is_set():
+            try:
+                job = await self.queue.reserve(self.name, self.poll_timeout)
+                if job is not None:
+                    await self.handle(job)
+            except RedisError as err:
+                logging.warning(err)
+                await asyncio.sleep(self.poll_timeout)
+            except Exception:
+                # One bad job must not take the other consumers down with it through gather.
+                logging.exception("email consumer of %s failed", self.name)
+                await asyncio.sleep(self.poll_timeout)
+
+    async def promote(self) -> None:
+        """
+        The promote function puts delayed jobs back on the queue when they are due, until the worker is stopped.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        while not self._stopping.is_set():
+            try:
+                await self.queue.promote_due(time.time())
+            except RedisError as err:
+                logging.warning(err)
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.poll_timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self) -> None:
+        """
+        The run function recovers the jobs left by a previous run of the worker, then consumes the queue
+        until stop is called. Jobs being sent when it is called are finished first.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        stalled = await self.queue.requeue_stalled(self.name)
+        if stalled:
+            logging.warning("requeued %s unfinished emails of %s", stalled, self.name)
+        await asyncio.gather(self.promote(), *(self.consume() for _ in range(self.concurrency)))
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+
+async def main():
+    logging.info("compiled email templates: %s", mail_templates.preload())
+    client = redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0)
+    sender = create_email_sender()
+    worker = EmailWorker(
+        EmailQueue(client, settings.email_queue_name, settings.email_dedupe_ttl),
+        sender,
+        settings.email_worker_name or f"{socket.gethostname()}:{os.getpid()}",
+        settings.email_worker_concurrency,
+        settings.email_max_attempts,
+        settings.email_retry_backoff,
+        settings.email_retry_backoff_max,
+    )
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+    try:
+        await worker.run()
+    finally:
+        await sender.pool.close()
+        await client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
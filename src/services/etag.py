@@ -0,0 +1,92 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi import Request, Response, status
+
+
+def make_etag(*parts) -> str:
+    """
+    The make_etag function builds a weak entity tag from the values that identify a version of a resource,
+    such as its id and updated_at. It is weak because it is derived from the version, not from the bytes
+    of the response.
+
+    :param parts: The values the tag is derived from
+    :return: The entity tag, quoted and prefixed with W/
+    """
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+
+def _opaque(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    The etag_matches function compares an If-None-Match header with the current entity tag.
+    As required for If-None-Match, the comparison is weak: W/"x" and "x" match each other.
+
+    :param if_none_match: str: The value of the If-None-Match header, a list of tags or *
+    :param etag: str: The current entity tag
+    :return: True if the client already has the current version
+    """
+    if if_none_match.strip() == "*":
+        return True
+    return _opaque(etag) in {_opaque(tag) for tag in if_none_match.split(",")}
+
+
+def _utc(moment: datetime) -> datetime:
+    # Timestamps are stored without a time zone, func.now() of the database is taken as UTC.
+    if moment.tzinfo is None:
+        return moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc)
+
+
+def validators(etag: str, last_modified: datetime | None) -> dict:
+    """
+    The validators function returns the headers that let a client revalidate its copy of a resource.
+    Cache-Control: no-cache makes clients ask again every time, which is cheap because of the 304 responses.
+
+    :param etag: str: The entity tag of the resource
+    :param last_modified: datetime | None: When the resource last changed, if known
+    :return: A dict of headers
+    """
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(_utc(last_modified), usegmt=True)
+    return headers
+
+
+def is_not_modified(request: Request, headers: dict) -> bool:
+    """
+    The is_not_modified function evaluates the conditional headers of a GET request
+    against the validators of the current version of the resource.
+    If-None-Match takes precedence, If-Modified-Since is only used without it.
+
+    :param request: Request: The request
+    :param headers: dict: The headers returned by validators
+    :return: True if the request should be answered with 304 Not Modified
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, headers["ETag"])
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None or "Last-Modified" not in headers:
+        return False
+    try:
+        since = _utc(parsedate_to_datetime(if_modified_since))
+    except (TypeError, ValueError):
+        return False
+    return parsedate_to_datetime(headers["Last-Modified"]) <= since
+
+
+def not_modified(headers: dict) -> Response:
+    """
+    The not_modified function builds an empty 304 response carrying the validators of the resource.
+
+    :param headers: dict: The headers returned by validators
+    :return: The response
+    """
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
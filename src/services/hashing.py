@@ -0,0 +1,99 @@
+import asyncio
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from src.conf.config import settings
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+class PasswordHasher:
+    def __init__(self, executor: Executor, max_concurrency: int, max_waiting: int):
+        """
+        The PasswordHasher runs bcrypt in a worker pool instead of on the event loop.
+        At most max_concurrency hashes run at once, the rest wait for a free slot,
+        and once max_waiting requests are waiting new ones are rejected with 503.
+
+        :param self: Represent the instance of the class
+        :param executor: Executor: The thread or process pool bcrypt runs in
+        :param max_concurrency: int: Number of hashes allowed to run at once
+        :param max_waiting: int: Number of requests allowed to wait for a slot, unlimited if 0
+        """
+        self.executor = executor
+        self.max_concurrency = max_concurrency
+        self.max_waiting = max_waiting
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds_max = 0.0
+
+    async def _run(self, func, *args):
+        if self.max_waiting and self.waiting >= self.max_waiting:
+            self.rejected += 1
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Server is busy, try again")
+        start = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.wait_seconds_max = max(self.wait_seconds_max, time.perf_counter() - start)
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            self._semaphore.release()
+
+    async def hash(self, password: str) -> str:
+        """
+        The hash function returns the bcrypt hash of the password, computed in the pool.
+
+        :param self: Represent the instance of the class
+        :param password: str: The plain-text password
+        :return: A hash of the password
+        """
+        return await self._run(hash_password, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        """
+        The verify function checks the password against the hash in the pool.
+
+        :param self: Represent the instance of the class
+        :param plain_password: str: The password entered by the user
+        :param hashed_password: str: The hash stored in the database
+        :return: True if the password matches the hash
+        """
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    def snapshot(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "wait_seconds_max": self.wait_seconds_max,
+        }
+
+
+if settings.password_hash_executor == "process":
+    executor = ProcessPoolExecutor(max_workers=settings.password_hash_workers)
+else:
+    executor = ThreadPoolExecutor(max_workers=settings.password_hash_workers, thread_name_prefix="password-hash")
+
+password_hasher = PasswordHasher(executor, settings.password_hash_workers, settings.password_hash_max_waiting)
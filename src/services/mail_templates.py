@@ -0,0 +1,90 @@
+from pathlib import Path
+from typing import Iterable
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, Template, select_autoescape
+
+from src.conf.config import settings
+
+TEMPLATE_FOLDER = Path(__file__).parent / 'templates'
+
+
+class MailTemplates:
+    def __init__(self, folder: Path, bytecode_cache_dir: str | None = None):
+        """
+        The MailTemplates service holds one Jinja environment for the email templates and the compiled templates.
+        The templates are not checked for changes on disk (auto_reload is off), so a compiled template is used
+        as it is until the process restarts. With bytecode_cache_dir the compiled code is also kept on disk,
+        and a new process loads it instead of compiling the templates again.
+
+        :param self: Represent the instance of the class
+        :param folder: Path: The folder of the templates
+        :param bytecode_cache_dir: str | None: Where to keep the compiled templates, not kept on disk if None
+        """
+        bytecode_cache = FileSystemBytecodeCache(bytecode_cache_dir) if bytecode_cache_dir else None
+        self.env = Environment(loader=FileSystemLoader(folder), autoescape=select_autoescape(), auto_reload=False,
+                               bytecode_cache=bytecode_cache)
+        self._compiled: dict[str, Template] = {}
+
+    def preload(self) -> list[str]:
+        """
+        The preload function compiles every template of the folder, to be called at startup,
+        so the first emails don't pay for compiling and a broken template shows up before anything is sent.
+
+        :param self: Represent the instance of the class
+        :return: The names of the templates
+        """
+        names = self.env.list_templates()
+        for name in names:
+            self.get(name)
+        return names
+
+    def get(self, name: str) -> Template:
+        """
+        The get function returns the compiled template, compiling it the first time it is asked for.
+
+        :param self: Represent the instance of the class
+        :param name: str: The file name of the template
+        :return: The template
+        """
+        template = self._compiled.get(name)
+        if template is None:
+            template = self._compiled[name] = self.env.get_template(name)
+        return template
+
+    def render(self, name: str, context: dict) -> str:
+        """
+        The render function renders one email body.
+
+        :param self: Represent the instance of the class
+        :param name: str: The file name of the template
+        :param context: dict: The variables of the template
+        :return: The rendered body
+        """
+        return self.get(name).render(context)
+
+    def render_many(self, name: str, contexts: Iterable[dict]) -> list[str]:
+        """
+        The render_many function renders the same template for many recipients, looking the template up once.
+
+        :param self: Represent the instance of the class
+        :param name: str: The file name of the template
+        :param contexts: Iterable[dict]: The variables of the template, one dict per email
+        :return: The rendered bodies, in the order of the contexts
+        """
+        render = self.get(name).render
+        return [render(context) for context in contexts]
+
+
+def confirmation_context(username: str, host: str, token: str) -> dict:
+    """
+    The confirmation_context function returns the variables of email_template.html, the email confirmation letter.
+
+    :param username: str: The name the letter is addressed to
+    :param host: str: The base url of the application
+    :param token: str: The email verification token
+    :return: The context of the template
+    """
+    return {"host": host, "username": username, "token": token}
+
+
+mail_templates = MailTemplates(TEMPLATE_FOLDER, settings.mail_template_cache_dir or None)
@@ -0,0 +1,42 @@
+from typing import Any, Iterable
+
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import Row
+
+from src.services.timing import measure
+
+
+def row_dicts(rows: Iterable[Row]) -> list[dict]:
+    """
+    The row_dicts function turns core result rows into plain dicts keyed by column name.
+
+    :param rows: Iterable[Row]: Rows of a select of table columns
+    :return: A list of dicts, one per row
+    """
+    return [row._asdict() for row in rows]
+
+
+def json_response(content: Any, status_code: int = 200, headers: dict | None = None) -> ORJSONResponse:
+    """
+    The json_response function encodes data read from the database straight to JSON with orjson.
+    Returning it from an endpoint skips the response_model validation of FastAPI, which re-validates
+    every field of every row (EmailStr included) although the data has already been validated on write.
+    The response_model of the route is still used for the OpenAPI schema.
+
+    :param content: Any: Dicts, lists and the other types orjson encodes natively
+    :param status_code: int: The status code of the response
+    :param headers: dict | None: Extra headers of the response
+    :return: A response with the encoded body
+    """
+    with measure("serialize"):
+        return ORJSONResponse(content, status_code=status_code, headers=headers)
+
+
+def rows_response(rows: Iterable[Row]) -> ORJSONResponse:
+    """
+    The rows_response function encodes a list of core result rows as a JSON array of objects.
+
+    :param rows: Iterable[Row]: Rows of a select of table columns
+    :return: A response with the encoded rows
+    """
+    return json_response(row_dicts(rows))
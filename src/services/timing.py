@@ -0,0 +1,128 @@
+import asyncio
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter_ns
+from typing import Callable
+
+from fastapi.routing import APIRoute
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+PHASES = ("auth", "db", "redis", "serialize")
+_timings: ContextVar[dict | None] = ContextVar("server_timings", default=None)
+
+
+def add_timing(phase: str, duration_ns: int):
+    """
+    The add_timing function adds time spent in a phase to the timings of the current request.
+    Outside of a request it does nothing.
+
+    :param phase: str: Name of the phase, one of PHASES
+    :param duration_ns: int: Time spent in nanoseconds
+    :return: None
+    """
+    timings = _timings.get()
+    if timings is not None:
+        timings[phase] = timings.get(phase, 0) + duration_ns
+
+
+@contextmanager
+def measure(phase: str):
+    """
+    The measure function is a context manager that adds the time spent in its block to the phase.
+
+    :param phase: str: Name of the phase, one of PHASES
+    :return: A context manager
+    """
+    start = perf_counter_ns()
+    try:
+        yield
+    finally:
+        add_timing(phase, perf_counter_ns() - start)
+
+
+def _mark_endpoint_done():
+    timings = _timings.get()
+    if timings is not None:
+        timings["endpoint_done"] = perf_counter_ns()
+
+
+class TimedRoute(APIRoute):
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        """
+        The TimedRoute records when the endpoint returns, so the time between that and the start of the response
+        is reported as the serialize phase (response model validation and JSON encoding).
+
+        :param self: Represent the instance of the class
+        :param path: str: The path of the route
+        :param endpoint: Callable: The endpoint function
+        :param kwargs: The other arguments of APIRoute
+        """
+        if asyncio.iscoroutinefunction(endpoint):
+            @functools.wraps(endpoint)
+            async def timed_endpoint(*args, **kw):
+                try:
+                    return await endpoint(*args, **kw)
+                finally:
+                    _mark_endpoint_done()
+        else:
+            @functools.wraps(endpoint)
+            def timed_endpoint(*args, **kw):
+                try:
+                    return endpoint(*args, **kw)
+                finally:
+                    _mark_endpoint_done()
+        super().__init__(path, timed_endpoint, **kwargs)
+
+
+def server_timing_header(timings: dict, total_ns: int) -> str:
+    entries = [f"{phase};dur={timings[phase] / 1e6:.3f}" for phase in PHASES if phase in timings]
+    entries.append(f"total;dur={total_ns / 1e6:.3f}")
+    return ", ".join(entries)
+
+
+class ServerTimingMiddleware:
+    def __init__(self, app: ASGIApp, access_log=None):
+        """
+        The ServerTimingMiddleware is a pure ASGI middleware that times every HTTP request with perf_counter_ns,
+        adds a Server-Timing header with the auth, db, redis and serialize phases and the total,
+        and writes the request to the access log.
+
+        :param self: Represent the instance of the class
+        :param app: ASGIApp: The wrapped application
+        :param access_log: AccessLog: Where requests are logged, nothing is logged if None
+        """
+        self.app = app
+        self.access_log = access_log
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = {}
+        token = _timings.set(timings)
+        start = perf_counter_ns()
+        status_code = 500
+
+        async def send_with_timing(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                now = perf_counter_ns()
+                if "endpoint_done" in timings:
+                    timings["serialize"] = timings.get("serialize", 0) + now - timings["endpoint_done"]
+                MutableHeaders(scope=message).append("Server-Timing", server_timing_header(timings, now - start))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _timings.reset(token)
+            if self.access_log is not None:
+                headers = Headers(scope=scope)
+                client = scope.get("client")
+                self.access_log.log(status_code, method=scope["method"], path=scope["path"],
+                                    duration_ms=round((perf_counter_ns() - start) / 1e6, 3),
+                                    client=client[0] if client else None, user_agent=headers.get("user-agent"))
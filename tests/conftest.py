@@ -1,8 +1,9 @@
-
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 from sqlalchemy.exc import DatabaseError
 
 from main import app
@@ -11,12 +12,18 @@ from src.database.db import get_db
 
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
+ASYNC_SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///./test.db"
 
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Every TestClient request runs in its own event loop, so connections must not be pooled across requests
+async_engine = create_async_engine(ASYNC_SQLALCHEMY_DATABASE_URL, poolclass=NullPool)
+AsyncTestingSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False,
+                                              expire_on_commit=False)
+
 
 @pytest.fixture(scope="module")
 def session():
@@ -34,15 +41,18 @@ def session():
         db.close()
 
 
+@pytest.fixture(scope="module")
+def async_session_maker(session):
+    return AsyncTestingSessionLocal
+
+
 @pytest.fixture(scope="module")
 def client(session):
     # Dependency override
 
-    def override_get_db():
-        try:
-            yield session
-        finally:
-            session.close()
+    async def override_get_db():
+        async with AsyncTestingSessionLocal() as db:
+            yield db
 
     app.dependency_overrides[get_db] = override_get_db
 
@@ -1,6 +1,10 @@
+import pytest
 from fastapi.testclient import TestClient
 
 from main import app
+from src.database.models import User
+from src.services.auth import auth_service
+from src.services.access_log import UserAgentBanMiddleware, compile_user_agent_ban
 
 client = TestClient(app)
 
@@ -8,3 +12,41 @@ client = TestClient(app)
 def test_read_main():
     response = client.get("/")
     assert response.status_code == 200
+
+
+@pytest.fixture()
+def signed_in():
+    app.dependency_overrides[auth_service.get_current_user] = lambda: User(id=1, email="user1@example.com")
+    yield
+    app.dependency_overrides.pop(auth_service.get_current_user, None)
+
+
+def test_metrics_need_sign_in():
+    for name in ("pool", "hashing", "cache"):
+        response = client.get(f"/api/metrics/{name}")
+        assert response.status_code == 401, response.text
+
+
+def test_pool_metrics(signed_in):
+    response = client.get("/api/metrics/pool")
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["size"] == 5
+    assert {"checked_out", "overflow", "checkouts", "timeouts", "wait_seconds_max"} <= data.keys()
+
+
+def test_server_timing_header(signed_in):
+    response = client.get("/api/metrics/pool")
+    assert response.status_code == 200
+    assert "performance" not in response.headers
+    timing = response.headers["server-timing"]
+    assert "serialize;dur=" in timing
+    assert timing.split(", ")[-1].startswith("total;dur=")
+
+
+def test_banned_user_agent():
+    banning_client = TestClient(UserAgentBanMiddleware(app, compile_user_agent_ban(["badbot"])))
+    response = banning_client.get("/", headers={"user-agent": "BadBot/1.0"})
+    assert response.status_code == 403
+    response = banning_client.get("/", headers={"user-agent": "Mozilla/5.0"})
+    assert response.status_code == 200
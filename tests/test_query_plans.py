@@ -0,0 +1,110 @@
+import re
+import unittest
+from datetime import date
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from src.database.models import Base, User
+from src.repository import contacts as repository_contacts
+from src.repository.users import get_user_by_email
+from src.schemas import ContactBatchActiveModel, ContactPatchModel
+
+# A plan line reading the whole table, as opposed to SEARCH ... USING INDEX or a SCAN of a covering index
+FULL_SCAN = re.compile(r"\bSCAN (contacts|users)\b(?! USING (COVERING )?INDEX)")
+
+
+class TestQueryPlans(unittest.IsolatedAsyncioTestCase):
+    """
+    Every query the repositories send must be answered from an index, not by reading the whole table.
+    The schema is the one of the models, and the migrations in migrations/versions build the same indexes.
+    """
+
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+        async with self.engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        self.statements = []
+        event.listen(self.engine.sync_engine, "before_cursor_execute", self.capture)
+        self.session = async_sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)()
+        self.user = User(id=1, email="deadpool@example.com", password="secret")
+        self.session.add(self.user)
+        await self.session.commit()
+        self.statements.clear()
+
+    async def asyncTearDown(self):
+        await self.session.close()
+        await self.engine.dispose()
+
+    def capture(self, conn, cursor, statement, parameters, context, executemany):
+        if not statement.startswith("EXPLAIN"):
+            self.statements.append((statement, parameters))
+
+    async def assert_indexed(self):
+        self.assertTrue(self.statements)
+        statements, self.statements = self.statements, []
+        connection = await self.session.connection()
+        for statement, parameters in statements:
+            plan = await connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+            details = [row.detail for row in plan]
+            self.assertFalse([line for line in details if FULL_SCAN.search(line)], f"{statement}\n{details}")
+
+    async def test_get_contacts(self):
+        await repository_contacts.get_contacts(self.session, self.user, limit=20, cursor=10)
+        await repository_contacts.get_contacts(self.session, self.user, limit=20, is_active_contact=True)
+        await repository_contacts.get_contacts(self.session, self.user, limit=20, first_name="Dmytro")
+        await repository_contacts.get_contacts(self.session, self.user, limit=20, last_name="Oseledko")
+        await repository_contacts.get_contacts(self.session, self.user, email="test@test.api.com")
+        await self.assert_indexed()
+
+    async def test_get_contacts_fingerprint(self):
+        await repository_contacts.get_contacts_fingerprint(self.session, self.user, limit=20, cursor=10)
+        await self.assert_indexed()
+
+    async def test_stream_contacts(self):
+        async for _ in repository_contacts.stream_contacts(self.session, self.user, batch_size=100):
+            pass
+        await self.assert_indexed()
+
+    async def test_get_contacts_birthday(self):
+        await repository_contacts.get_contacts_birthday(7, self.user, self.session, today=date(2023, 6, 1))
+        await repository_contacts.get_contacts_birthday(7, self.user, self.session, today=date(2023, 12, 28))
+        await self.assert_indexed()
+
+    async def test_search_contacts(self):
+        await repository_contacts.search_contacts("dmy ose", 20, 0, self.user, self.session)
+        await self.assert_indexed()
+
+    async def test_get_contact(self):
+        await repository_contacts.get_contact_by_id(1, self.user, self.session)
+        await repository_contacts.get_contact_version(1, self.user, self.session)
+        await repository_contacts.get_contact_by_email("test@test.api.com", self.user, self.session)
+        await repository_contacts.get_contacts_by_first_name("Dmytro", self.user, self.session)
+        await repository_contacts.get_contacts_by_last_name("Oseledko", self.user, self.session)
+        await repository_contacts.get_contacts_by_ids([1, 2, 3], self.user, self.session)
+        await self.assert_indexed()
+
+    async def test_writes(self):
+        await repository_contacts.update(1, ContactPatchModel(nick="Badrunt"), self.user, self.session, partial=True)
+        await repository_contacts.remove_many([1, 2], self.user, self.session)
+        await repository_contacts.set_is_active_contact_many(
+            ContactBatchActiveModel(ids=[1, 2], is_active_contact=False), self.user, self.session)
+        await self.assert_indexed()
+
+    async def test_get_user_by_email(self):
+        await get_user_by_email("deadpool@example.com", self.session)
+        await self.assert_indexed()
+
+
+class TestIndexes(unittest.TestCase):
+    def test_no_redundant_indexes(self):
+        # An index whose columns start another index, or the primary key, only costs writes.
+        for table in Base.metadata.sorted_tables:
+            keys = [("PRIMARY KEY", tuple(column.name for column in table.primary_key))]
+            keys += [(index.name, tuple(column.name for column in index.columns))
+                     for index in table.indexes if index.columns]
+            for name, columns in keys:
+                for other, other_columns in keys:
+                    if name != other and other_columns[:len(columns)] == columns:
+                        self.fail(f"{table.name}: {name} {columns} is a prefix of {other} {other_columns}")
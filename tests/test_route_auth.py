@@ -1,10 +1,10 @@
-from unittest.mock import MagicMock
+from unittest.mock import AsyncMock
 
 from src.database.models import User
 
 
 def test_create_user(client, user, monkeypatch):
-    mock_send_email = MagicMock()
+    mock_send_email = AsyncMock()
     monkeypatch.setattr("src.routes.auth.send_email", mock_send_email)
     response = client.post(
         "/api/auth/signup",
@@ -14,6 +14,8 @@ def test_create_user(client, user, monkeypatch):
     data = response.json()
     assert data["email"] == user.get("email")
     assert "id" in data
+    mock_send_email.assert_awaited_once_with(user.get("email"), user.get("username"), "http://testserver/",
+                                             dedupe=True)
 
 
 def test_repeat_create_user(client, user):
@@ -26,6 +28,29 @@ def test_repeat_create_user(client, user):
     assert data["detail"] == "Account already exists"
 
 
+def test_repeat_create_user_other_case(client, user):
+    response = client.post(
+        "/api/auth/signup",
+        json=dict(user, email=user.get("email").upper()),
+    )
+    assert response.status_code == 409, response.text
+
+
+def test_request_email(client, user, monkeypatch):
+    mock_send_email = AsyncMock()
+    monkeypatch.setattr("src.routes.auth.send_email", mock_send_email)
+    response = client.post("/api/auth/request_email", json={"email": user.get("email")})
+    assert response.status_code == 200, response.text
+    assert response.json()["message"] == "Check your email for confirmation."
+    mock_send_email.assert_awaited_once_with(user.get("email"), user.get("username"), "http://testserver/",
+                                             dedupe=True)
+
+    mock_send_email.reset_mock()
+    response = client.post("/api/auth/request_email", json={"email": "nobody@example.com"})
+    assert response.status_code == 200, response.text
+    mock_send_email.assert_not_awaited()
+
+
 def test_login_user_not_confirmed(client, user):
     response = client.post(
         "/api/auth/login",
@@ -49,6 +74,14 @@ def test_login_user(client, session, user):
     assert data["token_type"] == "bearer"
 
 
+def test_login_user_email_case(client, user):
+    response = client.post(
+        "/api/auth/login",
+        data={"username": user.get('email').title(), "password": user.get('password')},
+    )
+    assert response.status_code == 200, response.text
+
+
 def test_login_user_wrong_password(client, user):
     response = client.post(
         "/api/auth/login",
@@ -67,3 +100,37 @@ def test_login_user_wrong_email(client, user):
     assert response.status_code == 401, response.text
     data = response.json()
     assert data["detail"] == "Invalid email"
+
+
+def mock_revocation_list(monkeypatch):
+    redis = AsyncMock()
+    redis.exists.return_value = 0
+    monkeypatch.setattr("src.services.auth.auth_service.r", redis)
+
+
+def test_read_users_me(client, user, monkeypatch):
+    mock_revocation_list(monkeypatch)
+    response = client.post(
+        "/api/auth/login",
+        data={"username": user.get('email'), "password": user.get('password')},
+    )
+    access_token = response.json()["access_token"]
+    for _ in range(2):
+        response = client.get("/api/users/me/", headers={"Authorization": f"Bearer {access_token}"})
+        assert response.status_code == 200, response.text
+        assert response.json()["email"] == user.get("email")
+        assert "auth;dur=" in response.headers["server-timing"]
+
+
+def test_logout(client, user, monkeypatch):
+    mock_revocation_list(monkeypatch)
+    response = client.post(
+        "/api/auth/login",
+        data={"username": user.get('email'), "password": user.get('password')},
+    )
+    access_token = response.json()["access_token"]
+    headers = {"Authorization": f"Bearer {access_token}"}
+    response = client.post("/api/auth/logout", headers=headers)
+    assert response.status_code == 200, response.text
+    response = client.get("/api/users/me/", headers=headers)
+    assert response.status_code == 401, response.text
@@ -0,0 +1,415 @@
+import asyncio
+import csv
+import io
+import json
+from datetime import date, datetime, timedelta
+
+from unittest.mock import AsyncMock
+
+import pytest
+from sqlalchemy import update
+
+from main import app
+from src.database.models import Contact, User
+from src.repository import contacts as repository_contacts
+from src.services.auth import auth_service
+from src.services.cache import response_cache, user_cache
+
+
+def login_as(user_id):
+    app.dependency_overrides[auth_service.get_current_user] = lambda: User(id=user_id,
+                                                                           email=f"user{user_id}@example.com")
+
+
+@pytest.fixture(scope="module", autouse=True)
+def current_user(client, session):
+    session.add_all([User(id=user_id, email=f"user{user_id}@example.com", password="secret") for user_id in (1, 2)])
+    session.commit()
+    login_as(1)
+    yield
+    app.dependency_overrides.pop(auth_service.get_current_user, None)
+
+
+def contact(number):
+    return {
+        "first_name": "Dmytro",
+        "last_name": "Oseledko" if number % 2 else "Shevchenko",
+        "email": f"contact{number}@example.com",
+        "phone_number": f"050-000-00-{number:02}",
+        "birthday": "10-04-2019",
+        "nick": f"nick{number}",
+        "description": "description",
+    }
+
+
+def test_create_contacts(client):
+    for number in range(1, 8):
+        response = client.post("/api/contacts/", json=contact(number))
+        assert response.status_code == 201, response.text
+
+
+def test_create_contact_conflicts(client):
+    for field, value in [("email", "contact1@example.com"), ("phone_number", "050-000-00-01"), ("nick", "nick1")]:
+        response = client.post("/api/contacts/", json=dict(contact(99), **{field: value}))
+        assert response.status_code == 409, response.text
+        assert response.json()["detail"] == f"Contact with this {field.replace('_', ' ')} already exists"
+
+
+def test_create_contact_email_case(client):
+    response = client.post("/api/contacts/", json=dict(contact(99), email="Contact1@EXAMPLE.com"))
+    assert response.status_code == 409, response.text
+    assert response.json()["detail"] == "Contact with this email already exists"
+
+    response = client.get("/api/contacts/", params={"email": "CONTACT1@example.com"})
+    assert [item["id"] for item in response.json()["items"]] == [1]
+
+
+def test_create_contact_upsert(client):
+    response = client.post("/api/contacts/", params={"upsert": True},
+                           json=dict(contact(1), description="upserted", birthday="01-02-1990"))
+    assert response.status_code == 201, response.text
+    assert response.json()["id"] == 1
+    assert response.json()["description"] == "upserted"
+    response = client.post("/api/contacts/", params={"upsert": True},
+                           json=dict(contact(1), email="CONTACT1@example.com"))
+    assert response.json()["id"] == 1
+    assert response.json()["email"] == "contact1@example.com"
+    assert client.get("/api/contacts/1").json()["description"] == "description"
+
+
+def test_patch_contact(client):
+    response = client.patch("/api/contacts/5", json={"description": "patched", "birthday": "20-05-1995"})
+    assert response.status_code == 200, response.text
+    assert response.json()["description"] == "patched"
+    assert response.json()["nick"] == "nick5"
+    assert client.get("/api/contacts/5").json()["birthday"] == "20-05-1995"
+
+    assert client.patch("/api/contacts/5", json={"nick": "nick6"}).status_code == 409
+    assert client.patch("/api/contacts/5", json={"nick": None}).status_code == 422
+    assert client.patch("/api/contacts/999", json={"nick": "nick999"}).status_code == 404
+
+    response = client.put("/api/contacts/5", json=contact(5))
+    assert response.status_code == 200, response.text
+    assert response.json() == dict(contact(5), id=5, is_active_contact=True)
+
+
+def test_get_contacts_pages(client):
+    response = client.get("/api/contacts/", params={"limit": 3})
+    assert response.status_code == 200, response.text
+    assert "db;dur=" in response.headers["server-timing"]
+    first_page = response.json()
+    assert [item["nick"] for item in first_page["items"]] == ["nick1", "nick2", "nick3"]
+    assert first_page["next_cursor"] == first_page["items"][-1]["id"]
+
+    response = client.get("/api/contacts/", params={"limit": 3, "cursor": first_page["next_cursor"]})
+    second_page = response.json()
+    assert [item["nick"] for item in second_page["items"]] == ["nick4", "nick5", "nick6"]
+
+    response = client.get("/api/contacts/", params={"limit": 3, "cursor": second_page["next_cursor"]})
+    last_page = response.json()
+    assert [item["nick"] for item in last_page["items"]] == ["nick7"]
+    assert last_page["next_cursor"] is None
+
+
+def test_get_contacts_filtered(client):
+    response = client.get("/api/contacts/", params={"last_name": "Shevchenko"})
+    assert response.status_code == 200, response.text
+    assert [item["nick"] for item in response.json()["items"]] == ["nick2", "nick4", "nick6"]
+
+
+def test_get_contacts_fields(client):
+    response = client.get("/api/contacts/", params={"limit": 2, "fields": "first_name,phone_number"})
+    assert response.status_code == 200, response.text
+    page = response.json()
+    assert page["items"] == [{"id": 1, "first_name": "Dmytro", "phone_number": "050-000-00-01"},
+                             {"id": 2, "first_name": "Dmytro", "phone_number": "050-000-00-02"}]
+    assert page["next_cursor"] == 2
+
+    response = client.get("/api/contacts/3", params={"fields": "nick, email"})
+    assert response.status_code == 200, response.text
+    assert response.json() == {"id": 3, "email": "contact3@example.com", "nick": "nick3"}
+
+    response = client.get("/api/contacts/3")
+    assert set(response.json()) == set(contact(3)) | {"id", "is_active_contact"}
+
+    response = client.get("/api/contacts/", params={"fields": "nick,password"})
+    assert response.status_code == 422, response.text
+    assert response.json()["detail"] == "Unknown fields: password"
+
+
+def test_get_contact_conditional(client, session):
+    response = client.get("/api/contacts/3")
+    assert response.status_code == 200, response.text
+    tag = response.headers["etag"]
+    assert tag.startswith('W/"')
+    assert "last-modified" in response.headers
+
+    response = client.get("/api/contacts/3", headers={"If-None-Match": tag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == tag
+
+    response = client.get("/api/contacts/3", params={"fields": "nick"}, headers={"If-None-Match": tag})
+    assert response.status_code == 200
+
+    session.execute(update(Contact).where(Contact.id == 3).values(updated_at=datetime(2030, 1, 1)))
+    session.commit()
+    asyncio.run(response_cache.invalidate(repository_contacts.contact_tag(3)))
+    response = client.get("/api/contacts/3", headers={"If-None-Match": tag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != tag
+    assert response.headers["last-modified"] == "Tue, 01 Jan 2030 00:00:00 GMT"
+
+    response = client.get("/api/contacts/3", headers={"If-Modified-Since": "Tue, 01 Jan 2030 00:00:00 GMT"})
+    assert response.status_code == 304
+
+
+def test_get_contact_conditional_after_patch(client):
+    tag = client.get("/api/contacts/4").headers["etag"]
+    list_tag = client.get("/api/contacts/", params={"limit": 5}).headers["etag"]
+    response = client.patch("/api/contacts/4", json={"description": "patched right away"})
+    assert response.status_code == 200, response.text
+
+    response = client.get("/api/contacts/4", headers={"If-None-Match": tag})
+    assert response.status_code == 200
+    assert response.json()["description"] == "patched right away"
+    response = client.get("/api/contacts/", params={"limit": 5}, headers={"If-None-Match": list_tag})
+    assert response.status_code == 200
+
+
+def test_get_contacts_conditional(client, session):
+    response = client.get("/api/contacts/", params={"limit": 2})
+    tag = response.headers["etag"]
+    response = client.get("/api/contacts/", params={"limit": 2}, headers={"If-None-Match": f"{tag}, W/\"other\""})
+    assert response.status_code == 304
+
+    session.execute(update(Contact).where(Contact.id == 2).values(updated_at=datetime(2030, 1, 2)))
+    session.commit()
+    response = client.get("/api/contacts/", params={"limit": 2}, headers={"If-None-Match": tag})
+    assert response.status_code == 200
+    assert len(response.json()["items"]) == 2
+    assert response.headers["last-modified"] == "Wed, 02 Jan 2030 00:00:00 GMT"
+
+
+def test_get_contact_cached(client):
+    client.get("/api/contacts/4")
+    hits = client.get("/api/metrics/cache").json()["local_hits"]
+    response = client.get("/api/contacts/4")
+    assert response.json()["is_active_contact"] is True
+    assert client.get("/api/metrics/cache").json()["local_hits"] == hits + 1
+
+    client.patch("/api/contacts/4/is_active_contact", json={"is_active_contact": False})
+    assert client.get("/api/contacts/4").json()["is_active_contact"] is False
+    client.patch("/api/contacts/4/is_active_contact", json={"is_active_contact": True})
+
+    assert len(client.get("/api/contacts/first_name/Dmytro").json()) == 7
+    client.post("/api/contacts/", json=contact(8))
+    assert len(client.get("/api/contacts/first_name/Dmytro").json()) == 8
+    client.delete("/api/contacts/8")
+    assert len(client.get("/api/contacts/first_name/Dmytro").json()) == 7
+
+
+def test_get_contacts_by_name(client):
+    response = client.get("/api/contacts/last_name/Shevchenko")
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"] == "application/json"
+    assert [item["nick"] for item in response.json()] == ["nick2", "nick4", "nick6"]
+    assert set(response.json()[0]) == set(contact(2)) | {"id", "is_active_contact"}
+
+    response = client.get("/api/contacts/first_name/Dmytro")
+    assert len(response.json()) == 7
+
+
+def test_get_contacts_birthday(client):
+    soon = contact(11)
+    soon["birthday"] = (date.today() + timedelta(days=3)).strftime("%d-%m-1992")
+    later = contact(12)
+    later["birthday"] = (date.today() + timedelta(days=20)).strftime("%d-%m-1992")
+    for body in (soon, later):
+        response = client.post("/api/contacts/", json=body)
+        assert response.status_code == 201, response.text
+
+    response = client.get("/api/contacts/birthday")
+    assert response.status_code == 200, response.text
+    assert [item["nick"] for item in response.json()] == ["nick11"]
+
+    response = client.get("/api/contacts/birthday", params={"days": 30})
+    assert [item["nick"] for item in response.json()] == ["nick11", "nick12"]
+
+
+def test_get_contacts_birthday_year_wrap(session, async_session_maker):
+    session.add_all([Contact(user_id=1, email=f"wrap{number}@example.com", nick=f"wrap{number}", birthday=birthday)
+                     for number, birthday in enumerate(["02-01-1990", "30-12-1985", "15-01-2000"])])
+    session.commit()
+
+    async def upcoming():
+        async with async_session_maker() as db:
+            return await repository_contacts.get_contacts_birthday(7, User(id=1), db, today=date(2023, 12, 28))
+
+    contacts = asyncio.run(upcoming())
+    assert [contact.nick for contact in contacts] == ["wrap1", "wrap0"]
+
+
+def test_import_contacts_csv(client):
+    lines = [
+        "first_name,last_name,email,phone_number,birthday,nick,description",
+        'Taras,Shevchenko,taras@example.com,050-111-11-11,09-03-1814,kobzar,"poet,',
+        'painter"',
+        "Lesya,Ukrainka,not-an-email,050-111-11-12,25-02-1871,lesya,poet",
+        "Ivan,Franko,contact1@example.com,050-111-11-13,27-08-1856,kameniar,poet",
+        "Ivan,Franko,ivan@example.com,050-111-11-13",
+    ]
+    response = client.post("/api/contacts/import", files={"file": ("contacts.csv", "\r\n".join(lines), "text/csv")})
+    assert response.status_code == 200, response.text
+    report = response.json()
+    assert (report["inserted"], report["skipped"]) == (1, 1)
+    assert [error["line"] for error in report["errors"]] == [4, 6, 5]
+
+    response = client.get("/api/contacts/", params={"email": "taras@example.com"})
+    assert response.json()["items"][0]["description"] == "poet,\npainter"
+
+
+def test_import_contacts_ndjson(client):
+    lines = [
+        '{"first_name": "Mykola", "last_name": "Lysenko", "email": "mykola@example.com", '
+        '"phone_number": "050-222-22-21", "birthday": "22-03-1842", "nick": "composer", "description": "music"}',
+        "",
+        '{"email": "broken@example.com"',
+        '{"first_name": "Mykola", "last_name": "Lysenko", "email": "lysenko@example.com", '
+        '"phone_number": "050-222-22-21", "nick": "composer2", "description": "same phone"}',
+    ]
+    response = client.post("/api/contacts/import", params={"format": "ndjson"},
+                           files={"file": ("contacts.txt", "\n".join(lines))})
+    assert response.status_code == 200, response.text
+    report = response.json()
+    assert (report["inserted"], report["skipped"]) == (1, 1)
+    assert [error["line"] for error in report["errors"]] == [3, 4]
+
+
+def test_export_contacts(client, monkeypatch):
+    monkeypatch.setattr("src.services.contact_export.settings.contact_export_batch_size", 2)
+    response = client.get("/api/contacts/export")
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert rows[0]["nick"] == "nick1"
+    assert [row["id"] for row in rows] == sorted(row["id"] for row in rows)
+
+    response = client.get("/api/contacts/export", params={"format": "csv"})
+    assert response.status_code == 200, response.text
+    records = list(csv.DictReader(io.StringIO(response.text)))
+    assert len(records) == len(rows)
+    assert records[0]["email"] == rows[0]["email"]
+
+
+def test_contacts_batch(client):
+    ids = [item["id"] for item in client.get("/api/contacts/", params={"limit": 3}).json()["items"]]
+
+    response = client.get("/api/contacts/batch", params={"ids": ids + [9999]})
+    assert response.status_code == 200, response.text
+    results = response.json()
+    assert [result["status"] for result in results] == ["ok", "ok", "ok", "not_found"]
+    assert results[0]["contact"]["id"] == ids[0]
+
+    response = client.patch("/api/contacts/batch", json=[{"id": ids[0], "description": "patched"},
+                                                         {"id": ids[1], "birthday": "01-01-2000"},
+                                                         {"id": 9999, "description": "patched"}])
+    assert response.status_code == 200, response.text
+    assert [result["status"] for result in response.json()] == ["ok", "ok", "not_found"]
+    contacts = {result["id"]: result["contact"]
+                for result in client.get("/api/contacts/batch", params={"ids": ids}).json()}
+    assert contacts[ids[0]]["description"] == "patched"
+    assert contacts[ids[0]]["nick"] == "nick1"
+    assert contacts[ids[1]]["birthday"] == "01-01-2000"
+
+    response = client.patch("/api/contacts/batch", json=[{"id": ids[0], "nick": "nick2"},
+                                                         {"id": ids[1], "description": "patched again"}])
+    assert response.status_code == 200, response.text
+    assert [result["status"] for result in response.json()] == ["conflict", "ok"]
+    contacts = {result["id"]: result["contact"]
+                for result in client.get("/api/contacts/batch", params={"ids": ids}).json()}
+    assert contacts[ids[0]]["nick"] == "nick1"
+    assert contacts[ids[1]]["description"] == "patched again"
+
+    assert client.patch("/api/contacts/batch", json=[{"id": ids[0]}]).status_code == 422
+
+    response = client.patch("/api/contacts/batch/is_active_contact",
+                            json={"ids": ids[:2] + [9999], "is_active_contact": False})
+    assert [result["status"] for result in response.json()] == ["ok", "ok", "not_found"]
+    response = client.get("/api/contacts/", params={"is_active_contact": False})
+    assert [item["id"] for item in response.json()["items"]] == ids[:2]
+
+    response = client.delete("/api/contacts/batch", params={"ids": [ids[2], 9999]})
+    assert [result["status"] for result in response.json()] == ["ok", "not_found"]
+    response = client.get("/api/contacts/batch", params={"ids": [ids[2]]})
+    assert response.json()[0]["status"] == "not_found"
+
+
+def test_contacts_batch_conflict_signed_in(client, monkeypatch):
+    # Through the real get_current_user the user is loaded by the session of the request, which the rollback
+    # of a clashing batch expires.
+    revocation_list = AsyncMock()
+    revocation_list.exists.return_value = 0
+    monkeypatch.setattr(auth_service, "r", revocation_list)
+    monkeypatch.delitem(app.dependency_overrides, auth_service.get_current_user)
+    user_cache.local.clear()
+    token = asyncio.run(auth_service.create_access_token(data={"sub": "user1@example.com"}))
+    ids = [item["id"] for item in client.get("/api/contacts/", params={"limit": 2},
+                                             headers={"Authorization": f"Bearer {token}"}).json()["items"]]
+    cached = client.get(f"/api/contacts/{ids[1]}", headers={"Authorization": f"Bearer {token}"}).json()
+    user_cache.local.clear()
+
+    response = client.patch("/api/contacts/batch", headers={"Authorization": f"Bearer {token}"},
+                            json=[{"id": ids[1], "description": "signed in"}, {"id": ids[0], "nick": cached["nick"]}])
+    assert response.status_code == 200, response.text
+    assert [result["status"] for result in response.json()] == ["ok", "conflict"]
+    response = client.get(f"/api/contacts/{ids[1]}", headers={"Authorization": f"Bearer {token}"})
+    assert response.json()["description"] == "signed in"
+
+
+def test_search_contacts(client):
+    for number, (first_name, last_name) in enumerate([("Oleksandr", "Dovzhenko"), ("Olena", "Teliha"),
+                                                      ("Oleh", "Olzhych")], start=31):
+        body = contact(number)
+        body.update(first_name=first_name, last_name=last_name)
+        response = client.post("/api/contacts/", json=body)
+        assert response.status_code == 201, response.text
+
+    response = client.get("/api/contacts/search", params={"q": "ole"})
+    assert response.status_code == 200, response.text
+    assert {item["first_name"] for item in response.json()} == {"Oleksandr", "Olena", "Oleh"}
+
+    response = client.get("/api/contacts/search", params={"q": "ole olz"})
+    assert [item["last_name"] for item in response.json()] == ["Olzhych"]
+
+    response = client.get("/api/contacts/search", params={"q": "contact32@"})
+    assert [item["first_name"] for item in response.json()] == ["Olena"]
+
+    response = client.get("/api/contacts/search", params={"q": "ole", "limit": 2, "offset": 2})
+    assert len(response.json()) == 1
+
+    response = client.patch("/api/contacts/batch", json=[{"id": response.json()[0]["id"], "first_name": "Renamed"}])
+    assert response.status_code == 200, response.text
+    response = client.get("/api/contacts/search", params={"q": "ole"})
+    assert len(response.json()) == 2
+
+
+def test_contacts_are_scoped_to_user(client):
+    own_ids = [item["id"] for item in client.get("/api/contacts/", params={"limit": 500}).json()["items"]]
+    login_as(2)
+    try:
+        assert client.get("/api/contacts/").json()["items"] == []
+        assert client.get(f"/api/contacts/{own_ids[0]}").status_code == 404
+        assert client.patch(f"/api/contacts/{own_ids[0]}", json={"nick": "stolen"}).status_code == 404
+        assert client.delete(f"/api/contacts/{own_ids[0]}").status_code == 404
+        response = client.delete("/api/contacts/batch", params={"ids": own_ids[:2]})
+        assert [result["status"] for result in response.json()] == ["not_found", "not_found"]
+
+        response = client.post("/api/contacts/", json=contact(1))
+        assert response.status_code == 201, response.text
+        assert [item["nick"] for item in client.get("/api/contacts/first_name/Dmytro").json()] == ["nick1"]
+        assert [item["nick"] for item in client.get("/api/contacts/search", params={"q": "nick1"}).json()] == ["nick1"]
+        client.delete(f"/api/contacts/{response.json()['id']}")
+    finally:
+        login_as(1)
+    assert [item["id"] for item in client.get("/api/contacts/", params={"limit": 500}).json()["items"]] == own_ids
@@ -0,0 +1,43 @@
+import logging
+import unittest
+from unittest.mock import patch
+
+from src.services.access_log import AccessLog, compile_user_agent_ban
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(self.format(record))
+
+
+class TestAccessLog(unittest.TestCase):
+    def test_sampling_keeps_errors(self):
+        handler = ListHandler()
+        access_log = AccessLog(sample_rate=0.0, max_queue=10, handler=handler)
+        access_log.start()
+        access_log.log(200, path="/")
+        access_log.log(500, path="/api/healthchecker")
+        access_log.stop()
+        access_log.logger.removeHandler(access_log.handler)
+        self.assertEqual(len(handler.lines), 1)
+        self.assertIn('"status": 500', handler.lines[0])
+        self.assertIn('"path": "/api/healthchecker"', handler.lines[0])
+
+    def test_full_queue_drops_records(self):
+        access_log = AccessLog(sample_rate=1.0, max_queue=1, handler=ListHandler())
+        with patch("src.services.access_log.random.random", return_value=0.0):
+            access_log.log(200, path="/")
+            access_log.log(200, path="/")
+        access_log.logger.removeHandler(access_log.handler)
+        self.assertEqual(access_log.handler.dropped, 1)
+
+    def test_compile_user_agent_ban(self):
+        self.assertIsNone(compile_user_agent_ban([]))
+        pattern = compile_user_agent_ban(["badbot", r"curl/\d+"])
+        self.assertTrue(pattern.search("Mozilla/5.0 (compatible; BadBot/1.0)"))
+        self.assertTrue(pattern.search("curl/8.1.2"))
+        self.assertIsNone(pattern.search("Mozilla/5.0"))
@@ -0,0 +1,69 @@
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from jose import JWTError, jwt
+from pydantic import ValidationError
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from src.conf.config import Settings
+
+from src.services.auth import auth_service
+
+
+class TestAccessTokenCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.redis = AsyncMock()
+        self.redis.exists.return_value = 0
+        patcher = patch.object(auth_service, "r", self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        auth_service.verified_tokens.clear()
+        auth_service.revoked_tokens.clear()
+
+    async def test_repeated_token_is_verified_once(self):
+        token = await auth_service.create_access_token(data={"sub": "deadpool@example.com"})
+        with patch("src.services.auth.jwt.decode", wraps=jwt.decode) as decode:
+            first = await auth_service.verify_access_token(token)
+            second = await auth_service.verify_access_token(token)
+        self.assertEqual(first, second)
+        self.assertEqual(first["sub"], "deadpool@example.com")
+        decode.assert_called_once()
+        self.redis.exists.assert_awaited_once()
+
+    async def test_invalid_token_is_not_cached(self):
+        with self.assertRaises(JWTError):
+            await auth_service.verify_access_token("not-a-token")
+        self.assertEqual(len(auth_service.verified_tokens), 0)
+
+    async def test_revoked_token(self):
+        token = await auth_service.create_access_token(data={"sub": "deadpool@example.com"})
+        await auth_service.verify_access_token(token)
+        await auth_service.revoke_token(token)
+        self.redis.set.assert_awaited_once()
+        with self.assertRaises(JWTError):
+            await auth_service.verify_access_token(token)
+
+    async def test_token_revoked_by_another_worker(self):
+        token = await auth_service.create_access_token(data={"sub": "deadpool@example.com"})
+        self.redis.exists.return_value = 1
+        with self.assertRaises(JWTError):
+            await auth_service.verify_access_token(token)
+
+
+    async def test_unreachable_revocation_list(self):
+        token = await auth_service.create_access_token(data={"sub": "deadpool@example.com"})
+        self.redis.exists.side_effect = RedisConnectionError()
+        with self.assertRaises(JWTError):
+            await auth_service.verify_access_token(token)
+        self.assertEqual(len(auth_service.verified_tokens), 0)
+
+
+class TestJWTCacheSettings(unittest.TestCase):
+    def test_long_ttl_rejected(self):
+        with self.assertRaises(ValidationError):
+            Settings(jwt_cache_ttl=300)
+
+    def test_cache_needs_pubsub(self):
+        with self.assertRaises(ValidationError):
+            Settings(cache_invalidation_pubsub=False)
+        self.assertFalse(Settings(jwt_cache_ttl=0, cache_invalidation_pubsub=False).cache_invalidation_pubsub)
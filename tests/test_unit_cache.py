@@ -0,0 +1,179 @@
+import json
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from redis.exceptions import ConnectionError
+
+from src.database.models import User
+from src.services.cache import InvalidationBus, ResponseCache, TTLCache, UserCache
+
+
+class TestTTLCache(unittest.TestCase):
+    def test_get_set(self):
+        cache = TTLCache(maxsize=2, ttl=10)
+        cache.set("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+
+    def test_evicts_least_recently_used(self):
+        cache = TTLCache(maxsize=2, ttl=10)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(len(cache), 2)
+
+    def test_expires(self):
+        cache = TTLCache(maxsize=2, ttl=10)
+        with patch("src.services.cache.time.monotonic", return_value=100):
+            cache.set("a", 1)
+            cache.set("b", 2, ttl=20)
+        with patch("src.services.cache.time.monotonic", return_value=115):
+            self.assertIsNone(cache.get("a"))
+            self.assertEqual(cache.get("b"), 2)
+
+
+class TestUserCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.redis = AsyncMock()
+        self.cache = UserCache(self.redis, ttl=900, local_maxsize=10, local_ttl=30)
+        self.user = User(id=1, username="deadpool", email="deadpool@example.com", avatar="avatar", confirmed=True,
+                         password="secret")
+
+    async def test_set_stores_snapshot_with_single_command(self):
+        await self.cache.set(self.user)
+        self.redis.set.assert_awaited_once()
+        key, data = self.redis.set.call_args.args
+        self.assertEqual(key, "user:deadpool@example.com")
+        self.assertEqual(self.redis.set.call_args.kwargs, {"ex": 900, "nx": True})
+        self.assertNotIn("password", json.loads(data))
+
+    async def test_local_hit_skips_redis(self):
+        await self.cache.set(self.user)
+        user = await self.cache.get("deadpool@example.com")
+        self.redis.get.assert_not_awaited()
+        self.assertEqual(user.id, 1)
+        self.assertIsNot(user, self.user)
+
+    async def test_redis_hit_fills_local(self):
+        self.redis.get.return_value = json.dumps({"id": 1, "username": "deadpool", "email": "deadpool@example.com",
+                                                  "avatar": None, "confirmed": True})
+        user = await self.cache.get("deadpool@example.com")
+        self.assertEqual(user.username, "deadpool")
+        await self.cache.get("deadpool@example.com")
+        self.redis.get.assert_awaited_once()
+
+    async def test_redis_failure_is_a_miss(self):
+        self.redis.get.side_effect = ConnectionError()
+        self.assertIsNone(await self.cache.get("deadpool@example.com"))
+
+    async def test_invalidate(self):
+        bus = InvalidationBus(self.redis, "cache:invalidate", enabled=True)
+        cache = UserCache(self.redis, ttl=900, local_maxsize=10, local_ttl=30, bus=bus)
+        await cache.set(self.user)
+        await cache.invalidate("deadpool@example.com")
+        self.assertIsNone(cache.local.get("deadpool@example.com"))
+        self.redis.set.assert_awaited_with("user:deadpool@example.com", b"-", ex=5)
+        self.redis.publish.assert_awaited_once_with("cache:invalidate", "user:deadpool@example.com")
+
+    async def test_snapshot_read_before_invalidation_is_not_cached(self):
+        self.redis.get.return_value = b"-"
+        self.assertIsNone(await self.cache.get("deadpool@example.com"))
+        self.redis.set.return_value = None
+        await self.cache.set(self.user)
+        self.assertIsNone(self.cache.local.get("deadpool@example.com"))
+
+    async def test_set_without_redis_caches_locally(self):
+        self.redis.set.side_effect = ConnectionError()
+        await self.cache.set(self.user)
+        self.assertIsNotNone(self.cache.local.get("deadpool@example.com"))
+
+    async def test_broadcast_evicts_local_copy(self):
+        bus = InvalidationBus(self.redis, "cache:invalidate", enabled=False)
+        cache = UserCache(self.redis, ttl=900, local_maxsize=10, local_ttl=30, bus=bus)
+        await cache.set(self.user)
+        bus.dispatch("user:deadpool@example.com")
+        self.assertIsNone(cache.local.get("deadpool@example.com"))
+        self.redis.publish.assert_not_awaited()
+
+
+class TestResponseCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.redis = AsyncMock()
+        self.pipe = MagicMock()
+        self.pipe.__aenter__.return_value = self.pipe
+        self.pipe.execute = AsyncMock()
+        self.redis.pipeline = MagicMock(return_value=self.pipe)
+        self.cache = ResponseCache(self.redis, ttl=300, local_maxsize=10, local_ttl=5)
+
+    def test_key(self):
+        self.assertEqual(ResponseCache.key("/api/contacts/1", {"fields": "nick", "b": "1"}),
+                         "response:/api/contacts/1?b=1&fields=nick")
+        self.assertEqual(ResponseCache.key("/api/contacts/birthday", None, "2023-06-01"),
+                         "response:/api/contacts/birthday?:2023-06-01")
+
+    async def test_set_and_local_hit(self):
+        await self.cache.set("k", b"[]", ["contacts"], headers={"ETag": 'W/"1"'}, ttl=3600)
+        self.pipe.set.assert_called_once_with("k", b'{"headers": {"ETag": "W/\\"1\\""}, "tags": ["contacts"]}\n[]',
+                                              ex=300)
+        self.pipe.sadd.assert_called_once_with("response-tag:contacts", "k")
+        cached = await self.cache.get("k")
+        self.assertEqual(cached.body, b"[]")
+        self.redis.get.assert_not_awaited()
+        self.assertEqual(self.cache.snapshot()["local_hits"], 1)
+
+    async def test_redis_hit_fills_local(self):
+        self.redis.get.return_value = b'{"headers": {}, "tags": ["contact:1"]}\n{"id": 1}'
+        cached = await self.cache.get("k")
+        self.assertEqual(cached.body, b'{"id": 1}')
+        self.assertEqual(cached.tags, ("contact:1",))
+        await self.cache.get("k")
+        self.redis.get.assert_awaited_once()
+        self.assertEqual(self.cache.snapshot()["redis_hits"], 1)
+        self.assertEqual(self.cache.snapshot()["local_hits"], 1)
+
+    async def test_miss(self):
+        self.redis.get.side_effect = ConnectionError()
+        self.assertIsNone(await self.cache.get("k"))
+        self.assertEqual(self.cache.snapshot()["misses"], 1)
+
+    async def test_invalidate(self):
+        bus = InvalidationBus(self.redis, "cache:invalidate", enabled=True)
+        cache = ResponseCache(self.redis, ttl=300, local_maxsize=10, local_ttl=5, bus=bus)
+        await cache.set("one", b"{}", ["contact:1"])
+        await cache.set("list", b"[]", ["contacts"])
+        self.pipe.execute.return_value = [{b"one"}]
+        await cache.invalidate("contact:1")
+        self.assertIsNone(cache.local.get("one"))
+        self.assertIsNotNone(cache.local.get("list"))
+        self.redis.delete.assert_awaited_once_with(b"one", "response-tag:contact:1")
+        self.redis.publish.assert_awaited_once_with("cache:invalidate", "response:contact:1")
+
+    async def test_broadcast_evicts_local_copy(self):
+        bus = InvalidationBus(self.redis, "cache:invalidate", enabled=False)
+        cache = ResponseCache(self.redis, ttl=300, local_maxsize=10, local_ttl=5, bus=bus)
+        await cache.set("list", b"[]", ["contacts"])
+        bus.dispatch("response:contacts")
+        self.assertIsNone(cache.local.get("list"))
+
+    async def test_invalidate_many_tags(self):
+        bus = InvalidationBus(self.redis, "cache:invalidate", enabled=True)
+        cache = ResponseCache(self.redis, ttl=300, local_maxsize=10, local_ttl=5, bus=bus)
+        for number in range(1, 4):
+            await cache.set(f"contact{number}", b"{}", [f"contact:{number}"])
+        self.pipe.execute.return_value = [set(), set(), set()]
+        await cache.invalidate("contacts:1", "contact:1", "contact:2")
+        self.assertIsNone(cache.local.get("contact1"))
+        self.assertIsNone(cache.local.get("contact2"))
+        self.assertIsNotNone(cache.local.get("contact3"))
+        self.redis.publish.assert_awaited_once_with("cache:invalidate", "response:contacts:1 contact:1 contact:2")
+
+        other = ResponseCache(self.redis, ttl=300, local_maxsize=10, local_ttl=5,
+                              bus=InvalidationBus(self.redis, "cache:invalidate", enabled=False))
+        await other.set("contact2", b"{}", ["contact:2"])
+        await other.set("contact3", b"{}", ["contact:3"])
+        other.bus.dispatch("response:contacts:1 contact:1 contact:2")
+        self.assertIsNone(other.local.get("contact2"))
+        self.assertIsNotNone(other.local.get("contact3"))
@@ -1,54 +1,148 @@
 import unittest
-from unittest.mock import MagicMock
+from datetime import date
+from unittest.mock import MagicMock, patch
 
-from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.models import Contact
+from src.database.models import Contact, User
 from src.repository.contacts import (
                                 get_contacts,
+                                get_contacts_fingerprint,
                                 get_contacts_birthday,
                                 get_contact_by_id,
                                 get_contact_by_email,
                                 get_contacts_by_first_name,
                                 get_contacts_by_last_name,
+                                conflicting_field,
                                 create,
+                                create_many,
                                 update,
                                 remove,
                                 set_is_active_contact
 )
-from src.schemas import ContactModel
+from src.schemas import ContactModel, ContactActiveModel, ContactPatchModel
 
 
 class TestContacts(unittest.IsolatedAsyncioTestCase):
     def setUp(self):
-        self.session = MagicMock(spec=Session)
+        self.session = MagicMock(spec=AsyncSession)
+        self.result = MagicMock()
+        self.session.execute.return_value = self.result
+        self.user = User(id=1)
         # self.contact = Contact(id=1, email="test@test.api.com")
 
+    def executed_sql(self):
+        stmt = self.session.execute.call_args.args[0]
+        return str(stmt.compile(compile_kwargs={"literal_binds": True}))
+
     async def test_get_contacts(self):
         contacts = [Contact() for _ in range(5)]
-        self.session.query(Contact).all.return_value = contacts
-        result = await get_contacts(self.session)
+        self.result.all.return_value = contacts
+        result = await get_contacts(self.session, self.user)
+        self.assertEqual(result, contacts)
+
+    async def test_get_contacts_page(self):
+        contacts = [Contact() for _ in range(5)]
+        self.result.all.return_value = contacts
+        result = await get_contacts(self.session, self.user, limit=5, cursor=10, last_name='Oseledko')
         self.assertEqual(result, contacts)
+        sql = self.executed_sql()
+        self.assertIn("contacts.last_name = 'Oseledko'", sql)
+        self.assertIn("contacts.id > 10", sql)
+        self.assertIn("LIMIT 5", sql)
+
+    async def test_get_contacts_fields(self):
+        rows = [MagicMock() for _ in range(2)]
+        self.result.all.return_value = rows
+        result = await get_contacts(self.session, self.user, limit=2, fields=("id", "phone_number"))
+        self.assertEqual(result, rows)
+        self.assertTrue(self.executed_sql().startswith("SELECT contacts.id, contacts.phone_number \nFROM contacts"))
+
+    async def test_get_contacts_fingerprint(self):
+        fingerprint = MagicMock()
+        self.result.one.return_value = fingerprint
+        result = await get_contacts_fingerprint(self.session, self.user, limit=3, cursor=10)
+        self.assertEqual(result, fingerprint)
+        sql = self.executed_sql()
+        self.assertIn("max(anon_1.updated_at)", sql)
+        self.assertIn("sum(anon_1.version)", sql)
+        self.assertIn("SELECT contacts.id AS id, contacts.updated_at AS updated_at, contacts.version AS version", sql)
+        self.assertIn("LIMIT 3", sql)
 
     async def test_get_contacts_birthday(self):
-        ...
+        contacts = [Contact() for _ in range(2)]
+        self.result.all.return_value = contacts
+        result = await get_contacts_birthday(7, self.user, self.session, today=date(2023, 12, 28))
+        self.assertEqual(result, contacts)
+        self.assertIn("contacts.birthday_md >= 1229 OR contacts.birthday_md <= 104", self.executed_sql())
+
     async def test_get_contact_by_id(self):
-        ...
+        contact = Contact(id=1)
+        self.result.scalar_one_or_none.return_value = contact
+        result = await get_contact_by_id(1, self.user, self.session)
+        self.assertEqual(result, contact)
+
     async def test_get_contact_by_email(self):
-        ...
+        contact = Contact(email="test@test.api.com")
+        self.result.scalars().first.return_value = contact
+        result = await get_contact_by_email("Test@Test.api.com", self.user, self.session)
+        self.assertEqual(result, contact)
+        self.assertIn("lower(contacts.email) = 'test@test.api.com'", self.executed_sql())
+
     async def test_get_contacts_by_first_name(self):
-        ...
+        contacts = [Contact() for _ in range(2)]
+        self.result.all.return_value = contacts
+        result = await get_contacts_by_first_name('Dmytro', self.user, self.session)
+        self.assertEqual(result, contacts)
+
     async def test_get_contacts_by_last_name(self):
-        ...
+        contacts = [Contact() for _ in range(2)]
+        self.result.all.return_value = contacts
+        result = await get_contacts_by_last_name('Oseledko', self.user, self.session)
+        self.assertEqual(result, contacts)
+
     async def test_update(self):
-        ...
-    async def test_remove(self):
-        ...
-    async def test_set_is_active_contact(self):
-        ...
+        row = MagicMock(id=1)
+        self.result.one_or_none.return_value = row
+        body = ContactPatchModel(nick="Badrunt", birthday="02-01-1990")
+        result = await update(1, body, self.user, self.session, partial=True)
+        self.assertEqual(result, row)
+        sql = self.executed_sql()
+        self.assertTrue(sql.startswith("UPDATE contacts SET birthday='02-01-1990', birthday_md=102, nick='Badrunt', "
+                                       "updated_at=now(), version=version + 1 WHERE contacts.id = 1 AND contacts.user_id = 1 RETURNING"), sql)
+        self.session.execute.assert_awaited_once()
+        self.session.commit.assert_awaited_once()
+
+    async def test_update_all_fields(self):
+        await update(1, ContactModel(email="test@test.api.com"), self.user, self.session)
+        self.assertIn("first_name='Dmytro', last_name='Oseledko', email='test@test.api.com'", self.executed_sql())
 
+    async def test_update_not_found(self):
+        self.result.one_or_none.return_value = None
+        result = await update(1, ContactPatchModel(nick="Badrunt"), self.user, self.session, partial=True)
+        self.assertIsNone(result)
 
+    async def test_remove(self):
+        contact = Contact(id=1)
+        self.result.scalar_one_or_none.return_value = contact
+        result = await remove(1, self.user, self.session)
+        self.assertEqual(result, contact)
+        self.session.delete.assert_awaited_once_with(contact)
+        self.session.commit.assert_awaited_once()
 
+    async def test_remove_not_found(self):
+        self.result.scalar_one_or_none.return_value = None
+        result = await remove(1, self.user, self.session)
+        self.assertIsNone(result)
+        self.session.commit.assert_not_awaited()
+
+    async def test_set_is_active_contact(self):
+        contact = Contact(id=1, is_active_contact=True)
+        self.result.scalar_one_or_none.return_value = contact
+        result = await set_is_active_contact(1, ContactActiveModel(is_active_contact=False), self.user, self.session)
+        self.assertFalse(result.is_active_contact)
+        self.session.commit.assert_awaited_once()
 
     async def test_create(self):
         body = ContactModel(
@@ -69,6 +163,33 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
             # owner_id=self.owner.id
         )
 
-        result = await create(body, self.session)
+        row = MagicMock(id=1, nick=body.nick)
+        self.result.one.return_value = row
+        result = await create(body, self.user, self.session)
         self.assertEqual(result.nick, body.nick)
         self.assertTrue(hasattr(result, 'id'))
+        self.assertTrue(self.executed_sql().startswith("INSERT INTO contacts"))
+        self.assertIn("RETURNING id, first_name", self.executed_sql())
+        self.session.commit.assert_awaited_once()
+
+    async def test_create_upsert(self):
+        self.result.one.return_value = MagicMock(id=1)
+        await create(ContactModel(email="test@test.api.com"), self.user, self.session, upsert=True)
+        self.assertIn("ON CONFLICT (user_id, lower(email)) DO UPDATE SET first_name = excluded.first_name", self.executed_sql())
+
+    async def test_create_conflict(self):
+        self.session.execute.side_effect = IntegrityError(
+            "INSERT", {}, Exception("UNIQUE constraint failed: contacts.phone_number"))
+        with self.assertRaises(IntegrityError) as raised:
+            await create(ContactModel(email="test@test.api.com"), self.user, self.session)
+        self.session.rollback.assert_awaited_once()
+        self.assertEqual(conflicting_field(raised.exception), "phone_number")
+
+    async def test_create_many_batches(self):
+        self.result.scalars.side_effect = [["c0@example.com", "c1@example.com"], ["c3@example.com"], []]
+        bodies = [ContactModel(email=f"c{number}@example.com") for number in range(5)]
+        with patch("src.repository.contacts.INSERT_BATCH_SIZE", 2):
+            emails = await create_many(bodies, self.user, self.session)
+        self.assertEqual(emails, ["c0@example.com", "c1@example.com", "c3@example.com"])
+        self.assertEqual(self.session.execute.await_count, 3)
+        self.session.commit.assert_awaited_once()
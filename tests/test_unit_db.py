@@ -0,0 +1,27 @@
+import unittest
+from unittest.mock import patch
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+import src.database.db  # noqa: F401, registers the query timer
+
+
+class TestQueryTimer(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine("sqlite://")
+        self.addCleanup(self.engine.dispose)
+
+    def test_statement_is_timed(self):
+        with patch("src.database.db.add_timing") as add_timing, self.engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        add_timing.assert_called_once()
+        self.assertEqual(add_timing.call_args.args[0], "db")
+
+    def test_failed_statement_is_timed_once(self):
+        with patch("src.database.db.add_timing") as add_timing, self.engine.connect() as conn:
+            for _ in range(3):
+                with self.assertRaises(OperationalError):
+                    conn.execute(text("SELECT * FROM missing"))
+            self.assertNotIn("query_start", conn.info)
+        self.assertEqual(add_timing.call_count, 3)
@@ -0,0 +1,186 @@
+import socket
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from aiosmtpd.controller import Controller
+from aiosmtplib import SMTPResponseException, SMTPServerDisconnected
+
+from src.services.email import EmailJob, EmailQueue, EmailSender, SMTPPool
+from src.services.mail_templates import mail_templates
+from src.services.email_worker import EmailWorker
+
+
+class Inbox:
+    def __init__(self):
+        self.messages = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope)
+        return "250 OK"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def confirmation(number: int = 1) -> EmailJob:
+    return EmailJob(f"job{number}", "email_template.html", f"user{number}@example.com", "Confirm your email!",
+                    {"host": "http://testserver/", "username": f"user{number}", "token": "token"})
+
+
+class TestEmailSender(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.inbox = Inbox()
+        self.smtpd = Controller(self.inbox, hostname="127.0.0.1", port=free_port())
+        self.smtpd.start()
+        self.pool = SMTPPool("127.0.0.1", self.smtpd.port, None, None, use_tls=False, start_tls=False,
+                             validate_certs=False, size=2)
+        self.sender = EmailSender(self.pool, "noreply@example.com", "Cat System Corporation", mail_templates)
+
+    async def asyncTearDown(self):
+        await self.pool.close()
+
+    def tearDown(self):
+        self.smtpd.stop()
+
+    async def test_send_reuses_connection(self):
+        for number in range(5):
+            await self.sender.send(confirmation(number))
+        self.assertEqual(len(self.inbox.messages), 5)
+        self.assertEqual(self.pool.opened, 1)
+        envelope = self.inbox.messages[0]
+        self.assertEqual(envelope.mail_from, "noreply@example.com")
+        self.assertEqual(envelope.rcpt_tos, ["user0@example.com"])
+        self.assertIn(b"http://testserver/api/auth/confirmed_email/token", envelope.content)
+
+    async def test_send_reconnects(self):
+        await self.sender.send(confirmation(1))
+        self.pool._idle[0].close()
+        await self.sender.send(confirmation(2))
+        self.assertEqual(len(self.inbox.messages), 2)
+        self.assertEqual(self.pool.opened, 2)
+
+    def test_build_escapes_context(self):
+        job = confirmation()._replace(context={"host": "", "username": "<b>user</b>", "token": "token"})
+        body = self.sender.build(job).get_content()
+        self.assertIn("&lt;b&gt;user&lt;/b&gt;", body)
+
+
+class TestEmailQueue(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.redis = AsyncMock()
+        self.pipe = MagicMock()
+        self.pipe.__aenter__.return_value = self.pipe
+        self.pipe.execute = AsyncMock()
+        self.redis.pipeline = MagicMock(return_value=self.pipe)
+        self.promote_script = AsyncMock(return_value=2)
+        self.redis.register_script = MagicMock(return_value=self.promote_script)
+        self.queue = EmailQueue(self.redis, "email", dedupe_ttl=300)
+
+    async def test_enqueue(self):
+        self.assertTrue(await self.queue.enqueue("email_template.html", "user@example.com", "Hi", {"a": 1}))
+        payload = self.redis.lpush.call_args.args[1]
+        self.assertEqual(self.redis.lpush.call_args.args[0], "email:queue")
+        job = EmailJob.from_payload(payload)
+        self.assertEqual(job.recipient, "user@example.com")
+        self.assertEqual(job.payload(), payload)
+        self.redis.set.assert_not_awaited()
+
+    async def test_enqueue_dedupe(self):
+        self.redis.set.return_value = None
+        self.assertFalse(await self.queue.enqueue("email_template.html", "user@example.com", "Hi", {},
+                                                  dedupe="confirm:user@example.com"))
+        self.redis.set.assert_awaited_once_with("email:dedupe:confirm:user@example.com", 1, nx=True, ex=300)
+        self.redis.lpush.assert_not_awaited()
+
+    async def test_reserve(self):
+        self.redis.blmove.return_value = confirmation().payload().encode()
+        self.assertEqual(await self.queue.reserve("w1", 1), confirmation())
+        self.redis.blmove.assert_awaited_once_with("email:queue", "email:processing:w1", 1, "RIGHT", "LEFT")
+
+    async def test_reserve_unreadable(self):
+        for payload in (b"not json", b'{"unknown": 1}'):
+            self.redis.blmove.return_value = payload
+            self.assertIsNone(await self.queue.reserve("w1", 1))
+            self.pipe.lrem.assert_called_with("email:processing:w1", 1, payload)
+            self.pipe.lpush.assert_called_with("email:dead", payload)
+
+    async def test_retry(self):
+        await self.queue.retry("w1", confirmation(), due=1000)
+        self.pipe.lrem.assert_called_once_with("email:processing:w1", 1, confirmation().payload())
+        self.pipe.zadd.assert_called_once_with("email:delayed", {confirmation()._replace(attempts=1).payload(): 1000})
+
+    async def test_promote_due(self):
+        self.assertEqual(await self.queue.promote_due(1000), 2)
+        self.promote_script.assert_awaited_once_with(keys=["email:delayed", "email:queue"], args=[1000, 100])
+
+    async def test_requeue_stalled(self):
+        self.redis.lmove.side_effect = [b"job1", b"job2", None]
+        self.assertEqual(await self.queue.requeue_stalled("w1"), 2)
+        self.redis.lmove.assert_awaited_with("email:processing:w1", "email:queue", "RIGHT", "RIGHT")
+
+
+class TestEmailWorker(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.queue = AsyncMock(spec=EmailQueue)
+        self.sender = AsyncMock(spec=EmailSender)
+        self.worker = EmailWorker(self.queue, self.sender, "w1", concurrency=1, max_attempts=3, backoff=30,
+                                  backoff_max=100)
+
+    def test_delay(self):
+        self.assertEqual([self.worker.delay(attempts) for attempts in (1, 2, 3, 4)], [30, 60, 100, 100])
+
+    async def test_handle_sent(self):
+        await self.worker.handle(confirmation())
+        self.queue.ack.assert_awaited_once_with("w1", confirmation())
+
+    async def test_handle_temporary_error(self):
+        self.sender.send.side_effect = SMTPServerDisconnected("gone")
+        with patch("src.services.email_worker.time.time", return_value=1000):
+            await self.worker.handle(confirmation()._replace(attempts=1))
+        self.queue.retry.assert_awaited_once_with("w1", confirmation()._replace(attempts=1), 1060)
+        self.queue.ack.assert_not_awaited()
+
+    async def test_handle_last_attempt(self):
+        self.sender.send.side_effect = ConnectionRefusedError()
+        await self.worker.handle(confirmation()._replace(attempts=2))
+        self.queue.bury.assert_awaited_once()
+        self.queue.retry.assert_not_awaited()
+
+    async def test_handle_permanent_error(self):
+        self.sender.send.side_effect = SMTPResponseException(550, "No such user")
+        await self.worker.handle(confirmation())
+        self.queue.bury.assert_awaited_once_with("w1", confirmation())
+
+    async def test_handle_unexpected_error(self):
+        self.sender.send.side_effect = KeyError("token")
+        await self.worker.handle(confirmation())
+        self.queue.bury.assert_awaited_once_with("w1", confirmation())
+        self.queue.ack.assert_not_awaited()
+
+    async def test_consume_survives_unexpected_error(self):
+        self.queue.reserve.side_effect = [ValueError("bad"), confirmation(1)] + [None] * 100
+
+        async def stop(job):
+            self.worker.stop()
+
+        self.sender.send.side_effect = stop
+        self.worker.poll_timeout = 0.01
+        await self.worker.consume()
+        self.queue.ack.assert_awaited_once_with("w1", confirmation(1))
+
+    async def test_run_until_stopped(self):
+        self.queue.requeue_stalled.return_value = 0
+        self.queue.reserve.side_effect = [confirmation(1), None, confirmation(2)] + [None] * 100
+
+        async def stop_after_second(job):
+            if job == confirmation(2):
+                self.worker.stop()
+
+        self.sender.send.side_effect = stop_after_second
+        self.worker.poll_timeout = 0.01
+        await self.worker.run()
+        self.queue.requeue_stalled.assert_awaited_once_with("w1")
+        self.assertEqual(self.queue.ack.await_count, 2)
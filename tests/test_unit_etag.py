@@ -0,0 +1,50 @@
+import unittest
+from datetime import datetime
+from unittest.mock import MagicMock
+
+from src.services.etag import etag_matches, is_not_modified, make_etag, validators
+
+
+def request(**headers):
+    mock = MagicMock()
+    mock.headers = {key.replace("_", "-"): value for key, value in headers.items()}
+    return mock
+
+
+class TestEtag(unittest.TestCase):
+    def setUp(self):
+        self.updated_at = datetime(2023, 6, 1, 12, 30, 15, 250000)
+        self.tag = make_etag("contact", 1, self.updated_at)
+
+    def test_make_etag(self):
+        self.assertEqual(self.tag, make_etag("contact", 1, self.updated_at))
+        self.assertNotEqual(self.tag, make_etag("contact", 1, datetime(2023, 6, 1, 12, 30, 16)))
+        self.assertTrue(self.tag.startswith('W/"'))
+
+    def test_etag_matches(self):
+        self.assertTrue(etag_matches(self.tag, self.tag))
+        self.assertTrue(etag_matches(f'"other", {self.tag[2:]}', self.tag))
+        self.assertTrue(etag_matches("*", self.tag))
+        self.assertFalse(etag_matches('W/"other"', self.tag))
+
+    def test_validators(self):
+        headers = validators(self.tag, self.updated_at)
+        self.assertEqual(headers["ETag"], self.tag)
+        self.assertEqual(headers["Last-Modified"], "Thu, 01 Jun 2023 12:30:15 GMT")
+        self.assertNotIn("Last-Modified", validators(self.tag, None))
+
+    def test_is_not_modified(self):
+        headers = validators(self.tag, self.updated_at)
+        self.assertFalse(is_not_modified(request(), headers))
+        self.assertTrue(is_not_modified(request(if_none_match=self.tag), headers))
+        self.assertTrue(is_not_modified(request(if_modified_since="Thu, 01 Jun 2023 12:30:15 GMT"), headers))
+        self.assertFalse(is_not_modified(request(if_modified_since="Thu, 01 Jun 2023 12:30:14 GMT"), headers))
+        self.assertFalse(is_not_modified(request(if_none_match='"other"',
+                                                 if_modified_since="Thu, 01 Jun 2023 12:30:15 GMT"), headers))
+        self.assertFalse(is_not_modified(request(if_modified_since="yesterday"), headers))
+        self.assertFalse(is_not_modified(request(if_modified_since="Thu, 01 Jun 2023 12:30:15 GMT"),
+                                         validators(self.tag, None)))
+
+
+if __name__ == '__main__':
+    unittest.main()
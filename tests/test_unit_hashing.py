@@ -0,0 +1,37 @@
+import asyncio
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+from src.services.hashing import PasswordHasher
+
+
+class TestPasswordHasher(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        self.hasher = PasswordHasher(self.executor, max_concurrency=1, max_waiting=1)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    async def test_hash_and_verify(self):
+        hashed = await self.hasher.hash("12345678")
+        self.assertTrue(await self.hasher.verify("12345678", hashed))
+        self.assertFalse(await self.hasher.verify("password", hashed))
+        self.assertEqual(self.hasher.snapshot()["completed"], 3)
+
+    async def test_concurrency_limit_and_rejection(self):
+        first = asyncio.create_task(self.hasher._run(time.sleep, 0.2))
+        second = asyncio.create_task(self.hasher._run(time.sleep, 0.01))
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.hasher.in_flight, 1)
+        self.assertEqual(self.hasher.waiting, 1)
+        with self.assertRaises(HTTPException) as cm:
+            await self.hasher._run(time.sleep, 0.01)
+        self.assertEqual(cm.exception.status_code, 503)
+        await asyncio.gather(first, second)
+        snapshot = self.hasher.snapshot()
+        self.assertEqual((snapshot["completed"], snapshot["rejected"], snapshot["waiting"]), (2, 1, 0))
+        self.assertGreater(snapshot["wait_seconds_max"], 0.1)
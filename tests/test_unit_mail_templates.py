@@ -0,0 +1,42 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from jinja2 import TemplateNotFound
+
+from src.services.mail_templates import TEMPLATE_FOLDER, MailTemplates, confirmation_context
+
+
+class TestMailTemplates(unittest.TestCase):
+    def setUp(self):
+        self.templates = MailTemplates(TEMPLATE_FOLDER)
+
+    def test_preload(self):
+        self.assertIn("email_template.html", self.templates.preload())
+        with patch.object(self.templates.env, "get_template") as get_template:
+            self.templates.render("email_template.html", confirmation_context("user", "http://testserver/", "t"))
+        get_template.assert_not_called()
+
+    def test_render(self):
+        body = self.templates.render("email_template.html", confirmation_context("<b>user</b>", "http://h/", "t"))
+        self.assertIn("Hi &lt;b&gt;user&lt;/b&gt;,", body)
+        self.assertIn('href="http://h/api/auth/confirmed_email/t"', body)
+
+    def test_render_many(self):
+        contexts = [confirmation_context(f"user{number}", "http://h/", f"t{number}") for number in range(3)]
+        bodies = self.templates.render_many("email_template.html", contexts)
+        self.assertEqual(bodies, [self.templates.render("email_template.html", context) for context in contexts])
+
+    def test_unknown_template(self):
+        with self.assertRaises(TemplateNotFound):
+            self.templates.render("missing.html", {})
+
+    def test_bytecode_cache(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            MailTemplates(TEMPLATE_FOLDER, cache_dir).preload()
+            self.assertTrue(list(Path(cache_dir).iterdir()))
+            templates = MailTemplates(TEMPLATE_FOLDER, cache_dir)
+            with patch.object(templates.env, "compile") as compile_template:
+                templates.preload()
+            compile_template.assert_not_called()